@@ -203,7 +203,7 @@ def analyze_readability_batch(df: pd.DataFrame, update_only: bool = False) -> pd
         text = texts_to_process[i]
         
         if not text or pd.isna(text):
-            logger.debug(f"Параграф с индексом {original_idx} пуст или NaN, пропуск расчета читаемости.")
+            logger.debug("Параграф с индексом %s пуст или NaN, пропуск расчета читаемости.", original_idx)
             continue
         
         current_lix = np.nan
@@ -232,7 +232,7 @@ def analyze_readability_batch(df: pd.DataFrame, update_only: bool = False) -> pd
         smog_values.loc[original_idx] = round(current_smog, 3) if not pd.isna(current_smog) else np.nan
         complexity_values.loc[original_idx] = round(current_complexity, 3) if not pd.isna(current_complexity) else np.nan
         
-        logger.debug(f"Параграф (индекс {original_idx}): LIX={lix_values.loc[original_idx]}, SMOG={smog_values.loc[original_idx]}, Complexity={complexity_values.loc[original_idx]}")
+        logger.debug("Параграф (индекс %s): LIX=%s, SMOG=%s, Complexity=%s", original_idx, lix_values.loc[original_idx], smog_values.loc[original_idx], complexity_values.loc[original_idx])
 
     # Обновляем/добавляем колонки в result_df
     result_df['lix'] = lix_values
@@ -6,11 +6,18 @@ import logging
 import re
 import pandas as pd # type: ignore
 import asyncio # Для асинхронного вызова API
-from typing import Dict, List, Any, Optional
+import random
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional, Tuple
 
 # Импортируем OpenAIService для проверки типа и доступа к клиенту
 # и сам класс OpenAI для проверки типов исключений
 from services.openai_service import OpenAIService
+from utils.lru_cache import BoundedLRUCache
+from utils.text_processing import text_fingerprint
+from utils.token_estimator import categorize_text, token_estimator
+from utils.rate_limiter import AsyncTokenBucket, TokenLimiter, concurrency_controller
 import openai # Для openai.APIConnectionError и т.д.
 
 logger = logging.getLogger(__name__)
@@ -49,6 +56,22 @@ API_TOPIC_LABELS = [
 ]
 API_TOPIC_PLACEHOLDER = "<ТЕМА>"
 
+# Кэш результатов анализа одного чанка: (отпечаток full_text, текст чанка, тема) -> результат.
+# Отпечаток документа считается один раз на запрос (см. utils.text_processing.text_fingerprint).
+CHUNK_RESULT_CACHE_SIZE = 1024
+_chunk_result_cache: "BoundedLRUCache[Tuple[str, str, str], dict]" = BoundedLRUCache(CHUNK_RESULT_CACHE_SIZE)
+
+# Повторы временных ошибок OpenAI: экспоненциальная пауза с полным джиттером,
+# чтобы одновременно упавшие запросы не возвращались к API одной волной.
+# Retry-After (или x-ratelimit-reset-* для 429) из ответа имеет приоритет, но не больше RETRY_MAX_DELAY.
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRY_AFTER_JITTER = 0.5 # Разброс поверх Retry-After, чтобы повторы не совпадали
+_RATELIMIT_RESET_HEADERS = ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+_RESET_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_RESET_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
 # -----------------------------------------------------------------------------
 # Вспомогательные функции
 # -----------------------------------------------------------------------------
@@ -165,12 +188,15 @@ async def analyze_semantic_function_batch(
     df: pd.DataFrame, 
     topic_prompt: str, 
     openai_service: OpenAIService, 
-    single_paragraph: bool = False
+    single_paragraph: bool = False,
+    rate_limiter: Optional[AsyncTokenBucket] = None,
+    token_limiter: Optional[TokenLimiter] = None
 ) -> pd.DataFrame:
     """
     Анализирует семантическую функцию параграфов с использованием OpenAI API.
     Если API недоступен, возвращает DataFrame с соответствующими пометками.
     Обрабатывает ограничения API по токенам, разбивая на чанки при необходимости.
+    Лимитеры запросов и токенов в минуту списываются на каждый вызов API (см. _create_chat_completion_with_retry).
     """
     logger.info(f"[SemanticAPI] Запуск семантического анализа. Параграфов: {len(df)}, Тема: '{topic_prompt[:30]}...', Single: {single_paragraph}")
 
@@ -255,12 +281,10 @@ async def analyze_semantic_function_batch(
             api_call_params_for_chunk["model"] = openai_service.default_model
             api_call_params_for_chunk["max_tokens"] = max_tokens_for_api_response
             
-            loop = asyncio.get_running_loop()
-            api_response = await loop.run_in_executor(
-                None, 
-                lambda: openai_service.client.chat.completions.create( # type: ignore
-                    messages=messages_for_api, **api_call_params_for_chunk
-                )
+            api_response = await _create_chat_completion_with_retry(
+                openai_service, messages_for_api,
+                rate_limiter=rate_limiter, token_limiter=token_limiter,
+                **api_call_params_for_chunk
             )
             
             if not api_response.choices or not api_response.choices[0].message or not api_response.choices[0].message.content:
@@ -270,7 +294,7 @@ async def analyze_semantic_function_batch(
                 continue
             
             api_response_text = api_response.choices[0].message.content
-            logger.debug(f"{chunk_log_prefix} Получен ответ от API (длина {len(api_response_text)}). Парсинг...")
+            logger.debug("%s Получен ответ от API (длина %s). Парсинг...", chunk_log_prefix, len(api_response_text))
             
             parsed_labels_list = _parse_gpt_response(api_response_text, num_paragraphs_in_chunk)
             
@@ -314,11 +338,109 @@ async def analyze_semantic_function_batch(
 
 # ===== НОВЫЕ ФУНКЦИИ ДЛЯ АРХИТЕКТУРЫ ЧАНКОВ =====
 
+def _is_retryable_error(error: Exception) -> bool:
+    """Временные ошибки: сеть/таймаут, 429 и 5xx. Классификация идемпотентна, повтор безопасен."""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _parse_reset_duration(value: str) -> Optional[float]:
+    """Разбирает длительность из x-ratelimit-reset-* OpenAI (например '1s', '6m0s', '20ms') в секунды."""
+    parts = _RESET_DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _RESET_DURATION_UNITS[unit] for amount, unit in parts)
+
+def _server_retry_after(error: Exception) -> Optional[float]:
+    """Пауза, которую сервер просит выдержать: Retry-After, а для 429 без него - x-ratelimit-reset-*."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass # Формат HTTP-date не разбираем
+    if isinstance(error, openai.RateLimitError):
+        resets = [
+            _parse_reset_duration(response.headers[header])
+            for header in _RATELIMIT_RESET_HEADERS if response.headers.get(header)
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            return max(resets)
+    return None
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Пауза перед повтором: полный джиттер, но не меньше паузы, запрошенной сервером."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    server_delay = _server_retry_after(error)
+    if server_delay is not None:
+        delay = max(delay, min(server_delay + random.uniform(0, RETRY_AFTER_JITTER), RETRY_MAX_DELAY))
+    return delay
+
+async def _create_chat_completion_with_retry(
+    openai_service: OpenAIService,
+    messages: List[Dict[str, str]],
+    rate_limiter: Optional[AsyncTokenBucket] = None,
+    token_limiter: Optional[TokenLimiter] = None,
+    **params
+):
+    """
+    Вызывает chat.completions.create в пуле потоков с ограниченным числом повторов.
+    Встроенные повторы клиента отключены (max_retries=0), чтобы попытки не перемножались.
+    Перед каждой попыткой списывает запрос из rate_limiter и оценку токенов из token_limiter;
+    после ответа корректирует token_limiter на разницу с фактическим usage.total_tokens.
+    На 429 лимитеры уводятся в долг (penalize), чтобы выровняться с состоянием на сервере.
+    """
+    client = openai_service.client.with_options(max_retries=0) # type: ignore
+    loop = asyncio.get_running_loop()
+    prompt_text = "".join(message["content"] for message in messages)
+    prompt_category = categorize_text(prompt_text)
+    estimated_tokens = token_estimator.estimate(prompt_text, prompt_category, max_output_tokens=params.get("max_tokens", 0))
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        try:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            if token_limiter is not None:
+                await token_limiter.acquire(estimated_tokens)
+            request_started = time.monotonic()
+            response = await loop.run_in_executor(
+                None,
+                lambda: client.chat.completions.create(messages=messages, **params)
+            )
+            concurrency_controller.on_success()
+            usage = getattr(response, "usage", None)
+            if usage is not None and usage.prompt_tokens:
+                # Калибруем оценку байт на токен по фактическому расходу (см. utils.token_estimator)
+                token_estimator.update(prompt_category, len(prompt_text.encode("utf-8")), usage.prompt_tokens)
+                if token_limiter is not None:
+                    token_limiter.force_add_usage(usage.total_tokens - estimated_tokens)
+            return response
+        except Exception as e:
+            if isinstance(e, openai.RateLimitError):
+                concurrency_controller.on_rate_limited(request_started)
+                # Сервер считает, что лимит исчерпан: локальные корзины не должны пропускать запросы
+                for limiter in (rate_limiter, token_limiter):
+                    if limiter is not None:
+                        limiter.penalize()
+            if attempt == RETRY_MAX_ATTEMPTS - 1 or not _is_retryable_error(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(
+                "[OpenAI] Временная ошибка (%s), повтор %d/%d через %.2fс",
+                type(e).__name__, attempt + 1, RETRY_MAX_ATTEMPTS - 1, delay
+            )
+            await asyncio.sleep(delay)
+
 async def analyze_single_chunk_semantic(
     chunk_text: str,
     full_text: str,
     topic: str,
-    openai_service: OpenAIService
+    openai_service: OpenAIService,
+    rate_limiter: Optional[AsyncTokenBucket] = None,
+    token_limiter: Optional[TokenLimiter] = None
 ) -> dict:
     """
     Анализирует семантическую функцию одного чанка в контексте всего документа.
@@ -328,6 +450,8 @@ async def analyze_single_chunk_semantic(
         full_text: Полный текст документа для контекста
         topic: Тема документа
         openai_service: Сервис OpenAI для API вызовов
+        rate_limiter: Лимитер запросов в минуту
+        token_limiter: Лимитер токенов в минуту
     
     Returns:
         dict: Результат анализа {"semantic_function": str, "semantic_method": str, "semantic_error": str?}
@@ -356,6 +480,12 @@ async def analyze_single_chunk_semantic(
         default_result["semantic_error"] = "Empty full text"
         return default_result
     
+    cache_key = (text_fingerprint(full_text), chunk_text, topic)
+    cached_result = _chunk_result_cache.get(cache_key)
+    if cached_result is not None:
+        logger.debug("[ChunkSemanticAPI] Результат найден в кэше")
+        return dict(cached_result)
+    
     try:
         # Создаем промпт для анализа одного чанка
         prompt_messages = _create_single_chunk_prompt(chunk_text, full_text, topic)
@@ -365,13 +495,11 @@ async def analyze_single_chunk_semantic(
         api_call_params["model"] = openai_service.default_model
         api_call_params["max_tokens"] = 100  # Достаточно для одной роли
         
-        # Выполняем запрос к OpenAI API
-        loop = asyncio.get_running_loop()
-        api_response = await loop.run_in_executor(
-            None,
-            lambda: openai_service.client.chat.completions.create(
-                messages=prompt_messages, **api_call_params
-            )
+        # Выполняем запрос к OpenAI API (с повторами временных ошибок)
+        api_response = await _create_chat_completion_with_retry(
+            openai_service, prompt_messages,
+            rate_limiter=rate_limiter, token_limiter=token_limiter,
+            **api_call_params
         )
         
         if not api_response.choices or not api_response.choices[0].message or not api_response.choices[0].message.content:
@@ -380,7 +508,7 @@ async def analyze_single_chunk_semantic(
             return default_result
         
         api_response_text = api_response.choices[0].message.content.strip()
-        logger.debug(f"[ChunkSemanticAPI] Получен ответ от API: '{api_response_text}'")
+        logger.debug("[ChunkSemanticAPI] Получен ответ от API: '%s'", api_response_text)
         
         # Парсим ответ API
         semantic_function = _parse_single_chunk_response(api_response_text)
@@ -392,6 +520,8 @@ async def analyze_single_chunk_semantic(
         }
         
         logger.info(f"[ChunkSemanticAPI] Анализ завершен успешно: '{semantic_function}'")
+        if result["semantic_error"] is None:
+            _chunk_result_cache.put(cache_key, dict(result))
         return result
         
     except openai.APIConnectionError as e:
@@ -542,7 +672,7 @@ def _parse_single_chunk_response(response_text: str) -> str:
             valid_labels = valid_labels[:2]
             
         result = " / ".join(valid_labels)
-        logger.debug(f"[ChunkSemanticParser] Успешно распознано: '{result}'")
+        logger.debug("[ChunkSemanticParser] Успешно распознано: '%s'", result)
         return result
     else:
         logger.warning(f"[ChunkSemanticParser] Не удалось распознать роль в ответе: '{response_text}'")
@@ -553,7 +683,10 @@ async def analyze_batch_chunks_semantic(
     full_text: str,
     topic: str,
     openai_service: OpenAIService,
-    max_parallel: int = 1
+    max_parallel: int = 1,
+    global_semaphore: Optional[asyncio.Semaphore] = None,
+    rate_limiter: Optional[AsyncTokenBucket] = None,
+    token_limiter: Optional[TokenLimiter] = None
 ) -> List[dict]:
     """
     Анализирует семантические функции пакета чанков с контролем параллельности.
@@ -563,12 +696,19 @@ async def analyze_batch_chunks_semantic(
         full_text: Полный текст документа для контекста
         topic: Тема документа
         openai_service: Сервис OpenAI для API вызовов
-        max_parallel: Максимальное количество параллельных запросов
+        max_parallel: Максимальное количество параллельных запросов (верхняя граница;
+            фактическую параллельность подстраивает concurrency_controller по ответам 429)
+        global_semaphore: Общий на процесс семафор вызовов OpenAI (bulkhead)
+        rate_limiter: Лимитер запросов в минуту (кредит на каждый вызов API)
+        token_limiter: Лимитер токенов в минуту (списывается оценка, затем фактический расход)
     
     Returns:
         List[dict]: Список результатов [{"chunk_id": int, "metrics": {...}}, ...]
     """
-    logger.info(f"[ChunkSemanticBatch] Пакетный анализ {len(chunks)} чанков (параллельность: {max_parallel})")
+    logger.info(
+        "[ChunkSemanticBatch] Пакетный анализ %d чанков (параллельность: до %d, адаптивный лимит %d)",
+        len(chunks), max_parallel, concurrency_controller.limit
+    )
     
     if not chunks:
         logger.warning("[ChunkSemanticBatch] Пустой список чанков")
@@ -594,7 +734,7 @@ async def analyze_batch_chunks_semantic(
     
     async def analyze_single_with_semaphore(chunk: Dict[str, Any]) -> dict:
         """Анализирует один чанк с семафором для контроля параллельности."""
-        async with semaphore:
+        async with semaphore, concurrency_controller, (global_semaphore or nullcontext()):
             chunk_id = chunk.get("id", 0)
             chunk_text = chunk.get("text", "")
             
@@ -604,7 +744,9 @@ async def analyze_batch_chunks_semantic(
                     chunk_text=chunk_text,
                     full_text=full_text,
                     topic=topic,
-                    openai_service=openai_service
+                    openai_service=openai_service,
+                    rate_limiter=rate_limiter,
+                    token_limiter=token_limiter
                 )
                 
                 return {
@@ -5,7 +5,8 @@
 
 import asyncio
 import logging
-from typing import Dict, List, Any, Optional, Set
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional, Set, AsyncIterator, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
@@ -14,6 +15,8 @@ import time
 from .semantic_function import analyze_batch_chunks_semantic
 from .semantic_function_realtime import SemanticRealtimeAnalyzer, RealtimeSessionConfig
 from services.openai_service import OpenAIService
+from utils.rate_limiter import AsyncTokenBucket, TokenLimiter
+from utils.token_estimator import token_estimator
 
 logger = logging.getLogger(__name__)
 
@@ -24,40 +27,79 @@ class APIMethod(Enum):
     REST = "rest"
 
 
+class BreakerState(Enum):
+    """Состояния circuit breaker"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
 @dataclass
-class FailureTracker:
-    """Отслеживание ошибок для адаптивного переключения"""
+class CircuitBreaker:
+    """
+    Circuit breaker перед Realtime API.
+    После failure_threshold ошибок подряд размыкается: чанки сразу идут в REST
+    без ожидания таймаута Realtime. Через open_timeout пропускает один пробный
+    запрос (half-open): успех замыкает цепь, ошибка снова размыкает.
+    """
+    failure_threshold: int = 5
+    open_timeout: timedelta = field(default_factory=lambda: timedelta(seconds=30))
+    state: BreakerState = BreakerState.CLOSED
+    failure_count: int = 0  # Ошибок подряд в замкнутом состоянии
     realtime_failures: int = 0
     realtime_successes: int = 0
     last_failure_time: Optional[datetime] = None
-    failure_threshold: int = 3
-    recovery_timeout: timedelta = field(default_factory=lambda: timedelta(minutes=5))
-    
+    _probe_in_flight: bool = False
+
+    def _cooldown_passed(self) -> bool:
+        return self.last_failure_time is None or datetime.now() - self.last_failure_time >= self.open_timeout
+
+    @property
+    def is_available(self) -> bool:
+        """Можно ли сейчас рассчитывать на Realtime API (без побочных эффектов)"""
+        if self.state == BreakerState.OPEN:
+            return self._cooldown_passed()
+        return True
+
+    def allow(self) -> bool:
+        """Разрешить вызов Realtime API; в half-open пропускает только один пробный запрос"""
+        if self.state == BreakerState.CLOSED:
+            return True
+        if self.state == BreakerState.OPEN:
+            if not self._cooldown_passed():
+                return False
+            self.state = BreakerState.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
     def record_failure(self):
         """Записать ошибку Realtime API"""
         self.realtime_failures += 1
         self.last_failure_time = datetime.now()
-        
+        self._probe_in_flight = False
+        if self.state == BreakerState.HALF_OPEN:
+            self.state = BreakerState.OPEN
+            return
+        self.failure_count += 1
+        if self.failure_count >= self.failure_threshold:
+            self.state = BreakerState.OPEN
+
     def record_success(self):
         """Записать успешный вызов Realtime API"""
         self.realtime_successes += 1
-        # Сбрасываем счетчик ошибок после серии успехов
-        if self.realtime_successes > 5:
-            self.realtime_failures = max(0, self.realtime_failures - 1)
-            
-    def should_use_realtime(self) -> bool:
-        """Определить, стоит ли использовать Realtime API"""
-        # Если слишком много ошибок
-        if self.realtime_failures >= self.failure_threshold:
-            # Проверяем, прошло ли время восстановления
-            if self.last_failure_time:
-                if datetime.now() - self.last_failure_time > self.recovery_timeout:
-                    # Даем еще один шанс
-                    self.realtime_failures = 0
-                    self.realtime_successes = 0
-                    return True
-            return False
-        return True
+        self.failure_count = 0
+        self._probe_in_flight = False
+        self.state = BreakerState.CLOSED
+
+    def release_probe(self):
+        """
+        Освободить слот пробного запроса, если вызов завершился без record_success/record_failure
+        (например, отменен). Иначе half-open навсегда перестал бы пропускать запросы.
+        """
+        self._probe_in_flight = False
 
 
 class HybridSemanticAnalyzer:
@@ -77,9 +119,12 @@ class HybridSemanticAnalyzer:
         self.prefer_realtime = prefer_realtime
         self.openai_service = OpenAIService(api_key=api_key)
         self.realtime_analyzer: Optional[SemanticRealtimeAnalyzer] = None
-        self.failure_tracker = FailureTracker()
+        self.circuit_breaker = CircuitBreaker()
         self._realtime_session_active = False
         self._current_topic: Optional[str] = None
+        # Анализатор общий на воркер, а разговор Realtime один: тема задается инструкциями сессии
+        # и параллельный ответ в том же разговоре недопустим, поэтому вызовы Realtime идут по одному
+        self._realtime_lock = asyncio.Lock()
         
     async def _ensure_realtime_session(self, topic: str) -> bool:
         """Убедиться, что сессия Realtime API активна"""
@@ -111,6 +156,24 @@ class HybridSemanticAnalyzer:
             self._realtime_session_active = False
             return False
     
+    @staticmethod
+    def _estimate_tokens(chunk_text: str) -> int:
+        """Оценка токенов запроса: откалиброванные байты на токен для текста плюс промпт."""
+        return token_estimator.estimate(chunk_text, overhead_tokens=500)
+
+    async def _throttle(
+        self,
+        chunk_texts: List[str],
+        rate_limiter: Optional[AsyncTokenBucket],
+        token_limiter: Optional[TokenLimiter]
+    ) -> None:
+        """Списывает кредиты лимитеров (по одному запросу на чанк) перед вызовом API."""
+        for chunk_text in chunk_texts:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            if token_limiter is not None:
+                await token_limiter.acquire(self._estimate_tokens(chunk_text))
+
     def _should_fallback(self, error: Exception) -> bool:
         """Определить, нужно ли переключиться на REST API"""
         error_str = str(error)
@@ -121,7 +184,10 @@ class HybridSemanticAnalyzer:
         chunk_id: str,
         chunk_text: str,
         topic: str,
-        force_method: Optional[APIMethod] = None
+        force_method: Optional[APIMethod] = None,
+        rate_limiter: Optional[AsyncTokenBucket] = None,
+        token_limiter: Optional[TokenLimiter] = None,
+        global_semaphore: Optional[asyncio.Semaphore] = None
     ) -> Dict[str, Any]:
         """
         Анализировать один чанк с автоматическим fallback.
@@ -131,6 +197,9 @@ class HybridSemanticAnalyzer:
             chunk_text: Текст чанка
             topic: Тема для анализа
             force_method: Принудительно использовать указанный метод
+            rate_limiter: Лимитер запросов в минуту (кредит на каждый вызов API)
+            token_limiter: Лимитер токенов в минуту
+            global_semaphore: Общий на процесс семафор вызовов OpenAI (bulkhead)
             
         Returns:
             Результат анализа с информацией об использованном методе
@@ -138,57 +207,68 @@ class HybridSemanticAnalyzer:
         start_time = time.time()
         
         # Определяем метод
+        # Разомкнутый breaker отправляет чанк сразу в REST, даже при force_method=REALTIME
         if force_method:
-            use_realtime = force_method == APIMethod.REALTIME
+            use_realtime = force_method == APIMethod.REALTIME and self.circuit_breaker.allow()
         else:
-            use_realtime = self.prefer_realtime and self.failure_tracker.should_use_realtime()
+            use_realtime = self.prefer_realtime and self.circuit_breaker.allow()
+        # allow() в half-open пропускает единственный пробный запрос - это он
+        is_probe = use_realtime and self.circuit_breaker.state == BreakerState.HALF_OPEN
         
         if use_realtime:
-            logger.info(f"[Hybrid] 🚀 Чанк {chunk_id}: пробуем Realtime API")
+            logger.info("[Hybrid] 🚀 Чанк %s: пробуем Realtime API", chunk_id)
             try:
-                # Пробуем Realtime API
-                if not self._realtime_session_active:
-                    await self._ensure_realtime_session(topic)
-                
-                if self.realtime_analyzer:
-                    result = await self.realtime_analyzer.analyze_chunk(
-                        chunk_id, chunk_text
-                    )
-                    self.failure_tracker.record_success()
-                    result["api_method"] = APIMethod.REALTIME.value
-                    result["api_latency"] = time.time() - start_time
-                    logger.info(f"[Hybrid] ✅ Чанк {chunk_id}: Realtime успешно за {result['api_latency']:.2f}с")
-                    return result
-                else:
-                    raise Exception("Realtime analyzer not initialized")
+                # Пробуем Realtime API: сессия проверяется на каждый чанк, так как тема могла смениться
+                async with self._realtime_lock:
+                    if not await self._ensure_realtime_session(topic) or self.realtime_analyzer is None:
+                        raise Exception("Session not initialized")
+                    await self._throttle([chunk_text], rate_limiter, token_limiter)
+                    async with (global_semaphore or nullcontext()):
+                        result = await self.realtime_analyzer.analyze_chunk(
+                            chunk_id, chunk_text
+                        )
+                self.circuit_breaker.record_success()
+                result["api_method"] = APIMethod.REALTIME.value
+                result["api_latency"] = time.time() - start_time
+                logger.info("[Hybrid] ✅ Чанк %s: Realtime успешно за %.2fс", chunk_id, result["api_latency"])
+                return result
                 
             except Exception as e:
-                self.failure_tracker.record_failure()
+                self.circuit_breaker.record_failure()
                 logger.warning(f"[Hybrid] ⚠️ Чанк {chunk_id}: Realtime ошибка: {str(e)[:100]}, переключаемся на REST")
                 
-                # Проверяем, не пора ли отключить Realtime
-                if self.failure_tracker.realtime_failures >= 3:
-                    logger.warning(f"[Hybrid] ❌ Realtime API временно отключен после {self.failure_tracker.realtime_failures} ошибок")
-                    self._realtime_session_active = False
-                    if self.realtime_analyzer:
-                        await self.realtime_analyzer.close()
+                # Breaker разомкнулся - закрываем сессию Realtime до пробного запроса
+                if self.circuit_breaker.state == BreakerState.OPEN:
+                    logger.warning(f"[Hybrid] ❌ Realtime API временно отключен (circuit breaker open) после {self.circuit_breaker.realtime_failures} ошибок")
+                    async with self._realtime_lock:
+                        self._realtime_session_active = False
+                        if self.realtime_analyzer:
+                            await self.realtime_analyzer.close()
+            finally:
+                # CancelledError не ловится except Exception выше: пробный слот освобождается здесь
+                if is_probe:
+                    self.circuit_breaker.release_probe()
         else:
-            logger.info(f"[Hybrid] 📡 Чанк {chunk_id}: используем REST API (Realtime {'недоступен' if not self.failure_tracker.should_use_realtime() else 'не предпочтителен'})")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"[Hybrid] 📡 Чанк {chunk_id}: используем REST API (Realtime {'недоступен' if not self.circuit_breaker.is_available else 'не предпочтителен'})")
         
         # Fallback на REST API
         try:
-            logger.debug(f"Используем REST API для чанка {chunk_id}")
+            logger.debug("Используем REST API для чанка %s", chunk_id)
             
             # Подготавливаем данные для REST API
             chunks = [{"id": chunk_id, "text": chunk_text}]
             
-            # Вызываем REST API
+            # Вызываем REST API; лимитеры списываются на каждый фактический вызов
             results = await analyze_batch_chunks_semantic(
                 chunks=chunks,
                 full_text=chunk_text,  # Для одного чанка используем его же как контекст
                 topic=topic,
                 openai_service=self.openai_service,
-                max_parallel=1
+                max_parallel=1,
+                global_semaphore=global_semaphore,
+                rate_limiter=rate_limiter,
+                token_limiter=token_limiter
             )
             
             if results and len(results) > 0:
@@ -216,29 +296,35 @@ class HybridSemanticAnalyzer:
                 "api_latency": time.time() - start_time
             }
     
-    async def analyze_batch(
+    async def analyze_batch_iter(
         self,
         chunks: List[Dict[str, str]],
         topic: str,
         max_concurrent: int = 5,
-        adaptive_batching: bool = True
-    ) -> List[Dict[str, Any]]:
+        adaptive_batching: bool = True,
+        rate_limiter: Optional[AsyncTokenBucket] = None,
+        token_limiter: Optional[TokenLimiter] = None,
+        global_semaphore: Optional[asyncio.Semaphore] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Анализировать пакет чанков с адаптивной стратегией.
+        Анализировать пакет чанков с адаптивной стратегией, отдавая результаты по мере готовности.
         
         Args:
             chunks: Список чанков для анализа
             topic: Тема для анализа  
             max_concurrent: Максимальное количество параллельных запросов
             adaptive_batching: Использовать адаптивную стратегию батчинга
+            rate_limiter: Лимитер запросов в минуту
+            token_limiter: Лимитер токенов в минуту
+            global_semaphore: Общий на процесс семафор вызовов OpenAI (bulkhead)
             
-        Returns:
-            Список результатов анализа
+        Yields:
+            Результат анализа каждого чанка (в порядке чанков)
         """
         logger.info(f"[HybridBatch] 🎯 Начинаем анализ {len(chunks)} чанков. Adaptive={adaptive_batching}, MaxConcurrent={max_concurrent}")
-        results = []
+        method_counts = {APIMethod.REALTIME.value: 0, APIMethod.REST.value: 0, "failed": 0}
         
-        if adaptive_batching and len(chunks) > 10 and self.failure_tracker.should_use_realtime():
+        if adaptive_batching and len(chunks) > 10 and self.circuit_breaker.is_available:
             # Для больших объемов используем гибридный подход:
             # Первые несколько чанков через Realtime для быстрого старта
             # Остальные через REST API для надежности
@@ -257,9 +343,13 @@ class HybridSemanticAnalyzer:
                     chunk_id=chunk["id"],
                     chunk_text=chunk["text"],
                     topic=topic,
-                    force_method=APIMethod.REALTIME
+                    force_method=APIMethod.REALTIME,
+                    rate_limiter=rate_limiter,
+                    token_limiter=token_limiter,
+                    global_semaphore=global_semaphore
                 )
-                results.append(result)
+                method_counts[result.get("api_method")] = method_counts.get(result.get("api_method"), 0) + 1
+                yield result
                 
                 # Пауза между запросами Realtime API
                 if len(realtime_chunks) > 1:
@@ -272,62 +362,104 @@ class HybridSemanticAnalyzer:
                     full_text="\n\n".join([c["text"] for c in chunks]),
                     topic=topic,
                     openai_service=self.openai_service,
-                    max_parallel=max_concurrent
+                    max_parallel=max_concurrent,
+                    global_semaphore=global_semaphore,
+                    rate_limiter=rate_limiter,
+                    token_limiter=token_limiter
                 )
                 
                 # Преобразуем результаты в единый формат
                 for chunk, result in zip(rest_chunks, rest_results):
                     metrics = result.get("metrics", {})
-                    results.append({
+                    method_counts[APIMethod.REST.value] += 1
+                    yield {
                         "chunk_id": chunk["id"],
                         "semantic_function": metrics.get("semantic_function"),
                         "semantic_method": metrics.get("semantic_method"),
                         "semantic_error": metrics.get("semantic_error"),
                         "api_method": APIMethod.REST.value,
                         "api_latency": 0
-                    })
+                    }
         else:
             # Для малых объемов или при отключенном Realtime используем выбранный метод
             for chunk in chunks:
                 result = await self.analyze_chunk(
                     chunk_id=chunk["id"],
                     chunk_text=chunk["text"],
-                    topic=topic
+                    topic=topic,
+                    rate_limiter=rate_limiter,
+                    token_limiter=token_limiter,
+                    global_semaphore=global_semaphore
                 )
-                results.append(result)
+                method_counts[result.get("api_method")] = method_counts.get(result.get("api_method"), 0) + 1
+                yield result
                 
                 # Пауза только для Realtime API
                 if result.get("api_method") == APIMethod.REALTIME.value and len(chunks) > 1:
                     await asyncio.sleep(0.5)
         
         # Статистика
-        realtime_count = sum(1 for r in results if r.get("api_method") == APIMethod.REALTIME.value)
-        rest_count = sum(1 for r in results if r.get("api_method") == APIMethod.REST.value)
-        failed_count = sum(1 for r in results if r.get("api_method") == "failed")
-        
         logger.info(
             f"Обработано {len(chunks)} чанков: "
-            f"{realtime_count} через Realtime, {rest_count} через REST, {failed_count} ошибок"
+            f"{method_counts[APIMethod.REALTIME.value]} через Realtime, "
+            f"{method_counts[APIMethod.REST.value]} через REST, {method_counts['failed']} ошибок"
         )
+    
+    async def analyze_batch(
+        self,
+        chunks: List[Dict[str, str]],
+        topic: str,
+        max_concurrent: int = 5,
+        adaptive_batching: bool = True,
+        rate_limiter: Optional[AsyncTokenBucket] = None,
+        token_limiter: Optional[TokenLimiter] = None,
+        global_semaphore: Optional[asyncio.Semaphore] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Анализировать пакет чанков с адаптивной стратегией.
+        Собирает все результаты analyze_batch_iter в список.
         
-        return results
+        Returns:
+            Список результатов анализа
+        """
+        return [
+            result async for result in self.analyze_batch_iter(
+                chunks,
+                topic,
+                max_concurrent=max_concurrent,
+                adaptive_batching=adaptive_batching,
+                rate_limiter=rate_limiter,
+                token_limiter=token_limiter,
+                global_semaphore=global_semaphore
+            )
+        ]
+    
+    def stats_snapshot(self) -> Tuple[int, int, bool]:
+        """
+        Дешевый синхронный снимок счетчиков Realtime: (успехи, ошибки, доступен ли).
+        Для логов в горячем пути вместо await get_statistics().
+        """
+        breaker = self.circuit_breaker
+        return breaker.realtime_successes, breaker.realtime_failures, breaker.is_available
     
     async def get_statistics(self) -> Dict[str, Any]:
         """Получить статистику использования API"""
         return {
-            "realtime_available": self.failure_tracker.should_use_realtime(),
-            "realtime_failures": self.failure_tracker.realtime_failures,
-            "realtime_successes": self.failure_tracker.realtime_successes,
-            "last_failure": self.failure_tracker.last_failure_time.isoformat() if self.failure_tracker.last_failure_time else None,
+            "realtime_available": self.circuit_breaker.is_available,
+            "realtime_failures": self.circuit_breaker.realtime_failures,
+            "realtime_successes": self.circuit_breaker.realtime_successes,
+            "last_failure": self.circuit_breaker.last_failure_time.isoformat() if self.circuit_breaker.last_failure_time else None,
+            "breaker_state": self.circuit_breaker.state.value,
             "session_active": self._realtime_session_active,
             "current_topic": self._current_topic
         }
     
     async def close(self):
         """Закрыть соединения"""
-        if self.realtime_analyzer:
-            await self.realtime_analyzer.close()
-            self._realtime_session_active = False
+        async with self._realtime_lock:
+            if self.realtime_analyzer:
+                await self.realtime_analyzer.close()
+                self._realtime_session_active = False
 
 
 # Функция для простой интеграции
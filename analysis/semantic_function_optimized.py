@@ -7,6 +7,7 @@ import asyncio
 import json
 from typing import List, Dict, Any, Tuple
 import logging
+import httpx
 from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
@@ -19,7 +20,13 @@ class OptimizedSemanticAnalyzer:
     """
     
     def __init__(self, api_key: str, model: str = "gpt-4o"):
-        self.client = AsyncOpenAI(api_key=api_key)
+        # Долгоживущий пул keep-alive соединений: анализатор переиспользуется между запросами
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=180)
+            )
+        )
         self.model = model
         
         # Определения семантических функций
@@ -55,6 +62,10 @@ class OptimizedSemanticAnalyzer:
             "философское размышление": "Глубокие мысли о жизни, бытии",
             "шум": "Малозначимый, нерелевантный фрагмент"
         }
+        
+        # Списки функций для промптов не меняются - сериализуем один раз
+        self._functions_json = json.dumps(self.semantic_functions, ensure_ascii=False, indent=2)
+        self._function_names_json = json.dumps(list(self.semantic_functions.keys()), ensure_ascii=False, indent=2)
     
     async def analyze_batch_optimized(
         self,
@@ -140,7 +151,7 @@ class OptimizedSemanticAnalyzer:
 {chr(10).join(ranges_description)}
 
 ДОСТУПНЫЕ СЕМАНТИЧЕСКИЕ ФУНКЦИИ:
-{json.dumps(self.semantic_functions, ensure_ascii=False, indent=2)}
+{self._functions_json}
 
 ИНСТРУКЦИИ:
 1. Для каждого диапазона определи ОДНУ основную семантическую функцию
@@ -246,7 +257,7 @@ class OptimizedSemanticAnalyzer:
 {chunk_text}
 
 ДОСТУПНЫЕ ФУНКЦИИ:
-{json.dumps(list(self.semantic_functions.keys()), ensure_ascii=False, indent=2)}
+{self._function_names_json}
 
 Выбери ОДНУ наиболее подходящую функцию. Если фрагмент может выполнять несколько функций, можешь указать максимум ДВЕ через " / ".
 
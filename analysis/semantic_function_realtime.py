@@ -156,7 +156,7 @@ class SemanticRealtimeAnalyzer:
         
         await self.websocket.send(json.dumps(response_request))
         
-        logger.debug(f"[RealtimeAPI] Отправлен запрос для чанка {chunk_id}")
+        logger.debug("[RealtimeAPI] Отправлен запрос для чанка %s", chunk_id)
         
         try:
             # Ждем ответа (с таймаутом)
@@ -206,7 +206,7 @@ class SemanticRealtimeAnalyzer:
                 data = json.loads(message)
                 event_type = data.get("type", "")
                 
-                logger.debug(f"[RealtimeAPI] Получено событие: {event_type}")
+                logger.debug("[RealtimeAPI] Получено событие: %s", event_type)
                 
                 if event_type == "error":
                     # Обработка ошибок
@@ -1,15 +1,18 @@
-from sentence_transformers import SentenceTransformer, util
-import torch
 import numpy as np
 import logging
+import os
 import pandas as pd
-import hashlib
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import time
-from collections import OrderedDict
 from typing import List, Optional, Dict, Union
 
+from services.embedding_service import LRUCache, inference_mode
+from utils.text_processing import cache_key
+
+# torch и sentence_transformers импортируются лениво внутри методов EmbeddingService,
+# чтобы импорт модуля (через api.routes) не тянул их до загрузки модели
+
 # Настройка логирования - будем использовать существующую конфигурацию из main.py
 # logging.basicConfig(
 #     level=logging.INFO,
@@ -22,6 +25,9 @@ class EmbeddingService:
     Сервис для управления эмбеддингами текста с поддержкой кэширования.
     Инкапсулирует модель и кэш, предоставляя методы для анализа текста.
     """
+
+    # Ключ кэшей эмбеддингов: функция хеширования меняется в одном месте (utils.text_processing)
+    _key = staticmethod(cache_key)
     
     def __init__(self, model_name: str = 'ai-forever/sbert_large_nlu_ru', 
                  cache_size: int = 1000, 
@@ -34,6 +40,7 @@ class EmbeddingService:
             cache_size: Максимальный размер LRU-кэша для эмбеддингов
             device: Устройство для вычислений ('cuda', 'cpu' или None для автоопределения)
         """
+        import torch
         self.model_name = model_name
         self.cache_size = cache_size
         
@@ -43,49 +50,23 @@ class EmbeddingService:
         
         # Инициализируем кэши
         self.topic_cache = {}  # Простой кэш для эмбеддингов тем (обычно немного)
-        self.paragraph_cache = self._create_lru_cache(cache_size)
+        self.paragraph_cache = LRUCache(cache_size)
         
         # Загружаем модель
         self.model = self._initialize_model()
         
-    def _create_lru_cache(self, capacity: int):
-        """Создает LRU-кэш с заданной емкостью."""
-        class LRUCache:
-            def __init__(self, capacity):
-                self.cache = OrderedDict()
-                self.capacity = capacity
-                
-            def get(self, key):
-                if key not in self.cache:
-                    return None
-                self.cache.move_to_end(key)
-                return self.cache[key]
-                
-            def put(self, key, value):
-                if key in self.cache:
-                    self.cache.move_to_end(key)
-                self.cache[key] = value
-                if len(self.cache) > self.capacity:
-                    self.cache.popitem(last=False)
-                    
-            def clear(self):
-                self.cache.clear()
-                
-            def __len__(self):
-                return len(self.cache)
-                
-            def __contains__(self, key):
-                return key in self.cache
-                
-        return LRUCache(capacity)
-        
     def _initialize_model(self):
         """Инициализирует модель SentenceTransformer."""
+        from sentence_transformers import SentenceTransformer
         try:
             if self.device == 'cuda':
                 self._optimize_cuda_settings()
                 
             model = SentenceTransformer(self.model_name, device=self.device)
+            if self.device == 'cuda':
+                import torch
+                # Инференс в BF16/FP16: вдвое меньше байт на веса и эмбеддинги в кэше
+                model = model.to(torch.bfloat16) if torch.cuda.is_bf16_supported() else model.half()
             logging.info(f"Модель Signal Strength \'{self.model_name}\' загружена на {self.device}.") # Сообщение соответствует старому
             return model
         except Exception as e:
@@ -94,6 +75,9 @@ class EmbeddingService:
             
     def _optimize_cuda_settings(self):
         """Оптимизирует настройки CUDA для лучшей производительности."""
+        # До первого обращения к CUDA (empty_cache ниже): снижает фрагментацию аллокатора
+        os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:128")
+        import torch
         if torch.cuda.is_available():
             logging.info("Оптимизация настроек CUDA...")
             torch.backends.cudnn.benchmark = True
@@ -104,6 +88,10 @@ class EmbeddingService:
             if hasattr(torch.backends, 'cuda'):
                 if hasattr(torch.backends.cuda, 'matmul'):
                     torch.backends.cuda.matmul.allow_tf32 = True
+            try:
+                torch.set_float32_matmul_precision('high') # TF32 для nn.Linear на Ampere+
+            except AttributeError:
+                pass
             # Добавим логирование информации о GPU, если нужно
             try:
                 device_name = torch.cuda.get_device_name(0)
@@ -114,6 +102,7 @@ class EmbeddingService:
             except Exception as e:
                 logging.warning(f"Не удалось получить информацию о GPU: {e}")
                     
+    @inference_mode
     def get_topic_embedding(self, topic_text: str):
         """
         Возвращает эмбеддинг для заданной темы, используя кэширование.
@@ -129,10 +118,10 @@ class EmbeddingService:
              raise RuntimeError("Модель Signal Strength не инициализирована")
              
         # Хэшируем тему для использования в качестве ключа кэша
-        topic_hash = hashlib.md5(topic_text.encode()).hexdigest()
+        topic_hash = self._key(topic_text)
         
         if topic_hash in self.topic_cache:
-            logging.debug(f"Эмбеддинг темы '{topic_text[:50]}...' найден в кэше.")
+            logging.debug("Эмбеддинг темы '%s...' найден в кэше.", topic_text[:50])
             return self.topic_cache[topic_hash]
             
         logging.info(f"Вычисление эмбеддинга для темы: '{topic_text[:50]}...' (кэширование)")
@@ -154,6 +143,7 @@ class EmbeddingService:
             
         return embedding
         
+    @inference_mode
     def get_paragraph_embedding(self, text: str):
         """
         Возвращает эмбеддинг абзаца, используя кэширование.
@@ -169,22 +159,22 @@ class EmbeddingService:
              raise RuntimeError("Модель Signal Strength не инициализирована")
              
         # Хэшируем текст для использования в качестве ключа кэша
-        text_hash = hashlib.md5(text.encode()).hexdigest()
+        text_hash = self._key(text)
         
         # Проверяем наличие в кэше
         cached_embedding = self.paragraph_cache.get(text_hash)
         if cached_embedding is not None:
-            logging.debug(f"Эмбеддинг для абзаца (hash: {text_hash}) найден в кэше.")
+            logging.debug("Эмбеддинг для абзаца (hash: %s) найден в кэше.", text_hash)
             return cached_embedding
             
         # Вычисляем новый эмбеддинг
-        logging.debug(f"Вычисление эмбеддинга для абзаца (hash: {text_hash}, text: '{text[:50]}...').")
+        logging.debug("Вычисление эмбеддинга для абзаца (hash: %s, text: '%s...').", text_hash, text[:50])
         passage_input = [text]  # Убрали префикс "passage:"
         embedding = self.model.encode(passage_input, convert_to_tensor=True)
         
         # Сохраняем в кэш
         self.paragraph_cache.put(text_hash, embedding)
-        logging.debug(f"Эмбеддинг для абзаца (hash: {text_hash}) сохранен в кэш (размер кэша: {len(self.paragraph_cache)}).")
+        logging.debug("Эмбеддинг для абзаца (hash: %s) сохранен в кэш (размер кэша: %s).", text_hash, len(self.paragraph_cache))
 
         
         return embedding
@@ -195,6 +185,7 @@ class EmbeddingService:
         self.topic_cache.clear()
         logging.info("Кэши эмбеддингов (темы и абзацы) очищены.")
         
+    @inference_mode
     def analyze_signal_strength_batch(self, df: pd.DataFrame, topic_prompt: str, 
                                     batch_size: int = 32) -> pd.DataFrame:
         """
@@ -209,6 +200,7 @@ class EmbeddingService:
         Returns:
             pd.DataFrame: DataFrame с добавленной колонкой 'signal_strength'
         """
+        from sentence_transformers import util
         if not self.model: # Проверяем, загружена ли модель
              logging.error("Модель Signal Strength не загружена. Расчет сигнальности невозможен.")
              df['signal_strength'] = pd.NA
@@ -236,7 +228,7 @@ class EmbeddingService:
         
         try:
             # Получаем эмбеддинг темы (из кэша или вычисляем)
-            topic_embedding = self.get_topic_embedding(topic_prompt)
+            topic_embedding = self.get_topic_embedding(topic_prompt).float() # Сходство в float32 даже для half-модели
             
             # Определяем оптимальный размер батча
             if self.device == 'cuda':
@@ -268,12 +260,12 @@ class EmbeddingService:
                 
                 for j, text in enumerate(batch_texts):
                     global_index = i + j
-                    text_hash = hashlib.md5(text.encode()).hexdigest()
+                    text_hash = self._key(text)
                     cached_embedding = self.paragraph_cache.get(text_hash)
                     
                     if cached_embedding is not None:
                         # Если эмбеддинг в кэше, сразу рассчитываем сходство
-                        score = util.cos_sim(topic_embedding, cached_embedding)[0][0].item()
+                        score = util.cos_sim(topic_embedding, cached_embedding.float())[0][0].item()
                         results_signal[global_index] = round(score, 3)
                         cache_hits += 1
                     else:
@@ -287,11 +279,11 @@ class EmbeddingService:
                     batch_inputs = [text for text in batch_texts_to_calc]
                     
                     # Вычисляем эмбеддинги для текущего батча
-                    logging.debug(f"Батч {current_batch_num}/{num_batches}: вычисление эмбеддингов для {len(batch_texts_to_calc)} абзацев...")
+                    logging.debug("Батч %s/%s: вычисление эмбеддингов для %s абзацев...", current_batch_num, num_batches, len(batch_texts_to_calc))
                     batch_embeddings = self.model.encode(batch_inputs, convert_to_tensor=True, show_progress_bar=False) # Убираем прогресс-бар для батчей
                     
                     # Рассчитываем косинусное сходство для текущего батча
-                    batch_scores = util.cos_sim(topic_embedding, batch_embeddings)[0].cpu().tolist()
+                    batch_scores = util.cos_sim(topic_embedding, batch_embeddings.float())[0].cpu().tolist()
                     
                     # Записываем результаты и кэшируем эмбеддинги
                     for idx, (j, text) in enumerate(zip(batch_indices_to_calc, batch_texts_to_calc)):
@@ -299,14 +291,14 @@ class EmbeddingService:
                         results_signal[global_index] = round(batch_scores[idx], 3)
                         
                         # Кэшируем эмбеддинг
-                        text_hash = hashlib.md5(text.encode()).hexdigest()
+                        text_hash = self._key(text)
                         # Сохраняем эмбеддинг нужной размерности (1, dim)
                         self.paragraph_cache.put(text_hash, batch_embeddings[idx].unsqueeze(0)) 
-                        logging.debug(f"Эмбеддинг для абзаца (hash: {text_hash}) сохранен в кэш (размер кэша: {len(self.paragraph_cache)}).")
+                        logging.debug("Эмбеддинг для абзаца (hash: %s) сохранен в кэш (размер кэша: %s).", text_hash, len(self.paragraph_cache))
 
                 processed_count += len(batch_texts)
                 batch_end_time = time.time()
-                logging.debug(f"Батч {current_batch_num}/{num_batches} обработан за {batch_end_time - batch_start_time:.2f} сек. (Обработано: {processed_count}/{num_paragraphs})")
+                logging.debug("Батч %s/%s обработан за %.2f сек. (Обработано: %s/%s)", current_batch_num, num_batches, batch_end_time - batch_start_time, processed_count, num_paragraphs)
 
             # После успешного завершения всех операций применяем результаты к DataFrame
             df['signal_strength'] = results_signal
@@ -320,6 +312,7 @@ class EmbeddingService:
             df['signal_strength'] = np.nan # Заполняем всю колонку NaN
             return df
             
+    @inference_mode
     def analyze_signal_strength_incremental(self, df: pd.DataFrame, topic_prompt: str, 
                                           changed_indices: List[int] = None) -> pd.DataFrame:
         """
@@ -334,6 +327,7 @@ class EmbeddingService:
         Returns:
             pd.DataFrame: DataFrame с обновленной колонкой 'signal_strength'
         """
+        from sentence_transformers import util
         if not self.model: # Проверяем, загружена ли модель
              logging.error("Модель Signal Strength не загружена. Инкрементальный расчет невозможен.")
              # Не меняем df в этом случае, т.к. ошибка инициализации
@@ -363,7 +357,7 @@ class EmbeddingService:
             
         try:
             # Получаем эмбеддинг темы (из кэша или новый)
-            topic_embedding = self.get_topic_embedding(topic_prompt)
+            topic_embedding = self.get_topic_embedding(topic_prompt).float() # Сходство в float32 даже для half-модели
             
             start_time = time.time()
             updated_count = 0
@@ -382,7 +376,7 @@ class EmbeddingService:
                     passage_embedding = self.get_paragraph_embedding(text) 
                     
                     # Рассчитываем косинусное сходство для одного абзаца
-                    score = util.cos_sim(topic_embedding, passage_embedding)[0][0].item()
+                    score = util.cos_sim(topic_embedding, passage_embedding.float())[0][0].item()
                     df.at[idx, 'signal_strength'] = round(score, 3)
                     updated_count += 1
                 except Exception as inner_e:
@@ -625,7 +619,7 @@ def analyze_single_chunk_local_metrics(
             # ВАЖНО: Инвалидируем кэш для этого текста перед анализом
             # Это гарантирует, что будет вычислен новый эмбеддинг
             embedding_service.invalidate_paragraph_cache([chunk_text])
-            logging.debug(f"[ChunkLocalMetrics] Кэш инвалидирован для текста длиной {len(chunk_text)}")
+            logging.debug("[ChunkLocalMetrics] Кэш инвалидирован для текста длиной %s", len(chunk_text))
             
             # Создаем временный DataFrame для использования существующих функций
             temp_df = pd.DataFrame({'text': [chunk_text]})
@@ -703,7 +697,7 @@ def analyze_batch_chunks_local_metrics(
         valid_texts = [text for text in chunk_texts if text.strip()]
         if valid_texts and embedding_service:
             embedding_service.invalidate_paragraph_cache(valid_texts)
-            logging.debug(f"[ChunkLocalMetricsBatch] Кэш инвалидирован для {len(valid_texts)} текстов")
+            logging.debug("[ChunkLocalMetricsBatch] Кэш инвалидирован для %s текстов", len(valid_texts))
         
         temp_df = pd.DataFrame({
             'text': chunk_texts,
@@ -715,11 +709,12 @@ def analyze_batch_chunks_local_metrics(
         if embedding_service and topic.strip():
             try:
                 temp_df = embedding_service.analyze_signal_strength_batch(temp_df, topic, batch_size=32)
-                for idx, row in temp_df.iterrows():
-                    chunk_id = row['chunk_id']
-                    signal_value = row.get('signal_strength')
-                    if not pd.isna(signal_value):
-                        signal_results[chunk_id] = signal_value
+                if 'signal_strength' in temp_df.columns:
+                    # Без построения Series на строку: колонка float64, NaN отсекается сравнением x == x
+                    signal_values = temp_df['signal_strength'].to_numpy(dtype=np.float64, na_value=np.nan).tolist()
+                    for chunk_id, signal_value in zip(temp_df['chunk_id'].tolist(), signal_values):
+                        if signal_value == signal_value:
+                            signal_results[chunk_id] = signal_value
             except Exception as e:
                 logging.error(f"[ChunkLocalMetricsBatch] Ошибка пакетного анализа signal_strength: {e}")
         
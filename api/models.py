@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Any
+from typing_extensions import TypedDict # pydantic v2 требует typing_extensions.TypedDict на Python < 3.12
 
 # Задаем текст и тему по умолчанию для удобства тестирования
 DEFAULT_TEST_TEXT = ("Эмбеддинги это числовые представления слов. Они очень важны для машинного обучения. Модели лучше понимают смысл.\n\n" 
@@ -108,9 +109,17 @@ class ChunkSemanticRequest(BaseModel):
     topic: str = Field(..., description="Тема документа")
     session_id: Optional[str] = Field(None, description="ID сессии для логирования")
 
+class ChunkItem(TypedDict):
+    """
+    Чанк в пакетном запросе. Ключи проверяются при валидации запроса (422 при отсутствии),
+    а сам чанк остается обычным dict, который принимают функции модуля analysis.
+    """
+    id: str
+    text: str
+
 class BatchChunkSemanticRequest(BaseModel):
     """Модель запроса для пакетного семантического анализа чанков."""
-    chunks: List[Dict[str, str]] = Field(..., description="Список чанков: [{'id': str, 'text': str}, ...]")
+    chunks: List[ChunkItem] = Field(..., description="Список чанков: [{'id': str, 'text': str}, ...]")
     full_text: str = Field(..., description="Полный текст документа для контекста")
     topic: str = Field(..., description="Тема документа")
     session_id: Optional[str] = Field(None, description="ID сессии для логирования")
@@ -10,6 +10,7 @@ import re
 from fastapi import HTTPException # <--- Добавляем импорт HTTPException
 
 from utils.text_processing import split_into_paragraphs # <--- Перемещаем импорт сюда
+from utils.rate_limiter import openai_rpm_limiter, openai_tpm_limiter
 
 # Импортируем адаптированные модули анализа
 from analysis import readability
@@ -65,7 +66,8 @@ class AnalysisOrchestrator:
         logger.debug("Запуск _run_semantic_function_async...")
         # df будет скопирован перед вызовом этой функции
         result_df = await semantic_function.analyze_semantic_function_batch(
-            df, topic, self.openai_service
+            df, topic, self.openai_service,
+            rate_limiter=openai_rpm_limiter, token_limiter=openai_tpm_limiter
         )
         logger.debug("_run_semantic_function_async завершен.")
         return result_df
@@ -112,7 +114,7 @@ class AnalysisOrchestrator:
                 # Если модуль упал, соответствующие колонки не будут добавлены или останутся пустыми/NA,
                 # что должно корректно обрабатываться в _format_analysis_result
             elif isinstance(result_or_exc, pd.DataFrame):
-                logger.debug(f"Получены результаты от модуля {module_name}. Колонки: {result_or_exc.columns.tolist()}")
+                logger.debug("Получены результаты от модуля %s. Колонки: %s", module_name, result_or_exc.columns.tolist())
                 # Объединяем, используя paragraph_id как ключ, если он есть и совпадает.
                 # Более простой подход - просто скопировать колонки с метриками, предполагая, что порядок строк сохранен.
                 # Убедимся, что result_or_exc имеет те же индексы, что и final_df (или base_df)
@@ -148,7 +150,7 @@ class AnalysisOrchestrator:
             return self._format_analysis_result(empty_df, topic, session_id)
 
         analyzed_df = await self._run_analysis_pipeline(paragraphs, topic)
-        self.session_store.save_analysis(session_id, analyzed_df, topic)
+        await self.session_store.save_analysis(session_id, analyzed_df, topic)
         return self._format_analysis_result(analyzed_df, topic, session_id)
 
     async def analyze_incremental(self, session_id: str, paragraph_id: int, new_text: str) -> Optional[Dict[str, Any]]:
@@ -157,7 +159,7 @@ class AnalysisOrchestrator:
         ВАЖНО: НЕ обновляет текст в сессии, только рассчитывает метрики для переданного текста.
         """
         logger.info(f"Инкрементальное обновление для сессии {session_id}, параграф ID: {paragraph_id}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"Сессия {session_id} не найдена для инкрементального обновления.")
             return None
@@ -175,19 +177,20 @@ class AnalysisOrchestrator:
         paragraph_df_slice = temp_df.iloc[[paragraph_id]].copy() # DataFrame с одной строкой для анализа
 
         # 1. Readability (синхронная, запускаем в executor)
-        logger.debug(f"Инкрементальный анализ читаемости для параграфа {paragraph_id}...")
+        logger.debug("Инкрементальный анализ читаемости для параграфа %s...", paragraph_id)
         updated_readability_df = await self._run_readability_async(paragraph_df_slice) # Используем _run_readability_async
         
         # 2. Signal Strength (асинхронная)
-        logger.debug(f"Инкрементальный анализ сигнальности для параграфа {paragraph_id}...")
+        logger.debug("Инкрементальный анализ сигнальности для параграфа %s...", paragraph_id)
         # analyze_signal_strength_incremental ожидает полный DataFrame и список измененных индексов
         # Это более эффективно, чем передавать слайс и потом объединять.
         temp_df = self.embedding_service.analyze_signal_strength_incremental(temp_df, topic, [paragraph_id])
         
         # 3. Semantic Function (асинхронная, с флагом single_paragraph)
-        logger.debug(f"Инкрементальный семантический анализ для параграфа {paragraph_id}...")
+        logger.debug("Инкрементальный семантический анализ для параграфа %s...", paragraph_id)
         updated_semantic_df = await semantic_function.analyze_semantic_function_batch(
-            paragraph_df_slice, topic, self.openai_service, single_paragraph=True
+            paragraph_df_slice, topic, self.openai_service, single_paragraph=True,
+            rate_limiter=openai_rpm_limiter, token_limiter=openai_tpm_limiter
         )
         
         # Собираем метрики из результатов анализа (НЕ сохраняем в сессию!)
@@ -234,7 +237,7 @@ class AnalysisOrchestrator:
     async def get_cached_analysis(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Получает сохраненные результаты анализа из хранилища сессий."""
         logger.info(f"Запрос на получение кэшированного анализа для сессии {session_id}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"Кэшированный анализ для сессии {session_id} не найден.")
             return None
@@ -246,7 +249,7 @@ class AnalysisOrchestrator:
         Метрики читаемости и сигнальности НЕ пересчитываются.
         """
         logger.info(f"[Orchestrator] Запрос на полное обновление семантики для сессии {session_id}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для обновления семантики.")
             return None
@@ -262,7 +265,7 @@ class AnalysisOrchestrator:
         # Запускаем только семантический анализ для всех абзацев
         # Функция analyze_semantic_function_batch должна вернуть DataFrame
         # с теми же индексами, что и current_df, но с обновленными семантическими колонками.
-        logger.debug(f"[Orchestrator] Вызов _run_semantic_function_async для сессии {session_id} ({len(current_df)} абзацев)")
+        logger.debug("[Orchestrator] Вызов _run_semantic_function_async для сессии %s (%s абзацев)", session_id, len(current_df))
         
         # Важно: semantic_function.analyze_semantic_function_batch ожидает DataFrame с колонкой 'text'.
         # Мы передаем current_df.copy(), чтобы избежать неожиданных модификаций оригинала,
@@ -284,7 +287,7 @@ class AnalysisOrchestrator:
                     logger.warning(f"[Orchestrator] Колонка '{col}' отсутствует в результатах семантического анализа для сессии {session_id}.")
                     current_df[col] = None # или pd.NA, в зависимости от желаемого поведения
             
-            self.session_store.save_analysis(session_id, current_df, topic)
+            await self.session_store.save_analysis(session_id, current_df, topic)
             logger.info(f"[Orchestrator] Семантика для сессии {session_id} успешно обновлена и сохранена.")
             return self._format_analysis_result(current_df, topic, session_id)
         else:
@@ -357,7 +360,7 @@ class AnalysisOrchestrator:
         Объединяет два абзаца в один, пересчитывает метрики и возвращает обновлённую сессию.
         """
         logger.info(f"[Orchestrator] merge_paragraphs: session_id={session_id}, paragraph_id_1={paragraph_id_1}, paragraph_id_2={paragraph_id_2}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для слияния абзацев.")
             return None
@@ -392,7 +395,7 @@ class AnalysisOrchestrator:
             if col in new_df.columns:
                 df.loc[idx1, col] = new_df.iloc[0][col]
 
-        self.session_store.save_analysis(session_id, df, topic)
+        await self.session_store.save_analysis(session_id, df, topic)
         logger.info(f"[Orchestrator] Абзацы {paragraph_id_1} и {paragraph_id_2} объединены в сессии {session_id}.")
         return self._format_analysis_result(df, topic, session_id)
 
@@ -401,7 +404,7 @@ class AnalysisOrchestrator:
         Разделяет абзац на два по указанной позиции, пересчитывает метрики и возвращает обновленную сессию.
         """
         logger.info(f"[Orchestrator] split_paragraph: session_id={session_id}, paragraph_id={paragraph_id}, split_position={split_position}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для разделения абзаца.")
             return None
@@ -446,7 +449,7 @@ class AnalysisOrchestrator:
                 if col in new_df.columns:
                     df.loc[orig_idx, col] = new_df.iloc[idx][col]
 
-        self.session_store.save_analysis(session_id, df, topic)
+        await self.session_store.save_analysis(session_id, df, topic)
         logger.info(f"[Orchestrator] Абзац {paragraph_id} разделен на два в сессии {session_id}.")
         return self._format_analysis_result(df, topic, session_id)
 
@@ -462,7 +465,7 @@ class AnalysisOrchestrator:
             Обновленный результат анализа или None, если произошла ошибка
         """
         logger.info(f"[Orchestrator] reorder_paragraphs: session_id={session_id}, new_order={new_order}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для изменения порядка абзацев.")
             return None
@@ -491,7 +494,7 @@ class AnalysisOrchestrator:
             new_df['semantic_error'] = None
         
         # Сохраняем обновленные данные анализа
-        self.session_store.save_analysis(session_id, new_df, topic)
+        await self.session_store.save_analysis(session_id, new_df, topic)
         logger.info(f"[Orchestrator] Порядок абзацев изменен в сессии {session_id}.")
         
         # Возвращаем обновленный результат анализа
@@ -509,7 +512,7 @@ class AnalysisOrchestrator:
             Обновленный результат анализа или None, если произошла ошибка
         """
         logger.info(f"[Orchestrator] update_topic: session_id={session_id}, new_topic={new_topic}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для обновления темы.")
             return None
@@ -517,7 +520,7 @@ class AnalysisOrchestrator:
         df = analysis_data["df"]
         
         # Обновляем тему в анализе
-        self.session_store.save_analysis(session_id, df, new_topic)
+        await self.session_store.save_analysis(session_id, df, new_topic)
         
         # Пересчитываем метрики сигнала/шума
         df = await self._run_signal_strength_async(df.copy(), new_topic)
@@ -531,7 +534,7 @@ class AnalysisOrchestrator:
                     df[col] = semantic_results_df[col]
         
         # Сохраняем обновленные данные
-        self.session_store.save_analysis(session_id, df, new_topic)
+        await self.session_store.save_analysis(session_id, df, new_topic)
         logger.info(f"[Orchestrator] Тема и метрики успешно обновлены в сессии {session_id}.")
         
         # Возвращаем обновленный результат анализа
@@ -542,7 +545,7 @@ class AnalysisOrchestrator:
         Удаляет указанный абзац из сессии анализа и возвращает обновленную сессию.
         """
         logger.info(f"[Orchestrator] delete_paragraph_from_session: session_id={session_id}, paragraph_id_to_delete={paragraph_id_to_delete}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для удаления абзаца.")
             raise HTTPException(status_code=404, detail=f"Сессия {session_id} не найдена.")
@@ -568,7 +571,7 @@ class AnalysisOrchestrator:
         if 'semantic_error' in df.columns:
             df['semantic_error'] = None
         
-        self.session_store.save_analysis(session_id, df, topic)
+        await self.session_store.save_analysis(session_id, df, topic)
         logger.info(f"[Orchestrator] Абзац {paragraph_id_to_delete} удален. В сессии {session_id} осталось {len(df)} абзацев.")
 
         return self._format_analysis_result(df, topic, session_id)
@@ -577,7 +580,7 @@ class AnalysisOrchestrator:
         self, session_id: str, paragraph_id_to_process: int, full_new_text: str
     ) -> Dict[str, Any]:
         logger.info(f"[Orchestrator] update_text_and_restructure_paragraph: session_id={session_id}, paragraph_id={paragraph_id_to_process}")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.error(f"[Orchestrator] Сессия {session_id} не найдена.")
             raise HTTPException(status_code=404, detail=f"Сессия {session_id} не найдена.")
@@ -614,7 +617,7 @@ class AnalysisOrchestrator:
             for col in ['semantic_function', 'semantic_method', 'semantic_error']:
                 if col in df_after_deletion.columns: df_after_deletion[col] = None
             
-            self.session_store.save_analysis(session_id, df_after_deletion, topic)
+            await self.session_store.save_analysis(session_id, df_after_deletion, topic)
             return self._format_analysis_result(df_after_deletion, topic, session_id)
 
         # Текст не пустой, обрабатываем разделение
@@ -636,7 +639,7 @@ class AnalysisOrchestrator:
         new_paragraphs_interim_df = pd.DataFrame(new_texts_df_data)
 
         # Пересчитываем все метрики для этих новых текстов
-        logger.debug(f"[Orchestrator] Пересчет метрик для {len(new_paragraph_texts)} новых/измененных абзацев.")
+        logger.debug("[Orchestrator] Пересчет метрик для %s новых/измененных абзацев.", len(new_paragraph_texts))
         reanalyzed_metrics_df = await self._run_analysis_pipeline(new_paragraph_texts, topic)
         # reanalyzed_metrics_df будет иметь 'paragraph_id' от 0 до N-1
         
@@ -672,7 +675,7 @@ class AnalysisOrchestrator:
         for col in ['semantic_function', 'semantic_method', 'semantic_error']:
             if col in final_df.columns: final_df[col] = None
 
-        self.session_store.save_analysis(session_id, final_df, topic)
+        await self.session_store.save_analysis(session_id, final_df, topic)
         logger.info(f"[Orchestrator] Абзац {paragraph_id_to_process} обновлен/разделен. Сессия {session_id} теперь содержит {len(final_df)} абзацев.")
         return self._format_analysis_result(final_df, topic, session_id)
 
@@ -710,7 +713,7 @@ class AnalysisOrchestrator:
             if isinstance(result_or_exc, Exception):
                 logger.error(f"Ошибка в модуле '{module_name}' во время быстрого анализа: {result_or_exc}", exc_info=result_or_exc)
             elif isinstance(result_or_exc, pd.DataFrame):
-                logger.debug(f"Получены результаты от модуля {module_name}. Колонки: {result_or_exc.columns.tolist()}")
+                logger.debug("Получены результаты от модуля %s. Колонки: %s", module_name, result_or_exc.columns.tolist())
                 metrics_cols = [col for col in result_or_exc.columns if col not in ['paragraph_id', 'text']]
                 for col in metrics_cols:
                     if col in result_or_exc:
@@ -728,7 +731,7 @@ class AnalysisOrchestrator:
         logger.info(f"[Orchestrator] calculate_paragraph_metrics (быстрый): session_id={session_id}, paragraph_id={paragraph_id}")
         
         # Проверяем, что сессия существует
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для расчета метрик абзаца.")
             return None
@@ -779,7 +782,7 @@ class AnalysisOrchestrator:
         logger.info(f"[Orchestrator] calculate_text_metrics: session_id={session_id}")
         
         # Проверяем, что сессия существует
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         if not analysis_data:
             logger.warning(f"[Orchestrator] Сессия {session_id} не найдена для расчета метрик текста.")
             return None
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body, Path # Добавлен Path
-from fastapi.responses import FileResponse # Для экспорта
-from typing import Optional, Any # Добавил Any
+from fastapi.responses import FileResponse, Response # Для экспорта и готовых JSON-ответов
+from typing import Optional, Any, Awaitable, Callable, Dict # Добавил Any
 import logging
 
 # Модели Pydantic для запросов и ответов
@@ -87,8 +87,8 @@ async def analyze_text_endpoint(
     - **session_id** (опционально): Если предоставлен, анализ будет сохранен или перезаписан 
       под этим ID. Если не предоставлен, будет сгенерирован новый ID сессии.
     """
-    logger.info(f"--- ENTERING /api/analyze endpoint ---")
-    logger.info(f"API /analyze вызван. Session ID: {request_data.session_id or 'New'}, Topic: '{request_data.topic[:30]}...'")
+    logger.debug("--- ENTERING /api/analyze endpoint ---")
+    logger.info("API /analyze вызван. Session ID: %s, Topic: '%.30s...'", request_data.session_id or 'New', request_data.topic)
     try:
         result = await orchestrator.analyze_full_text(
             text_content=request_data.text, 
@@ -113,7 +113,7 @@ async def update_paragraph_endpoint(
     - **paragraph_id**: Индекс (ID) абзаца, который нужно обновить.
     - **text**: Новый текст для абзаца.
     """
-    logger.info(f"API /update-paragraph вызван. Session ID: {request_data.session_id}, Paragraph ID: {request_data.paragraph_id}")
+    logger.info("API /update-paragraph вызван. Session ID: %s, Paragraph ID: %s", request_data.session_id, request_data.paragraph_id)
     try:
         updated_paragraph_data = await orchestrator.analyze_incremental(
             session_id=request_data.session_id, 
@@ -141,7 +141,7 @@ async def update_text_and_restructure_paragraph_endpoint(
     Если в тексте есть двойные переносы строк, абзац разделяется.
     Возвращает полный обновленный AnalysisResponse.
     """
-    logger.info(f"API /paragraph/update-text-and-restructure вызван. Session ID: {request_data.session_id}, Paragraph ID: {request_data.paragraph_id}")
+    logger.info("API /paragraph/update-text-and-restructure вызван. Session ID: %s, Paragraph ID: %s", request_data.session_id, request_data.paragraph_id)
     try:
         updated_session = await orchestrator.update_text_and_restructure_paragraph(
             session_id=request_data.session_id,
@@ -163,7 +163,7 @@ async def get_analysis_endpoint(
     """
     Получает сохраненные результаты полного анализа по его `session_id`.
     """
-    logger.info(f"API /analysis/{session_id} вызван.")
+    logger.info("API /analysis/%s вызван.", session_id)
     try:
         analysis_result = await orchestrator.get_cached_analysis(session_id)
         if analysis_result is None:
@@ -187,7 +187,7 @@ async def refresh_semantic_analysis_endpoint(
     Другие метрики (читаемость, сигнальность) НЕ пересчитываются этим эндпоинтом.
     Возвращает полный обновленный результат анализа для сессии.
     """
-    logger.info(f"API /analysis/{session_id}/refresh-semantics вызван.")
+    logger.info("API /analysis/%s/refresh-semantics вызван.", session_id)
     try:
         updated_analysis_result = await orchestrator.refresh_full_semantic_analysis(session_id)
         if updated_analysis_result is None:
@@ -209,7 +209,7 @@ async def export_analysis_endpoint(
     """
     Экспортирует результаты анализа для указанной `session_id` в заданном формате (csv или json).
     """
-    logger.info(f"API /export/{session_id} вызван. Формат: {file_format}")
+    logger.info("API /export/%s вызван. Формат: %s", session_id, file_format)
     try:
         file_path = await export_service.export_analysis(session_id, file_format)
         if file_path is None:
@@ -232,91 +232,91 @@ async def export_analysis_endpoint(
         logger.error(f"Критическая ошибка в эндпоинте /export/{session_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error during export: {e}")
 
+async def _run_mutation(
+    op: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+    endpoint: str,
+    not_found_detail: str = "Session or paragraph not found."
+) -> Response:
+    """
+    Общий обработчик мутирующих эндпоинтов (merge/split/reorder/update-topic/delete).
+    Выполняет операцию оркестратора, превращает None в 404, прочие ошибки в 500
+    и сериализует AnalysisResponse один раз через pydantic-core (model_dump_json),
+    минуя повторную валидацию response_model и jsonable_encoder в FastAPI.
+    """
+    try:
+        result = await op()
+        if result is None:
+            logger.warning("Мутация %s не выполнена: %s", endpoint, not_found_detail)
+            raise HTTPException(status_code=404, detail=not_found_detail)
+    except HTTPException:
+        raise # Перебрасываем HTTP исключения из оркестратора (напр. 404)
+    except Exception as e:
+        logger.error(f"Критическая ошибка в эндпоинте {endpoint}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error in {endpoint}: {e}")
+    payload = AnalysisResponse.model_validate(result).model_dump_json()
+    return Response(content=payload, media_type="application/json")
+
 @router.post("/merge-paragraphs", response_model=AnalysisResponse, summary="Объединить два абзаца в один")
 async def merge_paragraphs_endpoint(
     request_data: ParagraphsMergeRequest = Body(...),
     orchestrator: AnalysisOrchestrator = Depends(get_orchestrator_di)
-) -> AnalysisResponse:
-    logger.info(f"API /merge-paragraphs вызван. Session ID: {request_data.session_id}, Paragraph IDs: {request_data.paragraph_id_1}, {request_data.paragraph_id_2}")
-    try:
-        result = await orchestrator.merge_paragraphs(
+) -> Response:
+    logger.info("API /merge-paragraphs вызван. Session ID: %s, Paragraph IDs: %s, %s", request_data.session_id, request_data.paragraph_id_1, request_data.paragraph_id_2)
+    return await _run_mutation(
+        lambda: orchestrator.merge_paragraphs(
             session_id=request_data.session_id,
             paragraph_id_1=request_data.paragraph_id_1,
             paragraph_id_2=request_data.paragraph_id_2
-        )
-        if result is None:
-            logger.warning(f"Не удалось выполнить слияние абзацев для сессии {request_data.session_id}. Сессия не найдена или абзацы не существуют.")
-            raise HTTPException(status_code=404, detail="Session or paragraphs not found.")
-        return result
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Критическая ошибка в эндпоинте /merge-paragraphs: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Internal server error during paragraphs merge: {e}")
+        ),
+        "/merge-paragraphs",
+        "Session or paragraphs not found."
+    )
 
 @router.post("/split-paragraph", response_model=AnalysisResponse, summary="Разделить абзац на два")
 async def split_paragraph_endpoint(
     request_data: ParagraphSplitRequest = Body(...),
     orchestrator: AnalysisOrchestrator = Depends(get_orchestrator_di)
-) -> AnalysisResponse:
-    logger.info(f"API /split-paragraph вызван. Session ID: {request_data.session_id}, Paragraph ID: {request_data.paragraph_id}, Split Position: {request_data.split_position}")
-    try:
-        updated_analysis = await orchestrator.split_paragraph(
+) -> Response:
+    logger.info("API /split-paragraph вызван. Session ID: %s, Paragraph ID: %s, Split Position: %s", request_data.session_id, request_data.paragraph_id, request_data.split_position)
+    return await _run_mutation(
+        lambda: orchestrator.split_paragraph(
             session_id=request_data.session_id,
             paragraph_id=request_data.paragraph_id,
             split_position=request_data.split_position
-        )
-        if updated_analysis is None:
-            logger.warning(f"Не удалось разделить абзац для сессии {request_data.session_id}, абзац {request_data.paragraph_id}.")
-            raise HTTPException(status_code=404, detail="Analysis session or paragraph not found, or split failed.")
-        return updated_analysis
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Критическая ошибка в эндпоинте /split-paragraph: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Internal server error during paragraph split: {e}")
+        ),
+        "/split-paragraph",
+        "Analysis session or paragraph not found, or split failed."
+    )
 
 @router.post("/reorder-paragraphs", response_model=AnalysisResponse, summary="Изменить порядок абзацев")
 async def reorder_paragraphs_endpoint(
     request_data: ParagraphsReorderRequest = Body(...),
     orchestrator: AnalysisOrchestrator = Depends(get_orchestrator_di)
-) -> AnalysisResponse:
-    logger.info(f"API /reorder-paragraphs вызван. Session ID: {request_data.session_id}")
-    try:
-        updated_analysis = await orchestrator.reorder_paragraphs(
+) -> Response:
+    logger.info("API /reorder-paragraphs вызван. Session ID: %s", request_data.session_id)
+    return await _run_mutation(
+        lambda: orchestrator.reorder_paragraphs(
             session_id=request_data.session_id,
             new_order=request_data.new_order
-        )
-        if updated_analysis is None:
-            logger.warning(f"Не удалось изменить порядок абзацев для сессии {request_data.session_id}. Сессия не найдена или некорректный порядок.")
-            raise HTTPException(status_code=404, detail="Session not found or invalid paragraph order.")
-        return updated_analysis
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Критическая ошибка в эндпоинте /reorder-paragraphs: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Internal server error during paragraphs reordering: {e}")
+        ),
+        "/reorder-paragraphs",
+        "Session not found or invalid paragraph order."
+    )
 
 @router.post("/update-topic", response_model=AnalysisResponse, summary="Обновить тему анализа")
 async def update_topic_endpoint(
     request_data: UpdateTopicRequest = Body(...),
     orchestrator: AnalysisOrchestrator = Depends(get_orchestrator_di)
-) -> AnalysisResponse:
-    logger.info(f"API /update-topic вызван. Session ID: {request_data.session_id}")
-    try:
-        updated_analysis = await orchestrator.update_topic(
+) -> Response:
+    logger.info("API /update-topic вызван. Session ID: %s", request_data.session_id)
+    return await _run_mutation(
+        lambda: orchestrator.update_topic(
             session_id=request_data.session_id,
             new_topic=request_data.topic
-        )
-        if updated_analysis is None:
-            logger.warning(f"Не удалось обновить тему для сессии {request_data.session_id}. Сессия не найдена.")
-            raise HTTPException(status_code=404, detail="Session not found.")
-        return updated_analysis
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Критическая ошибка в эндпоинте /update-topic: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Internal server error during topic update: {e}")
+        ),
+        "/update-topic",
+        "Session not found."
+    )
 
 @router.delete(
     "/paragraph/{session_id}/{paragraph_id_to_delete}",
@@ -328,7 +328,7 @@ async def delete_paragraph_endpoint(
     session_id: str = Path(..., description="ID сессии анализа"),
     paragraph_id_to_delete: int = Path(..., description="ID абзаца для удаления"),
     orchestrator: AnalysisOrchestrator = Depends(get_orchestrator_di)
-) -> AnalysisResponse:
+) -> Response:
     """
     Удаляет указанный абзац из сессии анализа.
 
@@ -336,18 +336,14 @@ async def delete_paragraph_endpoint(
     - **paragraph_id_to_delete**: ID абзаца, который необходимо удалить.
     Возвращает обновленные данные всей сессии.
     """
-    logger.info(f"API DELETE /paragraph/{session_id}/{paragraph_id_to_delete} вызван.")
-    try:
-        updated_session_data = await orchestrator.delete_paragraph_from_session(
+    logger.info("API DELETE /paragraph/%s/%s вызван.", session_id, paragraph_id_to_delete)
+    return await _run_mutation(
+        lambda: orchestrator.delete_paragraph_from_session(
             session_id=session_id,
             paragraph_id_to_delete=paragraph_id_to_delete
-        )
-        return updated_session_data
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Критическая ошибка в эндпоинте DELETE /paragraph/{session_id}/{paragraph_id_to_delete}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера при удалении абзаца: {e}")
+        ),
+        "DELETE /paragraph"
+    )
 
 @router.post("/paragraph/{session_id}/{paragraph_id}/metrics", response_model=ParagraphMetrics)
 async def calculate_paragraph_metrics_endpoint(
@@ -360,7 +356,7 @@ async def calculate_paragraph_metrics_endpoint(
     Рассчитывает метрики для одного абзаца без сохранения изменений.
     Используется для предварительного просмотра метрик при редактировании.
     """
-    logger.info(f"API /paragraph/{session_id}/{paragraph_id}/metrics вызван.")
+    logger.info("API /paragraph/%s/%s/metrics вызван.", session_id, paragraph_id)
     try:
         metrics = await orchestrator.calculate_paragraph_metrics(
             session_id=session_id,
@@ -384,7 +380,7 @@ async def calculate_text_metrics_endpoint(
     Рассчитывает метрики для всего текста без сохранения изменений.
     Используется для предварительного просмотра метрик при редактировании.
     """
-    logger.info(f"API /analysis/{session_id}/metrics вызван.")
+    logger.info("API /analysis/%s/metrics вызван.", session_id)
     try:
         analysis = await orchestrator.calculate_text_metrics(
             session_id=session_id,
@@ -409,7 +405,7 @@ async def analyze_chunk_semantic_single_endpoint(
     
     Новая архитектура: frontend управляет текстом, backend только анализирует метрики.
     """
-    logger.info(f"API /v1/chunk/metrics/semantic-single вызван. Chunk ID: {request_data.chunk_id}")
+    logger.info("API /v1/chunk/metrics/semantic-single вызван. Chunk ID: %s", request_data.chunk_id)
     
     try:
         # Вызываем функцию анализа одного чанка
@@ -448,7 +444,8 @@ async def analyze_chunks_semantic_batch_endpoint(
     
     Новая архитектура: обрабатывает каждый чанк индивидуально в контексте всего документа.
     """
-    logger.info(f"API /v1/chunks/metrics/semantic-batch вызван. Чанков: {len(request_data.chunks)}, Параллельность: {request_data.max_parallel}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("API /v1/chunks/metrics/semantic-batch вызван. Чанков: %d, Параллельность: %s", len(request_data.chunks), request_data.max_parallel)
     
     try:
         # Вызываем функцию пакетного анализа
@@ -490,7 +487,7 @@ async def analyze_chunks_semantic_batch_endpoint(
         all_failed = []
         
         for chunk in request_data.chunks:
-            chunk_id = chunk.get("id", "unknown_chunk")
+            chunk_id = chunk["id"] # Наличие id гарантировано валидацией ChunkItem
             failed_results.append(ChunkSemanticResponse(
                 chunk_id=chunk_id,
                 metrics={
@@ -516,7 +513,8 @@ async def analyze_chunk_local_metrics_endpoint(
     
     Новая архитектура: frontend управляет текстом, backend анализирует только метрики.
     """
-    logger.info(f"[ChunkLocalMetrics] Анализ одного чанка. Длина: {len(request_data.chunk_text)}, Тема: '{request_data.topic[:30]}...'")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("[ChunkLocalMetrics] Анализ одного чанка. Длина: %d, Тема: '%.30s...'", len(request_data.chunk_text), request_data.topic)
     
     try:
         # Вызываем функцию анализа локальных метрик
@@ -526,7 +524,7 @@ async def analyze_chunk_local_metrics_endpoint(
             embedding_service=embedding_service
         )
         
-        logger.info(f"[ChunkLocalMetrics] Анализ завершен: signal={result.get('signal_strength')}, complexity={result.get('complexity')}")
+        logger.info("[ChunkLocalMetrics] Анализ завершен: signal=%s, complexity=%s", result.get('signal_strength'), result.get('complexity'))
         
         return ChunkLocalMetricsResponse(
             chunk_id="single_chunk",  # Фиктивный ID для совместимости
@@ -557,7 +555,8 @@ async def analyze_chunks_local_metrics_batch_endpoint(
     
     Новая архитектура: обрабатывает каждый чанк индивидуально для быстрых локальных метрик.
     """
-    logger.info(f"API /v1/chunks/metrics/batch-local вызван. Чанков: {len(request_data.chunks)}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("API /v1/chunks/metrics/batch-local вызван. Чанков: %d", len(request_data.chunks))
     
     try:
         # Вызываем функцию пакетного анализа локальных метрик
@@ -4,28 +4,140 @@
 """
 
 from fastapi import APIRouter, Body, Query, Depends, HTTPException
-from typing import Optional
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Optional, Dict, Tuple, Any, List
 import logging
 import asyncio
+import json
 
 from api.models import (
     ChunkSemanticRequest, 
     ChunkSemanticResponse,
+    ChunkSemanticMetrics,
     BatchChunkSemanticRequest, 
+    ChunkItem,
     BatchChunkSemanticResponse
 )
 from services.openai_service import OpenAIService, get_openai_service
 from analysis.semantic_function_hybrid import HybridSemanticAnalyzer
+from utils.lru_cache import BoundedLRUCache
+from utils.rate_limiter import openai_rpm_limiter, openai_tpm_limiter
 from config import settings
 
+try:
+    import orjson # type: ignore # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    DefaultJSONResponse = JSONResponse # Fallback на стандартный json
+
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/v1/hybrid", tags=["Hybrid Semantic Analysis"])
+router = APIRouter(prefix="/api/v1/hybrid", tags=["Hybrid Semantic Analysis"], default_response_class=DefaultJSONResponse)
+
+class _CountingSemaphore(asyncio.Semaphore):
+    """Семафор, который сам считает вызывающих, ожидающих слот в acquire()."""
+
+    def __init__(self, value: int):
+        super().__init__(value)
+        self.waiting = 0
+
+    async def acquire(self) -> bool:
+        self.waiting += 1
+        try:
+            return await super().acquire()
+        finally:
+            self.waiting -= 1
+
+
+# Bulkhead: общий на процесс лимит одновременных вызовов OpenAI, независимо от числа пакетов
+_openai_semaphore = _CountingSemaphore(settings.OPENAI_MAX_INFLIGHT)
+
+# LRU-кэш успешных классификаций: (нормализованный текст чанка, тема) -> метрики.
+# Гибридный анализ не использует контекст документа, поэтому full_text в ключ не входит.
+RESULT_CACHE_SIZE = 4096
+_result_cache: "BoundedLRUCache[Tuple[str, str], Dict[str, Any]]" = BoundedLRUCache(RESULT_CACHE_SIZE)
+
+# Кэш анализаторов на время жизни воркера: (api_key, prefer_realtime) -> анализатор.
+# Переиспользование сохраняет пул HTTP-соединений OpenAI и состояние circuit breaker между запросами.
+# Сессия Realtime внутри анализатора одна: запросы используют ее по очереди, а при смене темы
+# она пересоздается (см. HybridSemanticAnalyzer.analyze_chunk).
+_analyzer_cache: Dict[Tuple[str, bool], HybridSemanticAnalyzer] = {}
+
+
+def _get_cached_analyzer(prefer_realtime: bool) -> HybridSemanticAnalyzer:
+    """Возвращает закэшированный гибридный анализатор, создавая его при первом обращении."""
+    key = (settings.OPENAI_API_KEY, prefer_realtime)
+    analyzer = _analyzer_cache.get(key)
+    if analyzer is None:
+        analyzer = HybridSemanticAnalyzer(
+            api_key=settings.OPENAI_API_KEY,
+            prefer_realtime=prefer_realtime
+        )
+        # setdefault: если прогрев и запрос создали анализатор одновременно, оставляем первый
+        analyzer = _analyzer_cache.setdefault(key, analyzer)
+        logger.info(f"[HybridAPI] Создан общий анализатор (prefer_realtime={prefer_realtime})")
+    return analyzer
+
+
+def _check_openai_overload() -> None:
+    """Отклоняет запрос с 503, если все слоты OpenAI заняты и очередь ожидающих переполнена."""
+    if _openai_semaphore.locked() and _openai_semaphore.waiting >= settings.OPENAI_MAX_QUEUED:
+        logger.warning("[HybridAPI] Очередь вызовов OpenAI переполнена, возвращаем 503")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many concurrent OpenAI requests, retry later",
+            headers={"Retry-After": "5"}
+        )
+
+
+def get_hybrid_analyzer(
+    prefer_realtime: bool = Query(True, description="Предпочитать Realtime API для скорости")
+) -> HybridSemanticAnalyzer:
+    """Зависимость FastAPI: общий HybridSemanticAnalyzer для выбранного режима."""
+    return _get_cached_analyzer(prefer_realtime)
+
+
+# Таймаут прогрева соединения с OpenAI при старте
+WARMUP_TIMEOUT = 3.0
+
+
+async def _warmup_hybrid_analyzer() -> None:
+    """
+    Создает общий анализатор заранее. Конструктор OpenAIService делает синхронный
+    models.list(), поэтому выполняем его в пуле потоков: TLS-сессия к api.openai.com
+    будет готова до первого пользовательского запроса.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.wait_for(
+            loop.run_in_executor(None, _get_cached_analyzer, True),
+            timeout=WARMUP_TIMEOUT
+        )
+        logger.info("[HybridAPI] Соединение с OpenAI прогрето")
+    except Exception as e:
+        logger.warning(f"[HybridAPI] Прогрев соединения с OpenAI не удался: {e}")
+
+
+async def startup_hybrid_routes() -> None:
+    """Прогрев анализатора при старте приложения (вызывается из lifespan в main)."""
+    if settings.ENABLE_SEMANTIC_ANALYSIS and settings.OPENAI_API_KEY:
+        # Fire-and-forget: старт приложения не ждет прогрева
+        asyncio.create_task(_warmup_hybrid_analyzer())
+
+
+async def shutdown_hybrid_routes() -> None:
+    """Закрытие общих анализаторов при остановке приложения (вызывается из lifespan в main)."""
+    for analyzer in list(_analyzer_cache.values()):
+        try:
+            await analyzer.close()
+        except Exception as e:
+            logger.error(f"[HybridAPI] Ошибка при закрытии анализатора: {e}")
+    _analyzer_cache.clear()
 
 
 @router.post("/chunk/metrics/semantic", response_model=ChunkSemanticResponse)
 async def analyze_chunk_semantic_hybrid_endpoint(
     request_data: ChunkSemanticRequest = Body(...),
-    prefer_realtime: bool = Query(True, description="Предпочитать Realtime API для скорости"),
+    analyzer: HybridSemanticAnalyzer = Depends(get_hybrid_analyzer),
     openai_service: OpenAIService = Depends(get_openai_service)
 ) -> ChunkSemanticResponse:
     """
@@ -35,7 +147,7 @@ async def analyze_chunk_semantic_hybrid_endpoint(
     - Автоматически переключается на REST API при ошибках
     - 100% надежность благодаря fallback механизму
     """
-    logger.info(f"[HybridAPI] Анализ чанка {request_data.chunk_id}, prefer_realtime={prefer_realtime}")
+    logger.info(f"[HybridAPI] Анализ чанка {request_data.chunk_id}, prefer_realtime={analyzer.prefer_realtime}")
     
     if not openai_service or not openai_service.is_available:
         return ChunkSemanticResponse(
@@ -48,18 +160,22 @@ async def analyze_chunk_semantic_hybrid_endpoint(
             }
         )
     
+    cache_key = (" ".join(request_data.chunk_text.split()), request_data.topic)
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"[HybridAPI] Чанк {request_data.chunk_id}: результат из кэша")
+        return ChunkSemanticResponse(chunk_id=request_data.chunk_id, metrics=dict(cached))
+    _check_openai_overload()
+    
     try:
-        # Создаем гибридный анализатор
-        analyzer = HybridSemanticAnalyzer(
-            api_key=settings.OPENAI_API_KEY,
-            prefer_realtime=prefer_realtime
-        )
-        
         # Анализируем чанк
         result = await analyzer.analyze_chunk(
             chunk_id=request_data.chunk_id,
             chunk_text=request_data.chunk_text,
-            topic=request_data.topic
+            topic=request_data.topic,
+            rate_limiter=openai_rpm_limiter,
+            token_limiter=openai_tpm_limiter,
+            global_semaphore=_openai_semaphore
         )
         
         # Добавляем информацию о методе в метрики
@@ -71,17 +187,26 @@ async def analyze_chunk_semantic_hybrid_endpoint(
             "api_latency": result.get("api_latency", 0)
         }
         
-        # Получаем статистику для логирования
-        stats = await analyzer.get_statistics()
         api_method = result.get('api_method', 'unknown')
-        logger.info(
-            f"[HybridAPI] ✅ Чанк {request_data.chunk_id} обработан через {api_method.upper()}. "
-            f"Функция: '{result.get('semantic_function', 'не определена')}'. "
-            f"Время: {result.get('api_latency', 0):.2f}с. "
-            f"Статистика Realtime: {stats['realtime_successes']} успехов, {stats['realtime_failures']} ошибок"
-        )
+        # Строку лога собираем только при включенном INFO; счетчики берем синхронным
+        # снимком, без await get_statistics() на каждый чанк
+        if logger.isEnabledFor(logging.INFO):
+            realtime_successes, realtime_failures, _ = analyzer.stats_snapshot()
+            logger.info(
+                f"[HybridAPI] ✅ Чанк {request_data.chunk_id} обработан через {api_method.upper()}. "
+                f"Функция: '{result.get('semantic_function', 'не определена')}'. "
+                f"Время: {result.get('api_latency', 0):.2f}с. "
+                f"Статистика Realtime: {realtime_successes} успехов, {realtime_failures} ошибок"
+            )
         
-        await analyzer.close()
+        # Кэшируем только успешную классификацию
+        if api_method != "failed" and not result.get("semantic_error"):
+            _result_cache.put(cache_key, {
+                **metrics,
+                "semantic_method": "hybrid_cached",
+                "api_method": "cached",
+                "api_latency": 0
+            })
         
         return ChunkSemanticResponse(
             chunk_id=request_data.chunk_id,
@@ -101,13 +226,45 @@ async def analyze_chunk_semantic_hybrid_endpoint(
         )
 
 
+# Метрики для всех чанков пакета при недоступном OpenAI (один объект на все ответы)
+_UNAVAILABLE_METRICS = ChunkSemanticMetrics(
+    semantic_function="unavailable_api",
+    semantic_method="hybrid",
+    semantic_error="OpenAI service not available"
+)
+
+
+def _fail_all(chunks: List[ChunkItem], metrics: ChunkSemanticMetrics) -> BatchChunkSemanticResponse:
+    """Формирует пакетный ответ, в котором все чанки помечены неудачными с одними и теми же метриками."""
+    chunk_ids = [chunk["id"] for chunk in chunks]
+    return BatchChunkSemanticResponse(
+        results=[ChunkSemanticResponse.model_construct(chunk_id=chunk_id, metrics=metrics) for chunk_id in chunk_ids],
+        failed=chunk_ids
+    )
+
+
+def _to_chunk_response(result: Dict[str, Any]) -> ChunkSemanticResponse:
+    """
+    Формирует ответ по чанку из результата гибридного анализатора.
+    Данные сформированы сервером, поэтому валидация pydantic пропускается (model_construct).
+    """
+    return ChunkSemanticResponse.model_construct(
+        chunk_id=result["chunk_id"],
+        metrics=ChunkSemanticMetrics.model_construct(
+            semantic_function=result.get("semantic_function"),
+            semantic_method=f"hybrid_{result.get('api_method', 'unknown')}",
+            semantic_error=result.get("semantic_error")
+        )
+    )
+
+
 @router.post("/chunks/metrics/semantic-batch", response_model=BatchChunkSemanticResponse)
 async def analyze_chunks_semantic_batch_hybrid_endpoint(
     request_data: BatchChunkSemanticRequest = Body(...),
-    prefer_realtime: bool = Query(True, description="Предпочитать Realtime API"),
+    analyzer: HybridSemanticAnalyzer = Depends(get_hybrid_analyzer),
     adaptive_batching: bool = Query(True, description="Использовать адаптивную стратегию батчинга"),
     openai_service: OpenAIService = Depends(get_openai_service)
-) -> BatchChunkSemanticResponse:
+) -> Response:
     """
     Пакетный анализ семантических функций с гибридным подходом.
     
@@ -119,62 +276,28 @@ async def analyze_chunks_semantic_batch_hybrid_endpoint(
     """
     logger.info(
         f"[HybridBatchAPI] 📦 Начинаем анализ {len(request_data.chunks)} чанков, "
-        f"prefer_realtime={prefer_realtime}, adaptive={adaptive_batching}"
+        f"prefer_realtime={analyzer.prefer_realtime}, adaptive={adaptive_batching}"
     )
     
     if not openai_service or not openai_service.is_available:
         # Возвращаем ошибки для всех чанков
-        failed_results = []
-        all_failed = []
-        
-        for chunk in request_data.chunks:
-            chunk_id = chunk.get("id", "unknown")
-            failed_results.append(ChunkSemanticResponse(
-                chunk_id=chunk_id,
-                metrics={
-                    "semantic_function": "unavailable_api",
-                    "semantic_method": "hybrid",
-                    "semantic_error": "OpenAI service not available",
-                    "api_method": "none"
-                }
-            ))
-            all_failed.append(chunk_id)
-        
-        return BatchChunkSemanticResponse(results=failed_results, failed=all_failed)
+        return _fail_all(request_data.chunks, _UNAVAILABLE_METRICS)
+    
+    _check_openai_overload()
     
     try:
-        # Создаем гибридный анализатор
-        analyzer = HybridSemanticAnalyzer(
-            api_key=settings.OPENAI_API_KEY,
-            prefer_realtime=prefer_realtime
+        # Темп задают общие лимитеры RPM/TPM, max_parallel ограничивает пакет,
+        # а общий семафор - все вызовы OpenAI процесса
+        results = await analyzer.analyze_batch(
+            chunks=request_data.chunks,
+            topic=request_data.topic,
+            max_concurrent=request_data.max_parallel or 5,
+            adaptive_batching=adaptive_batching,
+            rate_limiter=openai_rpm_limiter,
+            token_limiter=openai_tpm_limiter,
+            global_semaphore=_openai_semaphore
         )
         
-        # Добавляем задержку для больших объемов
-        if len(request_data.chunks) > 10:
-            # Для больших документов используем последовательную обработку с паузами
-            logger.info(f"[HybridBatchAPI] 🐌 Большой документ ({len(request_data.chunks)} чанков) - добавляем задержки")
-            results = []
-            for i, chunk in enumerate(request_data.chunks):
-                result = await analyzer.analyze_chunk(
-                    chunk_id=chunk["id"],
-                    chunk_text=chunk["text"],
-                    topic=request_data.topic
-                )
-                results.append(result)
-                
-                # Пауза каждые 5 чанков для избежания rate limit
-                if (i + 1) % 5 == 0 and i < len(request_data.chunks) - 1:
-                    logger.info(f"[HybridBatchAPI] ⏸️ Пауза после {i + 1} чанков (2 сек)")
-                    await asyncio.sleep(2.0)
-        else:
-            # Для малых объемов используем стандартный батчинг
-            results = await analyzer.analyze_batch(
-                chunks=request_data.chunks,
-                topic=request_data.topic,
-                max_concurrent=request_data.max_parallel or 5,
-                adaptive_batching=adaptive_batching
-            )
-        
         # Преобразуем результаты в формат ответа
         response_results = []
         failed = []
@@ -195,54 +318,71 @@ async def analyze_chunks_semantic_batch_hybrid_endpoint(
                 method_stats["failed"] += 1
                 failed.append(chunk_id)
             
-            # Формируем метрики для ответа
-            metrics = {
-                "semantic_function": result.get("semantic_function"),
-                "semantic_method": f"hybrid_{api_method}",
-                "semantic_error": result.get("semantic_error"),
-                "api_method": api_method,
-                "api_latency": result.get("api_latency", 0)
-            }
-            
-            response_results.append(ChunkSemanticResponse(
-                chunk_id=chunk_id,
-                metrics=metrics
-            ))
+            response_results.append(_to_chunk_response(result))
         
-        # Получаем финальную статистику
-        stats = await analyzer.get_statistics()
-        logger.info(
-            f"[HybridBatchAPI] ✅ Завершен анализ {len(request_data.chunks)} чанков. "
-            f"Результат: Realtime={method_stats['realtime']}, REST={method_stats['rest']}, Ошибки={method_stats['failed']}. "
-            f"Realtime доступен: {'ДА' if stats['realtime_available'] else 'НЕТ'}. "
-            f"Общая статистика Realtime: {stats['realtime_successes']} успехов, {stats['realtime_failures']} ошибок"
-        )
-        
-        await analyzer.close()
+        # Финальная статистика нужна только для лога
+        if logger.isEnabledFor(logging.INFO):
+            stats = await analyzer.get_statistics()
+            logger.info(
+                f"[HybridBatchAPI] ✅ Завершен анализ {len(request_data.chunks)} чанков. "
+                f"Результат: Realtime={method_stats['realtime']}, REST={method_stats['rest']}, Ошибки={method_stats['failed']}. "
+                f"Realtime доступен: {'ДА' if stats['realtime_available'] else 'НЕТ'}. "
+                f"Общая статистика Realtime: {stats['realtime_successes']} успехов, {stats['realtime_failures']} ошибок"
+            )
         
-        return BatchChunkSemanticResponse(results=response_results, failed=failed)
+        # Сериализуем один раз, минуя повторную валидацию response_model в FastAPI
+        payload = BatchChunkSemanticResponse.model_construct(results=response_results, failed=failed)
+        return Response(content=payload.model_dump_json(), media_type="application/json")
         
     except Exception as e:
         logger.error(f"[HybridBatchAPI] Критическая ошибка: {e}", exc_info=True)
         
         # Возвращаем ошибки для всех чанков
-        failed_results = []
-        all_failed = []
-        
-        for chunk in request_data.chunks:
-            chunk_id = chunk.get("id", "unknown")
-            failed_results.append(ChunkSemanticResponse(
-                chunk_id=chunk_id,
-                metrics={
-                    "semantic_function": "error_api_call",
-                    "semantic_method": "hybrid_error",
-                    "semantic_error": f"Hybrid batch error: {str(e)[:100]}",
-                    "api_method": "failed"
-                }
-            ))
-            all_failed.append(chunk_id)
-        
-        return BatchChunkSemanticResponse(results=failed_results, failed=all_failed)
+        return _fail_all(request_data.chunks, ChunkSemanticMetrics(
+            semantic_function="error_api_call",
+            semantic_method="hybrid_error",
+            semantic_error=f"Hybrid batch error: {str(e)[:100]}"
+        ))
+
+
+@router.post("/chunks/metrics/semantic-batch/stream")
+async def analyze_chunks_semantic_batch_hybrid_stream_endpoint(
+    request_data: BatchChunkSemanticRequest = Body(...),
+    analyzer: HybridSemanticAnalyzer = Depends(get_hybrid_analyzer),
+    adaptive_batching: bool = Query(True, description="Использовать адаптивную стратегию батчинга"),
+    openai_service: OpenAIService = Depends(get_openai_service)
+) -> StreamingResponse:
+    """
+    Потоковый вариант пакетного гибридного анализа.
+    
+    Возвращает NDJSON: по одной строке ChunkSemanticResponse на чанк сразу после
+    его обработки, без буферизации всего пакета в памяти.
+    """
+    logger.info(f"[HybridBatchAPI] 📦 Потоковый анализ {len(request_data.chunks)} чанков, adaptive={adaptive_batching}")
+    
+    if not openai_service or not openai_service.is_available:
+        raise HTTPException(status_code=503, detail="OpenAI service not available")
+    
+    _check_openai_overload()
+    
+    async def generate():
+        try:
+            async for result in analyzer.analyze_batch_iter(
+                chunks=request_data.chunks,
+                topic=request_data.topic,
+                max_concurrent=request_data.max_parallel or 5,
+                adaptive_batching=adaptive_batching,
+                rate_limiter=openai_rpm_limiter,
+                token_limiter=openai_tpm_limiter,
+                global_semaphore=_openai_semaphore
+            ):
+                yield _to_chunk_response(result).model_dump_json() + "\n"
+        except Exception as e:
+            # Заголовки уже отправлены - сообщаем об ошибке последней строкой потока
+            logger.error(f"[HybridBatchAPI] Ошибка потокового анализа: {e}", exc_info=True)
+            yield json.dumps({"error": f"Hybrid stream error: {str(e)[:100]}"}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 
 @router.get("/stats", tags=["Hybrid Semantic Analysis"])
@@ -264,10 +404,9 @@ async def get_hybrid_stats(
         }
     
     try:
-        # Создаем временный анализатор для получения статистики
-        analyzer = HybridSemanticAnalyzer(api_key=settings.OPENAI_API_KEY)
+        # Статистика общего анализатора (накапливается между запросами)
+        analyzer = _get_cached_analyzer(prefer_realtime=True)
         stats = await analyzer.get_statistics()
-        await analyzer.close()
         
         return {
             "status": "available",
@@ -275,8 +414,10 @@ async def get_hybrid_stats(
                 "available": stats["realtime_available"],
                 "failures": stats["realtime_failures"],
                 "successes": stats["realtime_successes"],
-                "last_failure": stats["last_failure"]
+                "last_failure": stats["last_failure"],
+                "circuit_breaker": stats["breaker_state"]
             },
+            "result_cache": _result_cache.stats(),
             "recommendation": (
                 "Realtime API работает нормально" 
                 if stats["realtime_available"] 
@@ -4,29 +4,226 @@
 """
 
 from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import JSONResponse, Response
+import asyncio
 import logging
-from typing import List
+from functools import partial
+from typing import List, Optional, Dict, Any, Tuple, Set
 
 from api.models import (
     ChunkSemanticRequest,
     ChunkSemanticResponse,
+    ChunkSemanticMetrics,
     OptimizedBatchSemanticRequest,
     OptimizedSemanticResponse,
     ChunkBoundary
 )
 from services.openai_service import OpenAIService, get_openai_service
 from analysis.semantic_function_optimized import OptimizedSemanticAnalyzer
+from utils.lru_cache import BoundedLRUCache
+from utils.text_processing import text_fingerprint
 from config import settings
 
+try:
+    import orjson # type: ignore # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    DefaultJSONResponse = JSONResponse # Fallback на стандартный json
+
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/v2/optimized", tags=["Optimized Semantic Analysis"])
+router = APIRouter(prefix="/api/v2/optimized", tags=["Optimized Semantic Analysis"], default_response_class=DefaultJSONResponse)
+
+# Общий анализатор на время жизни воркера (переиспользует пул соединений AsyncOpenAI)
+_optimized_analyzer: Optional[OptimizedSemanticAnalyzer] = None
+
+# Таймаут прогрева соединения с OpenAI при старте
+WARMUP_TIMEOUT = 3.0
+
+# LRU-кэш успешных результатов анализа одного чанка:
+# (отпечаток full_text, нормализованный текст чанка, тема) -> результат.
+# Оптимизированный анализ учитывает контекст документа, поэтому отпечаток full_text входит в ключ.
+RESULT_CACHE_SIZE = 4096
+_result_cache: "BoundedLRUCache[Tuple[str, str, str], Dict[str, Any]]" = BoundedLRUCache(RESULT_CACHE_SIZE)
+
+# Запросы анализа одного чанка, выполняющиеся прямо сейчас:
+# (отпечаток full_text, chunk_text, topic) -> задача с общим вызовом.
+# Одинаковые параллельные запросы редактора ждут уже идущий вызов вместо нового запроса к OpenAI.
+_inflight: Dict[Tuple[str, str, str], "asyncio.Task[Dict[str, Any]]"] = {}
+
+# Микро-батчинг одиночных запросов: чанки одного документа и темы, пришедшие в пределах
+# MICRO_BATCH_WINDOW секунд, анализируются одним вызовом analyze_batch_optimized.
+# (отпечаток full_text, тема) -> [(chunk_id, start, end, future), ...]
+MICRO_BATCH_WINDOW = 0.05
+MICRO_BATCH_MAX_SIZE = 25
+_micro_batches: Dict[Tuple[str, str], List[Tuple[str, int, int, "asyncio.Future[Dict[str, Any]]"]]] = {}
+_micro_batch_timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+_micro_batch_tasks: Set["asyncio.Task[None]"] = set() # Ссылки на фоновые задачи, чтобы их не собрал GC
+
+
+def get_optimized_analyzer() -> OptimizedSemanticAnalyzer:
+    """Зависимость FastAPI: общий OptimizedSemanticAnalyzer, создается при первом обращении."""
+    global _optimized_analyzer
+    if _optimized_analyzer is None:
+        _optimized_analyzer = OptimizedSemanticAnalyzer(api_key=settings.OPENAI_API_KEY)
+        logger.info("[OptimizedAPI] Создан общий анализатор")
+    return _optimized_analyzer
+
+
+async def _warmup_optimized_analyzer() -> None:
+    """Дешевый запрос models.list(), чтобы TLS-сессия к OpenAI была готова до первого запроса."""
+    try:
+        analyzer = get_optimized_analyzer()
+        await asyncio.wait_for(analyzer.client.models.list(), timeout=WARMUP_TIMEOUT)
+        logger.info("[OptimizedAPI] Соединение с OpenAI прогрето")
+    except Exception as e:
+        logger.warning(f"[OptimizedAPI] Прогрев соединения с OpenAI не удался: {e}")
+
+
+async def startup_optimized_routes() -> None:
+    """Прогрев анализатора при старте приложения (вызывается из lifespan в main)."""
+    if settings.ENABLE_SEMANTIC_ANALYSIS and settings.OPENAI_API_KEY:
+        # Fire-and-forget: старт приложения не ждет прогрева
+        asyncio.create_task(_warmup_optimized_analyzer())
+
+
+async def shutdown_optimized_routes() -> None:
+    """Закрытие клиента общего анализатора при остановке приложения (вызывается из lifespan в main)."""
+    global _optimized_analyzer
+    if _optimized_analyzer is not None:
+        try:
+            await _optimized_analyzer.client.close()
+        except Exception as e:
+            logger.error(f"[OptimizedAPI] Ошибка при закрытии клиента OpenAI: {e}")
+        _optimized_analyzer = None
+
+
+async def _run_micro_batch(
+    batch: List[Tuple[str, int, int, "asyncio.Future[Dict[str, Any]]"]],
+    analyzer: OptimizedSemanticAnalyzer,
+    full_text: str,
+    topic: str
+) -> None:
+    """Выполняет накопленный микро-батч и раздает результаты ожидающим запросам."""
+    error: Exception = ValueError("Микро-батч не вернул результат для чанка")
+    try:
+        if len(batch) == 1:
+            # Одиночный запрос - обычный промпт для одного чанка
+            chunk_id, start, end, _ = batch[0]
+            results = [await analyzer.analyze_single_chunk(
+                chunk_id=chunk_id,
+                chunk_text=full_text[start:end],
+                full_text=full_text,
+                topic=topic
+            )]
+        else:
+            logger.info(f"[OptimizedAPI] Микро-батч: {len(batch)} одиночных запросов объединены в один вызов")
+            results = await analyzer.analyze_batch_optimized(
+                full_text=full_text,
+                chunk_boundaries=[(start, end) for _, start, end, _ in batch],
+                chunk_ids=[chunk_id for chunk_id, _, _, _ in batch],
+                topic=topic
+            )
+        for (_, _, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    except asyncio.CancelledError:
+        error = RuntimeError("Микро-батч отменен")
+        raise
+    except Exception as e:
+        error = e
+    finally:
+        # Ожидающие запросы завершаются в любом случае, в том числе при отмене задачи на остановке
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+                future.exception() # Помечаем исключение как полученное, если ожидающих нет
+
+
+def _flush_micro_batch(key: Tuple[str, str], analyzer: OptimizedSemanticAnalyzer, full_text: str, topic: str) -> None:
+    """Забирает накопленный микро-батч и запускает его в фоновой задаче."""
+    timer = _micro_batch_timers.pop(key, None)
+    if timer is not None:
+        timer.cancel()
+    batch = _micro_batches.pop(key, None)
+    if batch:
+        task = asyncio.get_running_loop().create_task(_run_micro_batch(batch, analyzer, full_text, topic))
+        _micro_batch_tasks.add(task)
+        task.add_done_callback(_micro_batch_tasks.discard)
+
+
+async def _submit_micro_batch(
+    analyzer: OptimizedSemanticAnalyzer,
+    chunk_id: str,
+    chunk_text: str,
+    full_text: str,
+    topic: str
+) -> Dict[str, Any]:
+    """Ставит чанк в микро-батч своего документа и ждет его результат."""
+    start = full_text.find(chunk_text)
+    if start < 0 or full_text.find(chunk_text, start + 1) >= 0:
+        # Чанк не найден в тексте документа или встречается в нем несколько раз - запрос не содержит
+        # смещений, и однозначные границы не построить, поэтому анализируем отдельно
+        return await analyzer.analyze_single_chunk(
+            chunk_id=chunk_id,
+            chunk_text=chunk_text,
+            full_text=full_text,
+            topic=topic
+        )
+
+    key = (text_fingerprint(full_text), topic)
+    loop = asyncio.get_running_loop()
+    future: "asyncio.Future[Dict[str, Any]]" = loop.create_future()
+    batch = _micro_batches.setdefault(key, [])
+    batch.append((chunk_id, start, start + len(chunk_text), future))
+    if len(batch) == 1:
+        _micro_batch_timers[key] = loop.call_later(MICRO_BATCH_WINDOW, _flush_micro_batch, key, analyzer, full_text, topic)
+    elif len(batch) >= MICRO_BATCH_MAX_SIZE:
+        _flush_micro_batch(key, analyzer, full_text, topic)
+    return await asyncio.shield(future)
+
+
+def _inflight_done(key: Tuple[str, str, str], task: "asyncio.Task[Dict[str, Any]]") -> None:
+    """Снимает завершенный общий вызов из _inflight."""
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception() # Помечаем исключение как полученное, если все ожидающие ушли
+
+
+async def _analyze_single_coalesced(
+    analyzer: OptimizedSemanticAnalyzer,
+    chunk_id: str,
+    chunk_text: str,
+    full_text: str,
+    topic: str
+) -> Dict[str, Any]:
+    """Анализирует чанк, объединяя одинаковые одновременные запросы в один вызов API."""
+    key = (text_fingerprint(full_text), chunk_text, topic)
+    task = _inflight.get(key)
+    if task is not None:
+        logger.info(f"[OptimizedAPI] Чанк {chunk_id}: ожидаем идентичный запрос, уже выполняющийся")
+    else:
+        # Общий вызов живет в своей задаче, а не в корутине первого клиента:
+        # его отключение не должно отменять результат для остальных ожидающих
+        task = asyncio.get_running_loop().create_task(_submit_micro_batch(
+            analyzer,
+            chunk_id=chunk_id,
+            chunk_text=chunk_text,
+            full_text=full_text,
+            topic=topic
+        ))
+        _inflight[key] = task
+        task.add_done_callback(partial(_inflight_done, key))
+    # shield: отмена любого из клиентов (включая первого) не отменяет общую задачу
+    return await asyncio.shield(task)
 
 
 @router.post("/semantic/batch", response_model=OptimizedSemanticResponse)
 async def analyze_batch_optimized(
     request_data: OptimizedBatchSemanticRequest = Body(...),
+    analyzer: OptimizedSemanticAnalyzer = Depends(get_optimized_analyzer),
     openai_service: OpenAIService = Depends(get_openai_service)
-) -> OptimizedSemanticResponse:
+) -> Response:
     """
     Оптимизированный пакетный семантический анализ.
     
@@ -50,9 +247,10 @@ async def analyze_batch_optimized(
     }
     ```
     """
+    full_text_len = len(request_data.full_text)
     logger.info(
-        f"[OptimizedAPI] Пакетный анализ {len(request_data.chunk_boundaries)} чанков, "
-        f"текст: {len(request_data.full_text)} символов"
+        "[OptimizedAPI] Пакетный анализ %d чанков, текст: %d символов",
+        len(request_data.chunk_boundaries), full_text_len
     )
     
     if not openai_service or not openai_service.is_available:
@@ -62,12 +260,14 @@ async def analyze_batch_optimized(
         )
     
     try:
-        # Создаем анализатор
-        analyzer = OptimizedSemanticAnalyzer(api_key=settings.OPENAI_API_KEY)
-        
-        # Подготавливаем данные
-        chunk_ids = [cb.chunk_id for cb in request_data.chunk_boundaries]
-        boundaries = [(cb.start, cb.end) for cb in request_data.chunk_boundaries]
+        # Подготавливаем данные за один проход по границам.
+        # Срезы текста не материализуем: анализатору нужен full_text для промпта
+        # и только короткие превью диапазонов, которые он берет сам.
+        chunk_ids = []
+        boundaries = []
+        for cb in request_data.chunk_boundaries:
+            chunk_ids.append(cb.chunk_id)
+            boundaries.append((cb.start, cb.end))
         
         # Анализируем
         results = await analyzer.analyze_batch_optimized(
@@ -87,37 +287,40 @@ async def analyze_batch_optimized(
             if result.get("semantic_error"):
                 failed.append(chunk_id)
             
-            response_results.append(ChunkSemanticResponse(
+            # Данные сформированы сервером - пропускаем валидацию pydantic
+            response_results.append(ChunkSemanticResponse.model_construct(
                 chunk_id=chunk_id,
-                metrics={
-                    "semantic_function": result.get("semantic_function", "шум"),
-                    "semantic_method": result.get("semantic_method", "optimized"),
-                    "semantic_error": result.get("semantic_error")
-                }
+                metrics=ChunkSemanticMetrics.model_construct(
+                    semantic_function=result.get("semantic_function", "шум"),
+                    semantic_method=result.get("semantic_method", "optimized"),
+                    semantic_error=result.get("semantic_error")
+                )
             ))
         
         # Оценка экономии токенов
         # Старый метод: (полный_текст + промпт) * количество_чанков
         # Новый метод: полный_текст + промпт + границы
-        old_tokens = len(request_data.full_text) * len(chunk_ids) // 4  # ~4 символа на токен
-        new_tokens = len(request_data.full_text) // 4 + 500  # текст + промпт
-        tokens_saved = max(0, old_tokens - new_tokens)
+        # (old - new) = text_tokens * (N - 1) - 500, без промежуточного произведения на весь документ
+        chunk_count = len(chunk_ids)
+        text_tokens = full_text_len >> 2  # ~4 символа на токен
+        tokens_saved = max(0, text_tokens * (chunk_count - 1) - 500)  # 500 - промпт
         
         # Количество запросов
-        requests_count = (len(chunk_ids) + 49) // 50  # До 50 чанков за запрос
+        requests_count = (chunk_count + 49) // 50  # До 50 чанков за запрос
         
         logger.info(
-            f"[OptimizedAPI] ✅ Анализ завершен: {len(response_results)} результатов, "
-            f"{len(failed)} ошибок, ~{tokens_saved} токенов сэкономлено, "
-            f"{requests_count} запросов вместо {len(chunk_ids)}"
+            "[OptimizedAPI] ✅ Анализ завершен: %d результатов, %d ошибок, ~%d токенов сэкономлено, %d запросов вместо %d",
+            len(response_results), len(failed), tokens_saved, requests_count, chunk_count
         )
         
-        return OptimizedSemanticResponse(
+        # Сериализуем один раз, минуя повторную валидацию response_model в FastAPI
+        payload = OptimizedSemanticResponse.model_construct(
             results=response_results,
             method="optimized_batch",
             requests_count=requests_count,
             tokens_saved=tokens_saved
         )
+        return Response(content=payload.model_dump_json(), media_type="application/json")
         
     except Exception as e:
         logger.error(f"[OptimizedAPI] Ошибка анализа: {e}", exc_info=True)
@@ -130,6 +333,7 @@ async def analyze_batch_optimized(
 @router.post("/semantic/single", response_model=ChunkSemanticResponse)
 async def analyze_single_optimized(
     request_data: ChunkSemanticRequest = Body(...),
+    analyzer: OptimizedSemanticAnalyzer = Depends(get_optimized_analyzer),
     openai_service: OpenAIService = Depends(get_openai_service)
 ) -> ChunkSemanticResponse:
     """
@@ -149,25 +353,39 @@ async def analyze_single_optimized(
             }
         )
     
+    cache_key = (
+        text_fingerprint(request_data.full_text),
+        " ".join(request_data.chunk_text.split()),
+        request_data.topic
+    )
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"[OptimizedAPI] Чанк {request_data.chunk_id}: результат из кэша")
+        return ChunkSemanticResponse(chunk_id=request_data.chunk_id, metrics=dict(cached))
+    
     try:
-        # Создаем анализатор
-        analyzer = OptimizedSemanticAnalyzer(api_key=settings.OPENAI_API_KEY)
-        
-        # Анализируем
-        result = await analyzer.analyze_single_chunk(
+        # Анализируем (идентичные одновременные запросы объединяются)
+        result = await _analyze_single_coalesced(
+            analyzer,
             chunk_id=request_data.chunk_id,
             chunk_text=request_data.chunk_text,
             full_text=request_data.full_text,
             topic=request_data.topic
         )
         
+        metrics = {
+            "semantic_function": result.get("semantic_function", "шум"),
+            "semantic_method": result.get("semantic_method", "optimized_single"),
+            "semantic_error": result.get("semantic_error")
+        }
+        
+        # Кэшируем только успешную классификацию
+        if not metrics["semantic_error"]:
+            _result_cache.put(cache_key, {**metrics, "semantic_method": "optimized_single_cached"})
+        
         return ChunkSemanticResponse(
             chunk_id=request_data.chunk_id,
-            metrics={
-                "semantic_function": result.get("semantic_function", "шум"),
-                "semantic_method": result.get("semantic_method", "optimized_single"),
-                "semantic_error": result.get("semantic_error")
-            }
+            metrics=metrics
         )
         
     except Exception as e:
@@ -196,6 +414,7 @@ async def get_optimization_stats() -> dict:
             "rate_limit_reduction": "В N раз меньше запросов (N = количество чанков)",
             "max_chunks_per_request": 50
         },
+        "result_cache": _result_cache.stats(),
         "recommendations": {
             "small_docs": "1-10 чанков: минимальная выгода",
             "medium_docs": "10-50 чанков: существенная экономия",
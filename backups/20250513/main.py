@@ -9,6 +9,7 @@ from dotenv import load_dotenv
 import pandas as pd
 import numpy as np # Не использовался явно, но может быть нужен зависимостям
 import time # Добавляем импорт time
+from concurrent.futures import ThreadPoolExecutor
 # from flask import Flask, request, render_template_string, redirect, url_for, flash, session # Убрано
 # import io # To read file content from upload # Убрано
 
@@ -21,6 +22,13 @@ import config
 from utils.file_operations import load_text, save_results_to_csv
 from utils.text_processing import split_into_paragraphs
 
+# Arrow-строки для колонки text, если установлен pyarrow; иначе обычный строковый dtype pandas
+try:
+    import pyarrow # noqa: F401
+    TEXT_DTYPE = "string[pyarrow]"
+except ImportError:
+    TEXT_DTYPE = "string"
+
 # --- Constants --- Убрано
 # UPLOAD_FOLDER = 'data'
 # ALLOWED_EXTENSIONS = {'txt', 'md'}
@@ -51,6 +59,49 @@ def setup_logging():
 # ---------------------
 
 # --- Analysis Logic ---
+# Обертки модулей анализа для параллельного запуска в run_analysis.
+# Каждая возвращает (DataFrame модуля, список добавленных колонок, текст ошибки или None).
+
+def _run_readability(df):
+    logging.info("Анализ читаемости...")
+    columns = ['lix', 'smog', 'complexity']
+    try:
+        df = readability.analyze_readability_batch(df)
+        logging.info("Модуль читаемости успешно отработал.")
+        return df, columns, None
+    except Exception as e:
+        logging.error(f"Ошибка в модуле читаемости: {e}", exc_info=True)
+        for column in columns:
+            df[column] = pd.NA
+        return df, columns, f"Читаемость: {e}"
+
+def _run_signal_strength(df, topic):
+    logging.info("Анализ сигнальности...")
+    start_time_signal = time.time() # Замеряем время начала
+    try:
+        df = signal_strength.analyze_signal_strength_batch(df, topic)
+        duration_signal = time.time() - start_time_signal
+        logging.info(f"Модуль сигнальности успешно отработал за {duration_signal:.2f} секунд.")
+        return df, ['signal_strength'], None
+    except Exception as e:
+        duration_signal = time.time() - start_time_signal # Замеряем время даже при ошибке
+        logging.error(f"Ошибка в модуле сигнальности (время выполнения: {duration_signal:.2f} сек): {e}", exc_info=True)
+        df['signal_strength'] = pd.NA
+        return df, ['signal_strength'], f"Сигнальность: {e}"
+
+def _run_semantic_function(df, topic):
+    logging.info("Анализ семантической функции...")
+    columns = ['semantic_function', 'semantic_method']
+    try:
+        df = semantic_function.analyze_semantic_function_batch(df, topic, openai_client)
+        logging.info("Модуль семантической функции успешно отработал.")
+        return df, columns, None
+    except Exception as e:
+        logging.error(f"Ошибка в модуле семантической функции: {e}", exc_info=True)
+        df['semantic_function'] = 'module_error'
+        df['semantic_method'] = 'error'
+        return df, columns, f"Семантическая функция: {e}"
+
 # Меняем аргумент функции с text_content на input_filepath и topic
 def run_analysis(input_filepath, topic):
     """Запускает полный цикл анализа для файла."""
@@ -82,50 +133,36 @@ def run_analysis(input_filepath, topic):
              print("Предупреждение: Текст пуст или не удалось разбить на параграфы.")
              return None
 
+        # RangeIndex не материализует список id, а arrow-строки хранятся одним буфером
+        # вместо массива PyObject. Колонку paragraph_id сохраняем - ее ждут карточки и CSV.
+        paragraph_ids = pd.RangeIndex(len(paragraphs), name='paragraph_id')
         df = pd.DataFrame({
-            'paragraph_id': range(len(paragraphs)),
-            'text': paragraphs
-        })
+            'paragraph_id': paragraph_ids,
+            'text': pd.array(paragraphs, dtype=TEXT_DTYPE)
+        }, index=paragraph_ids)
 
         # 3. Анализ (пакетная обработка)
+        # Модули независимы: читаемость и сигнальность считаются локально (torch отпускает GIL),
+        # семантика ждет OpenAI. Запускаем их параллельно в потоках, каждый на своей копии df,
+        # и затем собираем колонки. Общее время - максимум из трех, а не сумма.
         modules_failed = []
 
-        logging.info("Анализ читаемости...")
-        try:
-            df = readability.analyze_readability_batch(df)
-            logging.info("Модуль читаемости успешно отработал.")
-        except Exception as e:
-            logging.error(f"Ошибка в модуле читаемости: {e}", exc_info=True)
-            df['lix'] = pd.NA
-            df['smog'] = pd.NA
-            df['complexity'] = pd.NA
-            modules_failed.append(f"Читаемость: {e}")
-
-        logging.info("Анализ сигнальности...")
-        start_time_signal = time.time() # Замеряем время начала
-        try:
-            df = signal_strength.analyze_signal_strength_batch(df, topic)
-            end_time_signal = time.time() # Замеряем время окончания
-            duration_signal = end_time_signal - start_time_signal
-            logging.info(f"Модуль сигнальности успешно отработал за {duration_signal:.2f} секунд.")
-        except Exception as e:
-            end_time_signal = time.time() # Замеряем время окончания даже при ошибке
-            duration_signal = end_time_signal - start_time_signal
-            logging.error(f"Ошибка в модуле сигнальности (время выполнения: {duration_signal:.2f} сек): {e}", exc_info=True)
-            df['signal_strength'] = pd.NA
-            modules_failed.append(f"Сигнальность: {e}")
-
-        logging.info("Анализ семантической функции...")
-        try:
-            # Убираем аргумент text_content, он больше не нужен
-            # df = semantic_function.analyze_semantic_function_batch(df, topic, text_content, openai_client) # Старый вызов
-            df = semantic_function.analyze_semantic_function_batch(df, topic, openai_client) # Новый вызов
-            logging.info("Модуль семантической функции успешно отработал.")
-        except Exception as e:
-            logging.error(f"Ошибка в модуле семантической функции: {e}", exc_info=True)
-            df['semantic_function'] = 'module_error'
-            df['semantic_method'] = 'error'
-            modules_failed.append(f"Семантическая функция: {e}")
+        logging.info("Параллельный анализ: читаемость, сигнальность, семантическая функция...")
+        analysis_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            future_readability = executor.submit(_run_readability, df.copy())
+            future_signal = executor.submit(_run_signal_strength, df.copy(), topic)
+            future_semantic = executor.submit(_run_semantic_function, df.copy(), topic)
+            module_results = [future_readability.result(), future_signal.result(), future_semantic.result()]
+        logging.getLogger("performance").info(
+            "Анализ %d параграфов (параллельно 3 модуля): %.2f сек", len(paragraphs), time.perf_counter() - analysis_start
+        )
+
+        for module_df, new_columns, error in module_results:
+            for column in new_columns:
+                df[column] = module_df[column].values
+            if error:
+                modules_failed.append(error)
 
         if modules_failed:
             logging.warning(f"Во время анализа произошли ошибки в модулях: {'; '.join(modules_failed)}")
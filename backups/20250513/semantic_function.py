@@ -12,13 +12,21 @@
 - analyze_semantic_function_local: анализ одного параграфа локальной моделью.
 - analyze_semantic_function_local_batch: пакетный анализ локальной моделью.
 - analyze_semantic_function_api_batch: пакетный анализ через OpenAI API.
+- analyze_semantic_function_api_batch_async: параллельные запросы к API по группам параграфов.
 - analyze_semantic_function_batch: комбинированный анализ (оркестратор).
 """
 
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Tuple, Sequence
+import asyncio
+import functools
 import logging
+import os
+import random
 import re
+import sys
+import threading
 import torch
+import numpy as np
 import pandas as pd
 import hashlib
 
@@ -29,10 +37,23 @@ logging.getLogger("httpcore").setLevel(logging.ERROR)
 
 # Подключаем Transformers для локальной модели
 try:
-    from transformers import pipeline
+    from transformers import pipeline, AutoTokenizer
 except ImportError:
     logging.error("Библиотека transformers не установлена. Локальная модель будет недоступна.")
     pipeline = None
+    AutoTokenizer = None
+
+# Подключаем diskcache для персистентного кеша локального анализа (опционально)
+try:
+    import diskcache # type: ignore
+except ImportError:
+    diskcache = None
+
+# Подключаем xxhash для ключей кеша (опционально, иначе hashlib.blake2b)
+try:
+    import xxhash # type: ignore
+except ImportError:
+    xxhash = None
 
 # Подключаем OpenAI для API
 try:
@@ -44,6 +65,9 @@ except ImportError:
     RateLimitError = Exception # type: ignore
     APIStatusError = Exception # type: ignore
 
+# Асинхронный клиент с общими настройками пула соединений (keep-alive, HTTP/2 при наличии h2)
+from utils.openai_client import create_async_client
+
 # -----------------------------------------------------------------------------
 # Константы и настройки (согласно документации)
 # -----------------------------------------------------------------------------
@@ -54,6 +78,21 @@ except ImportError:
 MODEL_NAME_LOCAL = "MoritzLaurer/mDeBERTa-v3-base-xnli-multilingual-nli-2mil7" # Альтернативная мультиязычная base модель
 LOCAL_SCORE_THRESHOLD = 0.5 # Порог для включения метки в топ-3
 LOCAL_TOP_N = 4             # Количество лучших меток для вывода
+LOCAL_BATCH_SIZE = 16       # Размер батча для пакетного вызова zero-shot pipeline
+# Лимит длины пары (параграф + гипотеза) в токенах для прямого прохода: ограничивает худший
+# случай по вычислениям; обрезается только параграф
+LOCAL_MAX_INPUT_TOKENS = 256
+# Шаблон гипотезы, который zero-shot pipeline применяет по умолчанию; прямой проход модели
+# использует тот же шаблон, чтобы скоры совпадали с pipeline
+LOCAL_HYPOTHESIS_TEMPLATE = "This example is {}."
+# Тип весов локальной модели: "auto" - bf16/fp16 на GPU и fp32 на CPU, либо явно "float32"/"float16"/"bfloat16"
+LOCAL_DTYPE = "auto"
+# Динамическая int8-квантизация линейных слоев на CPU (torch.ao.quantization, без доп. зависимостей)
+LOCAL_INT8_CPU = True
+# torch.compile (Inductor) для локальной модели на GPU; требует PyTorch 2.x
+LOCAL_TORCH_COMPILE = True
+# Загружать локальный классификатор при импорте модуля (иначе - при первом fallback на локальный анализ)
+PRELOAD_LOCAL_CLASSIFIER = os.getenv("PRELOAD_LOCAL_CLASSIFIER", "false").lower() == "true"
 
 # Словарь семантических меток и их синонимов для локальной модели
 # Плейсхолдер <ТЕМА> будет заменен на реальную тему
@@ -97,11 +136,27 @@ LABEL_SYNONYMS_LOCAL = {
 # Плейсхолдер темы для локального анализа
 LOCAL_TOPIC_PLACEHOLDER = "<ТЕМА>"
 
+# Кеш результатов локального анализа на диске (переживает перезапуск), если установлен diskcache
+LOCAL_CACHE_DIR = os.getenv("LOCAL_CACHE_DIR", os.path.join("data", "cache", "semantic_local"))
+LOCAL_CACHE_SIZE_LIMIT = 256 * 1024 * 1024 # Байт; diskcache вытесняет старые записи сверх лимита
+# Все настройки, от которых зависят скоры локальной модели: при смене любой из них
+# персистентный кеш не возвращает результаты, посчитанные с прежними настройками
+_CACHE_KEY_MODEL_SUFFIX = "\x00".join(
+    ["", MODEL_NAME_LOCAL, LOCAL_DTYPE, f"int8={LOCAL_INT8_CPU}", f"max_tokens={LOCAL_MAX_INPUT_TOKENS}"]
+).encode()
+
+# Возможные значения колонки semantic_method (категории)
+SEMANTIC_METHODS = ['api', 'local_fallback', 'error']
+
 # -- API Метод (Основной) --
 API_MODEL_NAME = "gpt-4o" # Предпочтительно, но можно заменить на gpt-4-turbo, если 4o недоступен
 API_TEMPERATURE = 0.3
 API_MAX_TOKENS_PER_REQUEST = 4000 # Устанавливаем разумный лимит для всего ответа API (с запасом)
 API_TOKENS_PER_PARAGRAPH_ESTIMATE = 40 # Грубая оценка для расчета общего лимита
+API_MAX_PARAGRAPH_CHARS = 1500 # Длинные параграфы обрезаются в промпте, чтобы не упираться в лимит токенов
+API_PARAGRAPHS_PER_REQUEST = 25 # Параграфов в одном запросе; запросы по группам идут параллельно
+API_RATE_LIMIT_RETRIES = 3 # Попыток на группу при RateLimitError (экспоненциальная пауза с джиттером)
+API_MAX_CONCURRENT_REQUESTS = 3 # Одновременных запросов групп к API
 
 API_PARAMS = {
     "model": API_MODEL_NAME,
@@ -137,20 +192,94 @@ API_TOPIC_LABELS = [
 ]
 API_TOPIC_PLACEHOLDER = "<ТЕМА>" # Плейсхолдер в промпте API
 
+# Паттерн строки ответа GPT: N. Метка (возможно с пробелами, может включать '/')
+_GPT_LINE_RE = re.compile(r"^\s*(\d+)\.?\s*(.+?)\s*$")
+_VALID_API_LABELS_SET = frozenset(API_LABELS)
+
 # -----------------------------------------------------------------------------
 # Глобальные переменные и кеши
 # -----------------------------------------------------------------------------
 
 local_classifier = None
-GLOBAL_RESULT_CACHE = {} # Кеш для локального анализа {cache_key: result_string}
+local_tokenizer = None # Общий на процесс быстрый токенизатор (его же использует pipeline)
+_local_classifier_lock = threading.Lock()
+_local_classifier_load_attempted = False
+local_entailment_id: Optional[int] = None    # Индексы классов NLI-модели для прямого прохода
+local_contradiction_id: Optional[int] = None
+_result_cache = None # Кеш для локального анализа {cache_key: result_string}, открывается при первом обращении
+_result_cache_lock = threading.Lock()
+
+def _open_result_cache():
+    """Открывает дисковый кеш локального анализа; без diskcache или при ошибке - обычный dict."""
+    if diskcache is None:
+        logging.info("Библиотека diskcache не установлена. Кеш локального анализа хранится в памяти.")
+        return {}
+    try:
+        return diskcache.Cache(LOCAL_CACHE_DIR, size_limit=LOCAL_CACHE_SIZE_LIMIT)
+    except Exception as e:
+        logging.warning(f"Не удалось открыть дисковый кеш '{LOCAL_CACHE_DIR}': {e}. Используется кеш в памяти.")
+        return {}
+
+def _get_result_cache():
+    """
+    Ленивое открытие кеша локального анализа, как и загрузка классификатора:
+    импорт модуля не создает каталог LOCAL_CACHE_DIR.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = _open_result_cache()
+    return _result_cache
 
 # -----------------------------------------------------------------------------
 # Загрузка моделей и классификаторов
 # -----------------------------------------------------------------------------
 
+def _resolve_local_dtype(device_id: int) -> torch.dtype:
+    """
+    Выбирает тип весов для локальной модели по LOCAL_DTYPE.
+    В режиме "auto" на GPU используется bf16 (если поддерживается) или fp16 - вдвое меньше
+    памяти и тензорные ядра; на CPU половинная точность медленнее, поэтому остается fp32.
+    """
+    if LOCAL_DTYPE != "auto":
+        return getattr(torch, LOCAL_DTYPE)
+    if device_id < 0:
+        return torch.float32
+    return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+def _quantize_local_model_int8() -> None:
+    """
+    Квантизует веса линейных слоев локальной модели в int8 (динамическая квантизация).
+    На CPU NLI упирается в пропускную способность памяти, int8 веса вчетверо меньше fp32.
+    При ошибке остается исходная модель.
+    """
+    try:
+        local_classifier.model = torch.ao.quantization.quantize_dynamic(
+            local_classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        logging.info("Локальная модель квантизована в int8 (динамическая квантизация Linear).")
+    except Exception as e:
+        logging.warning(f"Не удалось квантизовать локальную модель в int8: {e}. Используется fp32.")
+
+def _compile_local_model() -> None:
+    """
+    Компилирует локальную модель через torch.compile: слитые ядра и меньше Python-накладных
+    расходов на маленьких батчах. dynamic=True - длина токенизированного входа меняется
+    от батча к батчу, без него каждая новая форма вызывала бы перекомпиляцию.
+    """
+    if not hasattr(torch, "compile"):
+        logging.info("torch.compile недоступен (PyTorch < 2.0), локальная модель не компилируется.")
+        return
+    try:
+        local_classifier.model = torch.compile(local_classifier.model, mode="reduce-overhead", dynamic=True)
+        logging.info("Локальная модель обернута в torch.compile (reduce-overhead, dynamic).")
+    except Exception as e:
+        logging.warning(f"Не удалось скомпилировать локальную модель: {e}. Используется исходная модель.")
+
 def load_local_classifier() -> None:
     """Загружает локальный zero-shot классификатор."""
-    global local_classifier
+    global local_classifier, local_tokenizer, local_entailment_id, local_contradiction_id
     
     if local_classifier is not None:
         logging.debug("Локальный классификатор уже загружен.")
@@ -167,19 +296,52 @@ def load_local_classifier() -> None:
         
         logging.info(f"Загрузка локального классификатора '{MODEL_NAME_LOCAL}' на {device_name}...")
         
+        torch_dtype = _resolve_local_dtype(device_id)
+        local_tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME_LOCAL, use_fast=True)
         local_classifier = pipeline(
             "zero-shot-classification",
             model=MODEL_NAME_LOCAL,
-            device=device_id
+            tokenizer=local_tokenizer,
+            device=device_id,
+            model_kwargs={"torch_dtype": torch_dtype}
         )
         
-        logging.info(f"Локальный классификатор '{MODEL_NAME_LOCAL}' успешно загружен на {device_name}.")
+        if device_id < 0 and LOCAL_INT8_CPU:
+            _quantize_local_model_int8()
+        elif device_id >= 0 and LOCAL_TORCH_COMPILE:
+            _compile_local_model()
+        
+        logging.info(f"Локальный классификатор '{MODEL_NAME_LOCAL}' успешно загружен на {device_name} ({torch_dtype}).")
+        # Индексы entailment/contradiction для прямого прохода модели (_nli_batch)
+        for label, label_id in local_classifier.model.config.label2id.items():
+            if label.lower().startswith("entail"):
+                local_entailment_id = label_id
+            elif label.lower().startswith("contra"):
+                local_contradiction_id = label_id
     except Exception as e:
         logging.error(f"Ошибка загрузки локального классификатора '{MODEL_NAME_LOCAL}': {e}", exc_info=True)
         local_classifier = None # Убедимся, что он None в случае ошибки
+        local_tokenizer = None
+
+def _ensure_local_classifier() -> bool:
+    """
+    Ленивая загрузка классификатора при первом обращении к локальному анализу.
+    Загрузка выполняется один раз (в том числе неудачная) и защищена блокировкой,
+    т.к. анализ может вызываться из рабочих потоков.
+    """
+    global _local_classifier_load_attempted
+    if local_classifier is not None:
+        return True
+    with _local_classifier_lock:
+        if local_classifier is None and not _local_classifier_load_attempted:
+            _local_classifier_load_attempted = True
+            load_local_classifier()
+    return local_classifier is not None
 
-# Загружаем классификатор при импорте модуля
-load_local_classifier()
+# Загружаем классификатор при импорте модуля только при явной предзагрузке:
+# для развертываний, где работает API, модель (~1 ГБ) не нужна
+if PRELOAD_LOCAL_CLASSIFIER:
+    load_local_classifier()
 
 # -----------------------------------------------------------------------------
 # Вспомогательные функции
@@ -187,65 +349,71 @@ load_local_classifier()
 
 def get_cache_key(text: str, topic: str) -> str:
     """Создает уникальный ключ кеша для локального анализа."""
-    # Используем хеш для предотвращения слишком длинных ключей
-    text_hash = hashlib.md5(text.encode()).hexdigest()
-    topic_hash = hashlib.md5(topic.encode()).hexdigest()
-    key = f"local_{text_hash[:16]}_{topic_hash[:16]}"
-    return key
+    # Один некриптографический хеш (xxh3_128, если установлен xxhash, иначе blake2b) по тексту,
+    # теме и модели: смена модели не возвращает устаревшие результаты из персистентного кеша
+    hasher = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    hasher.update(text.encode())
+    hasher.update(b"\x00")
+    hasher.update(topic.encode())
+    hasher.update(_CACHE_KEY_MODEL_SUFFIX)
+    return f"local_{hasher.hexdigest()}"
 
 def prepare_numbered_text_block(paragraph_texts: List[str]) -> str:
     """
     Нумерует абзацы (1., 2., ...) и соединяет их двойными переводами строк
-    для передачи в API одним блоком.
+    для передачи в API одним блоком. Абзацы длиннее API_MAX_PARAGRAPH_CHARS обрезаются.
     """
-    if not paragraph_texts:
+    if len(paragraph_texts) == 0:
         return ""
-    numbered_items = [f"{i+1}. {text}" for i, text in enumerate(paragraph_texts)]
+    numbered_items = [
+        f"{i+1}. {text if len(text) <= API_MAX_PARAGRAPH_CHARS else text[:API_MAX_PARAGRAPH_CHARS] + '…'}"
+        for i, text in enumerate(paragraph_texts)
+    ]
     return "\n\n".join(numbered_items)
 
-def parse_gpt_response(response_text: str, expected_count: int) -> List[str]:
-    """
-    Анализирует ответ GPT (ожидаемый формат: 'N. роль' или 'N. роль1 / роль2'), извлекая метки.
-    Возвращает список меток или 'parsing_error' для нераспознанных строк.
-    """
-    parsed_labels = {}  # Словарь {номер_параграфа: метка(и)}
-    lines = response_text.strip().split('\n')
-    # Паттерн: N. Метка (возможно с пробелами, может включать '/')
-    pattern = re.compile(r"^\s*(\d+)\.?\s*(.+?)\s*$") 
-    
-    valid_api_labels_set = set(API_LABELS)
-    
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            try:
-                paragraph_num = int(match.group(1))
-                # Извлекаем метку(и) и убираем лишние пробелы
-                labels_part = match.group(2).strip() 
-                
-                # Проверяем каждую метку (если их несколько, разделенных '/')
-                current_labels = []
-                possible_labels = [l.strip() for l in labels_part.split('/')]
-                
-                valid_found = False
-                for label in possible_labels:
-                    if label in valid_api_labels_set:
-                        current_labels.append(label)
-                        valid_found = True
-                    elif label: # Логируем только непустые нераспознанные метки
-                        logging.warning(f"[Парсер API] Неизвестная или некорректная метка '{label}' для параграфа {paragraph_num} в строке: '{line}'")
-                
-                if valid_found:
-                     # Сохраняем валидные метки, объединенные через "/"
-                     parsed_labels[paragraph_num] = " / ".join(current_labels)
-                
-            except ValueError:
-                logging.warning(f"[Парсер API] Не удалось извлечь номер параграфа из строки: '{line}'")
-            except Exception as e:
-                 logging.error(f"[Парсер API] Ошибка парсинга строки '{line}': {e}")
-        elif line.strip(): # Логируем непустые строки, не соответствующие формату
+def _parse_one_line(line: str, parsed_labels: Dict[int, str]) -> None:
+    """Разбирает одну строку ответа GPT и записывает валидные метки в parsed_labels."""
+    if not line.strip():
+        return
+    # Быстрый путь для строк вида 'N. метка(и)' без регулярного выражения
+    head, sep, rest = line.lstrip().partition('.')
+    labels_part = rest.strip()
+    if not (sep and head.isdecimal() and labels_part):
+        # Нестандартная строка (например, без точки после номера) - разбираем регулярным выражением
+        match = _GPT_LINE_RE.match(line)
+        if not match:
+            # Логируем непустые строки, не соответствующие формату
             logging.warning(f"[Парсер API] Строка не соответствует формату 'N. Метка(и)': '{line}'")
-            
+            return
+        head = match.group(1)
+        # Извлекаем метку(и) и убираем лишние пробелы
+        labels_part = match.group(2).strip()
+    try:
+        paragraph_num = int(head)
+        
+        # Проверяем каждую метку (если их несколько, разделенных '/')
+        current_labels = []
+        possible_labels = [l.strip() for l in labels_part.split('/')]
+        
+        valid_found = False
+        for label in possible_labels:
+            if label in _VALID_API_LABELS_SET:
+                current_labels.append(label)
+                valid_found = True
+            elif label: # Логируем только непустые нераспознанные метки
+                logging.warning(f"[Парсер API] Неизвестная или некорректная метка '{label}' для параграфа {paragraph_num} в строке: '{line}'")
+        
+        if valid_found:
+             # Сохраняем валидные метки, объединенные через "/"
+             parsed_labels[paragraph_num] = " / ".join(current_labels)
+        
+    except ValueError:
+        logging.warning(f"[Парсер API] Не удалось извлечь номер параграфа из строки: '{line}'")
+    except Exception as e:
+         logging.error(f"[Парсер API] Ошибка парсинга строки '{line}': {e}")
+
+def _finalize_parsed_labels(parsed_labels: Dict[int, str], expected_count: int) -> List[str]:
+    """Собирает итоговый список меток по номерам параграфов."""
     # Формируем итоговый список, используя 'parsing_error' для отсутствующих номеров
     result_list = [parsed_labels.get(i + 1, "parsing_error") for i in range(expected_count)]
     
@@ -260,45 +428,49 @@ def parse_gpt_response(response_text: str, expected_count: int) -> List[str]:
 
     return result_list
 
-def _create_api_prompt(topic_prompt: str, numbered_text: str) -> List[Dict[str, str]]:
-    """Создаёт промпт для OpenAI API точно по формату документации."""
-    
-    # Формируем блок описания ролей
-    roles_description = ""
+def parse_gpt_response(response_text: str, expected_count: int) -> List[str]:
+    """
+    Анализирует ответ GPT (ожидаемый формат: 'N. роль' или 'N. роль1 / роль2'), извлекая метки.
+    Возвращает список меток или 'parsing_error' для нераспознанных строк.
+    """
+    parsed_labels: Dict[int, str] = {}  # Словарь {номер_параграфа: метка(и)}
+    for line in response_text.splitlines():
+        _parse_one_line(line, parsed_labels)
+    return _finalize_parsed_labels(parsed_labels, expected_count)
+
+# Описания ролей для промпта API; {topic} заменяется на тему документа
+_API_LABEL_DESC_TEMPLATES = {
+    "раскрытие темы": "фрагмент расширяет, развивает или продолжает основную тему: '{topic}'",
+    "пояснение на примере": "фрагмент иллюстрирует тему '{topic}' с помощью конкретного случая, аналога или бытовой ситуации",
+    "лирическое отступление": "содержательное отступление от темы '{topic}', предлагающее культурное, философское или эмоциональное размышление",
+    "ключевой тезис": "краткая формулировка центральной мысли или главного вывода по теме '{topic}', часто лаконична и утверждающая",
+    "шум": "фрагмент не имеет отношения к теме '{topic}' и не добавляет ценности обсуждению",
+    "метафора или аналогия": "образное или переносное выражение, сравнение, аллегория",
+    "юмор или ирония или сарказм": "элементы, предназначенные вызвать улыбку, комический эффект или критическое осмысление через иронию",
+    "связующий переход": "фраза или предложение, служащее мостом между частями текста",
+    "смена темы": "явное или скрытое переключение внимания с одной темы на другую",
+    "противопоставление или контраст": "фрагмент подчёркивает различие, оппозицию или конфликт идей",
+}
+
+@functools.lru_cache(maxsize=64)
+def _build_roles_description(topic_prompt: str) -> str:
+    """Формирует блок описания ролей; зависит только от темы, поэтому кешируется."""
+    descriptions = []
     for i, label in enumerate(API_LABELS, 1):
         # Заменяем "/" на "или" для отображения в промпте
         display_label = label.replace(" / ", " или ")
-        description = f"{i}. {display_label}" # Используем display_label
-        
-        if label in API_TOPIC_LABELS: # Проверяем по оригинальной метке
-            # Подставляем тему в плейсхолдер <ТЕМА> и добавляем описание
-            base_desc = "фрагмент расширяет, развивает или продолжает основную тему: '{}'".format(topic_prompt)
-            if label == "пояснение на примере":
-                base_desc = "фрагмент иллюстрирует тему '{}' с помощью конкретного случая, аналога или бытовой ситуации".format(topic_prompt)
-            elif label == "лирическое отступление":
-                 base_desc = "содержательное отступление от темы '{}', предлагающее культурное, философское или эмоциональное размышление".format(topic_prompt)
-            elif label == "ключевой тезис":
-                 base_desc = "краткая формулировка центральной мысли или главного вывода по теме '{}', часто лаконична и утверждающая".format(topic_prompt)
-            elif label == "шум":
-                 base_desc = "фрагмент не имеет отношения к теме '{}' и не добавляет ценности обсуждению".format(topic_prompt)
-            description += f" — {base_desc}"
-        else:
-             # Для остальных меток - базовое описание
-            # Проверяем по оригинальной метке
-            if label == "метафора или аналогия": 
-                description += " — образное или переносное выражение, сравнение, аллегория"
-            elif label == "юмор или ирония или сарказм":
-                description += " — элементы, предназначенные вызвать улыбку, комический эффект или критическое осмысление через иронию"
-            elif label == "связующий переход":
-                description += " — фраза или предложение, служащее мостом между частями текста"
-            elif label == "смена темы":
-                description += " — явное или скрытое переключение внимания с одной темы на другую"
-            elif label == "противопоставление или контраст":
-                description += " — фрагмент подчёркивает различие, оппозицию или конфликт идей"
-        roles_description += description + "\n"
-        
-    # Убираем последний перевод строки
-    roles_description = roles_description.strip()
+        description = f"{i}. {display_label}"
+        template = _API_LABEL_DESC_TEMPLATES.get(label)
+        if template:
+            description += f" — {template.format(topic=topic_prompt)}"
+        descriptions.append(description)
+    return "\n".join(descriptions)
+
+def _create_api_prompt(topic_prompt: str, numbered_text: str) -> List[Dict[str, str]]:
+    """Создаёт промпт для OpenAI API точно по формату документации."""
+    
+    # Блок описания ролей (кешируется по теме)
+    roles_description = _build_roles_description(topic_prompt)
 
     # Системный промпт
     system_prompt = "Ты — языковой аналитик. Классифицируй текст по ролям."
@@ -329,10 +501,10 @@ def analyze_semantic_function_local(
     Анализирует семантическую функцию ОДНОГО параграфа локальной моделью.
     Возвращает строку с топ-N метками (score > порога) или 'error'/'empty'.
     """
-    global GLOBAL_RESULT_CACHE, local_classifier
+    global local_classifier
     
     # Проверки
-    if local_classifier is None:
+    if not _ensure_local_classifier():
         logging.warning("[Локальный анализ] Классификатор не загружен.")
         return "error: classifier not loaded"
     
@@ -341,68 +513,31 @@ def analyze_semantic_function_local(
         return "empty"
     
     # Проверяем кеш
+    result_cache = _get_result_cache()
     cache_key = get_cache_key(paragraph_text, topic_prompt)
-    if cache_key in GLOBAL_RESULT_CACHE:
+    cached = result_cache.get(cache_key)
+    if cached is not None:
         logging.debug(f"[Локальный анализ] Кеш хит для ключа: {cache_key}")
-        return GLOBAL_RESULT_CACHE[cache_key]
+        return cached
     
     try:
-        # Подготовка гипотез с подстановкой темы
-        all_hypotheses = []
-        main_labels_map = [] # Список основных меток, соответствующий all_hypotheses
-
-        for main_label, synonyms in LABEL_SYNONYMS_LOCAL.items():
-            for synonym_template in synonyms:
-                # Подставляем тему в плейсхолдер <ТЕМА>, если он есть
-                hypothesis = synonym_template.replace(LOCAL_TOPIC_PLACEHOLDER, topic_prompt)
-                all_hypotheses.append(hypothesis)
-                main_labels_map.append(main_label)
+        all_hypotheses, main_labels_map = _build_local_hypotheses(topic_prompt)
         
         logging.debug(f"[Локальный анализ] Запрос к классификатору для параграфа (длина {len(paragraph_text)}), гипотез: {len(all_hypotheses)}")
         # Запрос к локальной модели
         # Используем multi_label=True, т.к. один параграф может выполнять >1 роли
-        result = local_classifier(paragraph_text, all_hypotheses, multi_label=True) 
-        
-        # Агрегация скоров по основным меткам (берем максимальный скор среди синонимов)
-        aggregated_scores: Dict[str, float] = {}
-        if result and 'scores' in result and 'labels' in result and len(result['scores']) == len(all_hypotheses):
-            for i, score in enumerate(result["scores"]):
-                main_label = main_labels_map[i]
-                if main_label not in aggregated_scores or score > aggregated_scores[main_label]:
-                    aggregated_scores[main_label] = score
-        else:
-             logging.warning(f"[Локальный анализ] Неожиданный формат ответа классификатора: {result}")
-             
-        logging.debug(f"[Локальный анализ] Агрегированные скоры: {aggregated_scores}")
-                
-        # Фильтрация по порогу и сортировка
-        filtered_sorted_labels = sorted(
-            [(label, score) for label, score in aggregated_scores.items() if score >= LOCAL_SCORE_THRESHOLD],
-            key=lambda item: item[1], 
-            reverse=True
-        )
-        
-        # Выбираем топ-N (или меньше, если их меньше)
-        top_labels = filtered_sorted_labels[:LOCAL_TOP_N]
-        
-        # Форматируем результат в строку: "метка1 (скор1), метка2 (скор2), ..."
-        if top_labels:
-            result_string = ", ".join([f"{label} ({score:.2f})" for label, score in top_labels])
+        if local_entailment_id is not None and local_contradiction_id is not None:
+            # Тот же прямой проход, что и в пакетном анализе (с обрезкой до LOCAL_MAX_INPUT_TOKENS):
+            # под одним ключом кеша оба пути записывают одинаковый результат
+            result_string = _format_nli_scores(_nli_batch([paragraph_text], all_hypotheses))[0]
         else:
-            # Если ни одна метка не прошла порог, возвращаем метку с наивысшим скором (если есть)
-            if aggregated_scores:
-                max_label = max(aggregated_scores, key=aggregated_scores.get)
-                max_score = aggregated_scores[max_label]
-                # Помечаем, что она ниже порога
-                result_string = f"{max_label} ({max_score:.2f}) (below threshold)" 
-                logging.debug(f"[Локальный анализ] Ни одна метка не прошла порог {LOCAL_SCORE_THRESHOLD}. Возвращена лучшая: {result_string}")
-            else:
-                result_string = "no label found" # Маловероятно, но возможно
-                logging.warning("[Локальный анализ] Не найдено ни одной метки после агрегации.")
+            with torch.inference_mode():
+                result = local_classifier(paragraph_text, list(all_hypotheses), multi_label=True) 
+            result_string = _format_local_result(result, main_labels_map)
 
         # Кешируем и возвращаем
         logging.debug(f"[Локальный анализ] Результат: '{result_string}'")
-        GLOBAL_RESULT_CACHE[cache_key] = result_string
+        result_cache[cache_key] = result_string
         return result_string
             
     except Exception as e:
@@ -411,43 +546,370 @@ def analyze_semantic_function_local(
         # logging.debug(f"Текст параграфа с ошибкой: {paragraph_text[:100]}...") 
         return "error: analysis failed"
 
+# Шаблоны синонимов и соответствующие им основные метки в плоском виде (не зависят от темы)
+_LOCAL_SYNONYM_TEMPLATES = tuple(
+    sys.intern(synonym_template) for synonyms in LABEL_SYNONYMS_LOCAL.values() for synonym_template in synonyms
+)
+_LOCAL_TEMPLATE_HAS_TOPIC = tuple(LOCAL_TOPIC_PLACEHOLDER in template for template in _LOCAL_SYNONYM_TEMPLATES)
+_LOCAL_MAIN_LABELS_MAP = tuple(
+    main_label for main_label, synonyms in LABEL_SYNONYMS_LOCAL.items() for _ in synonyms
+)
+# Синонимы одной метки идут подряд: начала групп для np.maximum.reduceat по гипотезам
+_LOCAL_MAIN_LABEL_NAMES = tuple(LABEL_SYNONYMS_LOCAL.keys())
+_LOCAL_GROUP_STARTS = np.cumsum([0] + [len(synonyms) for synonyms in LABEL_SYNONYMS_LOCAL.values()][:-1])
+
+@functools.lru_cache(maxsize=32)
+def _build_local_hypotheses(topic_prompt: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Готовит гипотезы с подстановкой темы и соответствующие им основные метки.
+    Зависит только от темы, поэтому кешируется и строится один раз на тему, а не на параграф.
+    """
+    # Подставляем тему только в шаблоны с плейсхолдером <ТЕМА>; остальные гипотезы
+    # одинаковы для всех тем. Строки интернируются - они живут весь прогон в кеше
+    all_hypotheses = tuple(
+        sys.intern(synonym_template.replace(LOCAL_TOPIC_PLACEHOLDER, topic_prompt)) if has_placeholder else synonym_template
+        for synonym_template, has_placeholder in zip(_LOCAL_SYNONYM_TEMPLATES, _LOCAL_TEMPLATE_HAS_TOPIC)
+    )
+    return all_hypotheses, _LOCAL_MAIN_LABELS_MAP
+
+def _format_local_result(result: Dict[str, Any], main_labels_map: Sequence[str]) -> str:
+    """Агрегирует ответ классификатора по основным меткам и форматирует топ-N в строку."""
+    # Агрегация скоров по основным меткам (берем максимальный скор среди синонимов)
+    aggregated_scores: Dict[str, float] = {}
+    if result and 'scores' in result and 'labels' in result and len(result['scores']) == len(main_labels_map):
+        for i, score in enumerate(result["scores"]):
+            main_label = main_labels_map[i]
+            if main_label not in aggregated_scores or score > aggregated_scores[main_label]:
+                aggregated_scores[main_label] = score
+    else:
+         logging.warning(f"[Локальный анализ] Неожиданный формат ответа классификатора: {result}")
+    return _format_aggregated_scores(aggregated_scores)
+
+def _nli_batch(paragraphs: List[str], hypotheses: Sequence[str]) -> np.ndarray:
+    """
+    Прямой батчевый проход NLI-модели без zero-shot pipeline.
+    Строит пары (параграф, гипотеза), токенизирует их пачками по LOCAL_BATCH_SIZE
+    (паддинг до максимума пачки) и возвращает матрицу (параграфы x гипотезы) вероятностей
+    entailment - как pipeline в режиме multi_label (softmax по contradiction/entailment).
+    Столбцы идут в порядке гипотез _build_local_hypotheses.
+    Параграфы сортируются по длине, чтобы в пачку попадали входы близкой длины
+    и паддинг был минимальным; порядок строк результата - исходный.
+    """
+    tokenizer = local_tokenizer
+    model = local_classifier.model
+    formatted_hypotheses = [LOCAL_HYPOTHESIS_TEMPLATE.format(h) for h in hypotheses]
+    order = np.argsort([len(p) for p in paragraphs], kind="stable")
+    pairs = [(paragraphs[i], h) for i in order for h in formatted_hypotheses]
+    pair_label_ids = [local_contradiction_id, local_entailment_id]
+    max_length = min(LOCAL_MAX_INPUT_TOKENS, model.config.max_position_embeddings)
+    
+    entailment_scores = np.empty(len(pairs), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, len(pairs), LOCAL_BATCH_SIZE):
+            batch_pairs = pairs[start:start + LOCAL_BATCH_SIZE]
+            inputs = tokenizer(
+                [p for p, _ in batch_pairs],
+                [h for _, h in batch_pairs],
+                padding=True,
+                truncation="only_first",
+                max_length=max_length,
+                return_tensors="pt"
+            ).to(model.device)
+            logits = model(**inputs).logits[:, pair_label_ids].float()
+            entailment_scores[start:start + len(batch_pairs)] = torch.softmax(logits, dim=-1)[:, 1].cpu().numpy()
+    # Возвращаем строки в исходный порядок параграфов
+    scores = np.empty((len(paragraphs), len(hypotheses)), dtype=np.float32)
+    scores[order] = entailment_scores.reshape(len(paragraphs), len(hypotheses))
+    return scores
+
+def _format_nli_scores(scores: np.ndarray) -> List[str]:
+    """
+    Агрегирует матрицу (параграфы x гипотезы) по основным меткам и форматирует топ-N каждой строки.
+    Максимум по синонимам - один np.maximum.reduceat, выбор топ-N - np.argpartition;
+    формат строк совпадает с _format_aggregated_scores.
+    """
+    aggregated = np.maximum.reduceat(scores, _LOCAL_GROUP_STARTS, axis=1) # (параграфы, основные метки)
+    num_labels = aggregated.shape[1]
+    top_n = min(LOCAL_TOP_N, num_labels)
+    if top_n < num_labels:
+        top_indices = np.argpartition(-aggregated, top_n - 1, axis=1)[:, :top_n]
+    else:
+        top_indices = np.broadcast_to(np.arange(num_labels), aggregated.shape)
+    top_scores = np.take_along_axis(aggregated, top_indices, axis=1)
+    # Сортируем только выбранные топ-N по убыванию скора
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top_indices = np.take_along_axis(top_indices, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    
+    result_strings = []
+    for index_row, score_row in zip(top_indices.tolist(), top_scores.tolist()):
+        passed = [
+            f"{_LOCAL_MAIN_LABEL_NAMES[j]} ({score:.2f})"
+            for j, score in zip(index_row, score_row) if score >= LOCAL_SCORE_THRESHOLD
+        ]
+        if passed:
+            result_strings.append(", ".join(passed))
+        else:
+            # Ни одна метка не прошла порог - лучшая с пометкой
+            result_strings.append(f"{_LOCAL_MAIN_LABEL_NAMES[index_row[0]]} ({score_row[0]:.2f}) (below threshold)")
+    return result_strings
+
+def _format_aggregated_scores(aggregated_scores: Dict[str, float]) -> str:
+    """Фильтрует агрегированные скоры по порогу и форматирует топ-N в строку."""
+    logging.debug(f"[Локальный анализ] Агрегированные скоры: {aggregated_scores}")
+            
+    # Фильтрация по порогу и сортировка
+    filtered_sorted_labels = sorted(
+        [(label, score) for label, score in aggregated_scores.items() if score >= LOCAL_SCORE_THRESHOLD],
+        key=lambda item: item[1], 
+        reverse=True
+    )
+    
+    # Выбираем топ-N (или меньше, если их меньше)
+    top_labels = filtered_sorted_labels[:LOCAL_TOP_N]
+    
+    # Форматируем результат в строку: "метка1 (скор1), метка2 (скор2), ..."
+    if top_labels:
+        return ", ".join([f"{label} ({score:.2f})" for label, score in top_labels])
+    # Если ни одна метка не прошла порог, возвращаем метку с наивысшим скором (если есть)
+    if aggregated_scores:
+        max_label = max(aggregated_scores, key=aggregated_scores.get)
+        max_score = aggregated_scores[max_label]
+        # Помечаем, что она ниже порога
+        result_string = f"{max_label} ({max_score:.2f}) (below threshold)" 
+        logging.debug(f"[Локальный анализ] Ни одна метка не прошла порог {LOCAL_SCORE_THRESHOLD}. Возвращена лучшая: {result_string}")
+        return result_string
+    logging.warning("[Локальный анализ] Не найдено ни одной метки после агрегации.")
+    return "no label found" # Маловероятно, но возможно
+
 def analyze_semantic_function_local_batch(
-    paragraph_texts: List[str], 
+    paragraph_texts: Sequence[str], 
     topic_prompt: str
-) -> List[str]:
+) -> Sequence[str]:
     """
     Пакетный анализ семантической функции локальной моделью.
-    Обрабатывает каждый параграф индивидуально через analyze_semantic_function_local.
+    Некешированные параграфы прогоняются через модель пачками по LOCAL_BATCH_SIZE пар
+    (см. _nli_batch), а не по одному вызову pipeline на параграф.
     """
-    if not paragraph_texts:
+    if len(paragraph_texts) == 0:
         logging.warning("[Локальный батч] Пустой список параграфов.")
         return []
-        
-    results = []
+    
     total_paragraphs = len(paragraph_texts)
-    processed_count = 0
+    if not _ensure_local_classifier():
+        logging.warning("[Локальный батч] Классификатор не загружен.")
+        return ["error: classifier not loaded"] * total_paragraphs
+        
+    result_cache = _get_result_cache()
+    # Результаты пишутся на место в заранее выделенный object-массив, без промежуточных списков
+    results = np.empty(total_paragraphs, dtype=object)
+    # Уникальные некешированные тексты в порядке появления: текст -> (ключ кеша, позиции в документе).
+    # Повторяющиеся параграфы (шапки, шаблонный текст) уходят в модель один раз.
+    uncached: Dict[str, Tuple[str, List[int]]] = {}
     
     logging.info(f"[Локальный батч] Начало обработки {total_paragraphs} параграфов...")
     
+    # Разделяем параграфы на пустые, найденные в кеше и требующие анализа
     for i, para_text in enumerate(paragraph_texts):
-        result = analyze_semantic_function_local(para_text, topic_prompt)
-        results.append(result)
-        processed_count += 1
-        # Логирование прогресса каждые N параграфов или в конце
-        if processed_count % 50 == 0 or processed_count == total_paragraphs:
-             logging.info(f"[Локальный батч] Обработано {processed_count}/{total_paragraphs}...")
+        if not para_text:
+            results[i] = "empty"
+            continue
+        pending = uncached.get(para_text)
+        if pending is not None:
+            pending[1].append(i)
+            continue
+        cache_key = get_cache_key(para_text, topic_prompt)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            uncached[para_text] = (cache_key, [i])
+    
+    if uncached:
+        uncached_count = sum(len(indices) for _, indices in uncached.values())
+        logging.info(f"[Локальный батч] Из кеша: {total_paragraphs - uncached_count}, к модели: {len(uncached)} уникальных из {uncached_count}")
+        all_hypotheses, main_labels_map = _build_local_hypotheses(topic_prompt)
+        uncached_texts = list(uncached)
+        try:
+            if local_entailment_id is not None and local_contradiction_id is not None:
+                # Прямой проход модели: без пер-параграфных словарей и повторной обвязки pipeline
+                scores = _nli_batch(uncached_texts, all_hypotheses)
+                result_strings = _format_nli_scores(scores)
+            else:
+                # Модель без явных меток entailment/contradiction - через pipeline,
+                # который возвращает список результатов в порядке входных текстов
+                with torch.inference_mode():
+                    classifier_results = local_classifier(
+                        uncached_texts,
+                        list(all_hypotheses),
+                        multi_label=True,
+                        batch_size=LOCAL_BATCH_SIZE
+                    )
+                if isinstance(classifier_results, dict): # Для одного текста pipeline возвращает dict
+                    classifier_results = [classifier_results]
+                result_strings = [_format_local_result(result, main_labels_map) for result in classifier_results]
+            for (cache_key, indices), result_string in zip(uncached.values(), result_strings):
+                result_cache[cache_key] = result_string
+                for i in indices:
+                    results[i] = result_string
+        except Exception as e:
+            logging.error(f"[Локальный батч] Ошибка пакетного вызова классификатора: {e}", exc_info=True)
+            for _, indices in uncached.values():
+                for i in indices:
+                    results[i] = "error: analysis failed"
 
     logging.info(f"[Локальный батч] Обработка завершена.")
     return results
 
-def analyze_semantic_function_api_batch(
+def _prepare_api_request(paragraph_texts: List[str], topic_prompt: str) -> Optional[Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+    """Готовит сообщения и параметры запроса к API для группы параграфов."""
+    num_paragraphs = len(paragraph_texts)
+    numbered_text = prepare_numbered_text_block(paragraph_texts)
+    if not numbered_text:
+         logging.error("[API батч] Не удалось создать нумерованный блок текста.")
+         return None
+
+    messages = _create_api_prompt(topic_prompt, numbered_text)
+    
+    # Рассчитываем примерный max_tokens с запасом
+    estimated_max_tokens = max(500, num_paragraphs * API_TOKENS_PER_PARAGRAPH_ESTIMATE) 
+    if estimated_max_tokens > API_MAX_TOKENS_PER_REQUEST:
+         logging.warning(f"[API батч] Расчетный max_tokens ({estimated_max_tokens}) превышает лимит {API_MAX_TOKENS_PER_REQUEST}. Используем лимит.")
+         estimated_max_tokens = API_MAX_TOKENS_PER_REQUEST
+
+    current_api_params = API_PARAMS.copy()
+    current_api_params["max_tokens"] = estimated_max_tokens
+    return messages, current_api_params
+
+async def _read_streamed_labels(stream: Any, num_paragraphs: int) -> Optional[List[str]]:
+    """
+    Читает потоковый ответ API и разбирает строки по мере поступления,
+    совмещая ожидание сети с парсингом. None, если контента нет или не распознана ни одна метка.
+    """
+    parsed_labels: Dict[int, str] = {}
+    buffer = ""
+    received_chars = 0
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        received_chars += len(delta)
+        buffer += delta
+        # Разбираем все завершенные строки, хвост остается в буфере
+        *complete_lines, buffer = buffer.split("\n")
+        for line in complete_lines:
+            _parse_one_line(line, parsed_labels)
+    _parse_one_line(buffer, parsed_labels)
+    
+    if received_chars == 0:
+        logging.error("[API батч] API не вернул контент в ответе.")
+        return None
+    logging.debug(f"[API батч] Получен ответ от API (длина {received_chars})")
+
+    labels = _finalize_parsed_labels(parsed_labels, num_paragraphs)
+    
+    # Проверяем, не вернулись ли только ошибки парсинга
+    if all(l == "parsing_error" for l in labels):
+         logging.error("[API батч] Не удалось распарсить ни одной метки из ответа API.")
+         return None # Считаем это неудачей
+    return labels
+
+async def _analyze_api_group_async(
+    paragraph_texts: List[str],
+    topic_prompt: str,
+    async_client: Any,
+    group_log_prefix: str,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Optional[List[str]]:
+    """
+    Один запрос к API для группы параграфов с повторами при RateLimitError.
+    semaphore ограничивает число одновременных запросов; на паузу перед повтором он отпускается.
+    """
+    request = _prepare_api_request(paragraph_texts, topic_prompt)
+    if request is None:
+        return None
+    messages, current_api_params = request
+    
+    for attempt in range(API_RATE_LIMIT_RETRIES):
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                stream = await async_client.chat.completions.create(
+                    messages=messages,
+                    stream=True,
+                    **current_api_params # Передаем параметры, включая рассчитанный max_tokens
+                )
+                return await _read_streamed_labels(stream, len(paragraph_texts))
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+        except RateLimitError as e:
+            if attempt == API_RATE_LIMIT_RETRIES - 1:
+                logging.error(f"{group_log_prefix} Превышен лимит запросов OpenAI API: {e}", exc_info=False)
+                return None
+            delay = random.uniform(0, 2 ** attempt)
+            logging.warning(f"{group_log_prefix} RateLimitError, повтор через {delay:.2f}с")
+            await asyncio.sleep(delay)
+        except APIConnectionError as e:
+            logging.error(f"{group_log_prefix} Ошибка соединения с OpenAI API: {e}", exc_info=False) 
+            return None
+        except APIStatusError as e:
+            logging.error(f"{group_log_prefix} Ошибка статуса OpenAI API: {e.status_code} - {e.response.text}", exc_info=False)
+            return None
+        except Exception as e:
+            logging.error(f"{group_log_prefix} Неожиданная ошибка при вызове API: {e}", exc_info=True)
+            return None
+    return None
+
+async def analyze_semantic_function_api_batch_async(
     paragraph_texts: List[str], 
     topic_prompt: str, 
+    async_client: Any # Ожидается клиент AsyncOpenAI
+) -> Optional[List[str]]:
+    """
+    Асинхронный пакетный анализ через OpenAI API.
+    Делит параграфы на группы по API_PARAGRAPHS_PER_REQUEST и отправляет запросы параллельно
+    (не более API_MAX_CONCURRENT_REQUESTS одновременно, чтобы не упираться в 429):
+    время ответа определяют самые медленные группы, а не один огромный запрос на весь документ.
+    Возвращает None, если не удалась ни одна группа; параграфы неудачных групп
+    помечаются 'parsing_error'.
+    """
+    num_paragraphs = len(paragraph_texts)
+    groups = [
+        paragraph_texts[start:start + API_PARAGRAPHS_PER_REQUEST]
+        for start in range(0, num_paragraphs, API_PARAGRAPHS_PER_REQUEST)
+    ]
+    logging.info(f"[API батч] Вызов OpenAI API ({API_MODEL_NAME}) для {num_paragraphs} параграфов: {len(groups)} запросов, до {API_MAX_CONCURRENT_REQUESTS} одновременно...")
+    
+    semaphore = asyncio.Semaphore(API_MAX_CONCURRENT_REQUESTS)
+    group_results = await asyncio.gather(*[
+        _analyze_api_group_async(group, topic_prompt, async_client, f"[API батч {i + 1}/{len(groups)}]", semaphore)
+        for i, group in enumerate(groups)
+    ])
+    
+    if all(result is None for result in group_results):
+        return None
+    
+    labels: List[str] = []
+    for group, result in zip(groups, group_results):
+        labels.extend(result if result is not None else ["parsing_error"] * len(group))
+    
+    logging.info(f"[API батч] Успешно извлечено {sum(1 for l in labels if l != 'parsing_error')}/{num_paragraphs} меток из ответа.")
+    return labels
+
+def analyze_semantic_function_api_batch(
+    paragraph_texts: Sequence[str], 
+    topic_prompt: str, 
     client: Any # Ожидается инициализированный клиент OpenAI
 ) -> Optional[List[str]]:
     """
     Пакетный анализ семантической функции через OpenAI API.
-    Отправляет все параграфы одним запросом.
+    Синхронная обертка над analyze_semantic_function_api_batch_async: создает AsyncOpenAI
+    с ключом переданного клиента и общим пулом соединений (utils.openai_client.create_async_client)
+    и выполняет параллельные запросы в собственном event loop.
     """
     num_paragraphs = len(paragraph_texts)
     if num_paragraphs == 0:
@@ -459,63 +921,23 @@ def analyze_semantic_function_api_batch(
         logging.error("[API батч] OpenAI клиент не предоставлен или модуль OpenAI не импортирован.")
         return None
     
+    # Повторяющиеся параграфы отправляем один раз: текст -> индекс первого вхождения
+    unique_indices: Dict[str, int] = {}
+    inverse = [unique_indices.setdefault(text, len(unique_indices)) for text in paragraph_texts]
+    unique_texts = list(unique_indices)
+    if len(unique_texts) < num_paragraphs:
+        logging.info(f"[API батч] Уникальных параграфов: {len(unique_texts)} из {num_paragraphs}")
+    
+    async def _run() -> Optional[List[str]]:
+        # Асинхронный клиент живет в пределах одного event loop, поэтому создается на вызов
+        async with create_async_client(client.api_key, client.base_url) as async_client:
+            return await analyze_semantic_function_api_batch_async(unique_texts, topic_prompt, async_client)
+    
     try:
-        # 1. Подготовка нумерованного текста
-        numbered_text = prepare_numbered_text_block(paragraph_texts)
-        if not numbered_text:
-             logging.error("[API батч] Не удалось создать нумерованный блок текста.")
-             return None
-
-        # 2. Создание промпта
-        messages = _create_api_prompt(topic_prompt, numbered_text)
-        
-        # 3. Вызов API
-        logging.info(f"[API батч] Вызов OpenAI API ({API_MODEL_NAME}) для {num_paragraphs} параграфов...")
-        
-        # Рассчитываем примерный max_tokens с запасом
-        estimated_max_tokens = max(500, num_paragraphs * API_TOKENS_PER_PARAGRAPH_ESTIMATE) 
-        if estimated_max_tokens > API_MAX_TOKENS_PER_REQUEST:
-             logging.warning(f"[API батч] Расчетный max_tokens ({estimated_max_tokens}) превышает лимит {API_MAX_TOKENS_PER_REQUEST}. Используем лимит.")
-             estimated_max_tokens = API_MAX_TOKENS_PER_REQUEST
-
-        current_api_params = API_PARAMS.copy()
-        current_api_params["max_tokens"] = estimated_max_tokens
-        
-        response = client.chat.completions.create(
-            messages=messages,
-            **current_api_params # Передаем параметры, включая рассчитанный max_tokens
-        )
-        
-        # 4. Обработка ответа
-        if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
-            logging.error("[API батч] API не вернул контент в ответе.")
-            # Логирование деталей ответа для диагностики
-            # logging.debug(f"Полный ответ API: {response}")
+        unique_labels = asyncio.run(_run())
+        if unique_labels is None:
             return None
-        
-        response_text = response.choices[0].message.content
-        logging.debug(f"[API батч] Получен ответ от API (длина {len(response_text)})")
-
-        # 5. Парсинг ответа
-        labels = parse_gpt_response(response_text, num_paragraphs)
-        
-        # Проверяем, не вернулись ли только ошибки парсинга
-        if all(l == "parsing_error" for l in labels):
-             logging.error("[API батч] Не удалось распарсить ни одной метки из ответа API.")
-             return None # Считаем это неудачей
-
-        logging.info(f"[API батч] Успешно извлечено {sum(1 for l in labels if l != 'parsing_error')}/{num_paragraphs} меток из ответа.")
-        return labels
-        
-    except APIConnectionError as e:
-        logging.error(f"[API батч] Ошибка соединения с OpenAI API: {e}", exc_info=False) 
-        return None
-    except RateLimitError as e:
-        logging.error(f"[API батч] Превышен лимит запросов OpenAI API: {e}", exc_info=False)
-        return None
-    except APIStatusError as e:
-        logging.error(f"[API батч] Ошибка статуса OpenAI API: {e.status_code} - {e.response.text}", exc_info=False)
-        return None
+        return [unique_labels[j] for j in inverse]
     except Exception as e:
         logging.error(f"[API батч] Неожиданная ошибка при вызове API: {e}", exc_info=True)
         return None
@@ -538,7 +960,8 @@ def analyze_semantic_function_batch(
         df['semantic_method'] = 'error'
         return df
     
-    paragraphs = df['text'].tolist()
+    # Массив без копирования в промежуточный список (для object-колонки - представление данных df)
+    paragraphs = df['text'].to_numpy(dtype=object, copy=False)
     num_paragraphs = len(paragraphs)
     if num_paragraphs == 0:
         logging.warning("[Оркестратор] Пустой список параграфов в DataFrame.")
@@ -575,16 +998,16 @@ def analyze_semantic_function_batch(
     # 3. Локальный анализ (Fallback), если API не сработал (results все еще None)
     if results is None:
         logging.info("[Оркестратор] Переход к локальному анализу (Fallback)...")
-        # Проверяем, загружен ли локальный классификатор
-        if local_classifier is not None:
+        # Загружаем локальный классификатор только сейчас, когда он действительно нужен
+        if _ensure_local_classifier():
             local_results = analyze_semantic_function_local_batch(paragraphs, topic_prompt)
             # Проверяем результат локального анализа
-            if isinstance(local_results, list) and len(local_results) == num_paragraphs:
+            if local_results is not None and len(local_results) == num_paragraphs:
                  results = local_results
                  method_used = 'local_fallback'
                  logging.info("[Оркестратор] Локальный анализ успешно завершен.")
             else:
-                 logging.error(f"[Оркестратор] Локальный анализ вернул некорректный результат (тип: {type(local_results)}, длина: {len(local_results or [])}).")
+                 logging.error(f"[Оркестратор] Локальный анализ вернул некорректный результат (тип: {type(local_results)}, длина: {0 if local_results is None else len(local_results)}).")
                  results = ["error: local analysis failed"] * num_paragraphs # Заполняем ошибками
                  method_used = 'error'
         else:
@@ -593,13 +1016,13 @@ def analyze_semantic_function_batch(
              method_used = 'error'
 
     # 4. Запись результатов в DataFrame
-    df['semantic_function'] = results
-    df['semantic_method'] = method_used
+    # Категориальные колонки вместо object: метки сильно повторяются, а метод один на весь документ
+    df['semantic_function'] = pd.Categorical(results)
+    df['semantic_method'] = pd.Categorical([method_used] * num_paragraphs, categories=SEMANTIC_METHODS)
     logging.info(f"[Оркестратор] Семантический анализ завершен. Использован метод: '{method_used}'.")
     
     # Очистка кеша после завершения анализа одного текста (опционально)
-    # global GLOBAL_RESULT_CACHE
-    # GLOBAL_RESULT_CACHE.clear()
+    # _get_result_cache().clear()
     # logging.debug("[Оркестратор] Локальный кеш очищен.")
 
     return df
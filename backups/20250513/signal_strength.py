@@ -250,63 +250,40 @@ class EmbeddingService:
             start_time_total = time.time()
             logging.info(f"Расчет сигнальности для {num_paragraphs} абзацев (батч: {actual_batch_size}, кэш: {len(self.paragraph_cache)}/{self.cache_size})...")
             
-            num_batches = (num_paragraphs + actual_batch_size - 1) // actual_batch_size
-            processed_count = 0
-            cache_hits = 0
-            calculated_count = 0
+            # Эмбеддинги из кэша; недостающие уникальные тексты кодируются одним вызовом encode
+            # (внутри он сам делит вход на батчи), а не отдельным вызовом на каждый батч
+            text_hashes = [hashlib.md5(text.encode()).hexdigest() for text in paragraph_texts]
+            embeddings = [self.paragraph_cache.get(text_hash) for text_hash in text_hashes]
+            cache_hits = sum(embedding is not None for embedding in embeddings)
+            texts_to_calc: Dict[str, str] = {}
+            for text_hash, text, embedding in zip(text_hashes, paragraph_texts, embeddings):
+                if embedding is None and text_hash not in texts_to_calc:
+                    texts_to_calc[text_hash] = text
+            calculated_count = len(texts_to_calc)
 
-            # Обработка батчами
-            for i in range(0, num_paragraphs, actual_batch_size):
-                batch_start_time = time.time()
-                current_batch_num = (i // actual_batch_size) + 1
-                batch_texts = paragraph_texts[i:i+actual_batch_size]
-                
-                # Проверяем наличие в кэше и собираем тексты для обработки
-                batch_indices_in_df = list(range(i, min(i + actual_batch_size, num_paragraphs)))
-                batch_indices_to_calc = [] # Индексы внутри батча, которые надо вычислить
-                batch_texts_to_calc = []   # Тексты, которые надо вычислить
-                
-                for j, text in enumerate(batch_texts):
-                    global_index = i + j
-                    text_hash = hashlib.md5(text.encode()).hexdigest()
-                    cached_embedding = self.paragraph_cache.get(text_hash)
-                    
-                    if cached_embedding is not None:
-                        # Если эмбеддинг в кэше, сразу рассчитываем сходство
-                        score = util.cos_sim(topic_embedding, cached_embedding)[0][0].item()
-                        results_signal[global_index] = round(score, 3)
-                        cache_hits += 1
-                    else:
-                        # Иначе добавляем в список для батчевой обработки
-                        batch_indices_to_calc.append(j)
-                        batch_texts_to_calc.append(text)
-                
-                # Если есть тексты для обработки в текущем батче
-                if batch_texts_to_calc:
-                    calculated_count += len(batch_texts_to_calc)
-                    batch_inputs = [f"passage: {p}" for p in batch_texts_to_calc]
-                    
-                    # Вычисляем эмбеддинги для текущего батча
-                    logging.debug(f"Батч {current_batch_num}/{num_batches}: вычисление эмбеддингов для {len(batch_texts_to_calc)} абзацев...")
-                    batch_embeddings = self.model.encode(batch_inputs, convert_to_tensor=True, show_progress_bar=False) # Убираем прогресс-бар для батчей
-                    
-                    # Рассчитываем косинусное сходство для текущего батча
-                    batch_scores = util.cos_sim(topic_embedding, batch_embeddings)[0].cpu().tolist()
-                    
-                    # Записываем результаты и кэшируем эмбеддинги
-                    for idx, (j, text) in enumerate(zip(batch_indices_to_calc, batch_texts_to_calc)):
-                        global_index = i + j
-                        results_signal[global_index] = round(batch_scores[idx], 3)
-                        
-                        # Кэшируем эмбеддинг
-                        text_hash = hashlib.md5(text.encode()).hexdigest()
-                        # Сохраняем эмбеддинг нужной размерности (1, dim)
-                        self.paragraph_cache.put(text_hash, batch_embeddings[idx].unsqueeze(0)) 
-                        logging.debug(f"Эмбеддинг для абзаца (hash: {text_hash}) сохранен в кэш (размер кэша: {len(self.paragraph_cache)}).")
+            if texts_to_calc:
+                logging.debug("Вычисление эмбеддингов для %s абзацев (батч: %s)...", calculated_count, actual_batch_size)
+                new_embeddings = self.model.encode(
+                    [f"passage: {text}" for text in texts_to_calc.values()],
+                    batch_size=actual_batch_size,
+                    convert_to_tensor=True,
+                    show_progress_bar=False
+                )
+                calculated: Dict[str, torch.Tensor] = {}
+                for text_hash, embedding in zip(texts_to_calc, new_embeddings):
+                    # Сохраняем эмбеддинг нужной размерности (1, dim)
+                    calculated[text_hash] = embedding.unsqueeze(0)
+                    self.paragraph_cache.put(text_hash, calculated[text_hash])
+                embeddings = [
+                    embedding if embedding is not None else calculated[text_hash]
+                    for text_hash, embedding in zip(text_hashes, embeddings)
+                ]
 
-                processed_count += len(batch_texts)
-                batch_end_time = time.time()
-                logging.debug(f"Батч {current_batch_num}/{num_batches} обработан за {batch_end_time - batch_start_time:.2f} сек. (Обработано: {processed_count}/{num_paragraphs})")
+            # Сходство всех абзацев с темой - одно матричное произведение вместо cos_sim на абзац
+            if num_paragraphs:
+                all_embeddings = torch.cat(embeddings).to(topic_embedding.device)
+                scores = util.cos_sim(topic_embedding, all_embeddings)[0].cpu().tolist()
+                results_signal = [round(score, 3) for score in scores]
 
             # После успешного завершения всех операций применяем результаты к DataFrame
             df['signal_strength'] = results_signal
@@ -10,6 +10,8 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     HOST: str = "0.0.0.0"
     PORT: int = 8000
+    WORKERS: int = 1  # Процессов uvicorn при запуске через python main.py (без DEBUG); под gunicorn задайте равным -w: по нему делятся потоки torch
+    WARMUP_SCHEMAS: bool = True  # Строить схемы маршрутов (OpenAPI) при старте, а не при первом запросе
     
     # CORS
     CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:5173"]
@@ -17,10 +19,17 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://redis:6379/0"  # Изменено для работы с Docker
     SESSION_TTL: int = 3600  # 1 час
+    REDIS_POOL_SIZE: int = 10  # Соединений Redis на процесс; REDIS_POOL_SIZE × WORKERS ≤ maxclients Redis
     
     # OpenAI (для semantic_function)
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "gpt-4o" # gpt-4-turbo изменил на gpt-4o
+    # Лимиты OpenAI для проактивного троттлинга (token bucket)
+    OPENAI_RPM: int = 500     # Запросов в минуту
+    OPENAI_TPM: int = 30000   # Токенов в минуту
+    # Bulkhead: одновременных вызовов OpenAI на процесс и допустимая очередь ожидающих
+    OPENAI_MAX_INFLIGHT: int = 16
+    OPENAI_MAX_QUEUED: int = 64
     
     # Флаг, указывающий, требуется ли пытаться использовать семантический анализ
     ENABLE_SEMANTIC_ANALYSIS: bool = True
@@ -28,6 +37,9 @@ class Settings(BaseSettings):
     # Настройки для embedding_service
     MODEL_NAME: str = "ai-forever/sbert_large_nlu_ru"
     EMBEDDING_CACHE_SIZE: int = 1000
+    # Без модели эмбеддингов процесс останавливается (для перезапуска оркестратором контейнеров);
+    # иначе продолжает работать, а зависящие от модели эндпоинты отвечают 503
+    EMBEDDING_REQUIRED: bool = False
     
     # Пути для сохранения файлов
     EXPORT_DIR: str = "exports"
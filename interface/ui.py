@@ -2,25 +2,34 @@ import pandas as pd
 import numpy as np
 import logging
 import json # Для передачи данных в JS
+from functools import lru_cache
+from html import escape
 
-def _hex_to_rgb(hex_color):
+try:
+    import orjson # type: ignore
+except ImportError:
+    orjson = None # Fallback на стандартный json
+
+# Различных цветов в отчете единицы (палитра по умолчанию), поэтому преобразования кэшируются
+@lru_cache(maxsize=64)
+def _hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
     """Преобразует HEX цвет (#RRGGBB) в кортеж RGB."""
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-def _rgb_to_hex(rgb_color):
+@lru_cache(maxsize=64)
+def _rgb_to_hex(rgb_color: tuple[int, int, int]) -> str:
     """Преобразует кортеж RGB в HEX цвет (#RRGGBB)."""
     return f"#{rgb_color[0]:02x}{rgb_color[1]:02x}{rgb_color[2]:02x}"
 
 def _interpolate_color(value, color_start_rgb, color_end_rgb):
     """Линейно интерполирует цвет между двумя RGB цветами на основе значения 0-1."""
     value = np.clip(value, 0, 1)
-    interpolated_rgb = [
-        int(start + (end - start) * value)
+    # Убедимся, что значения в диапазоне 0-255; кортеж - ключ кэша _rgb_to_hex
+    interpolated_rgb = tuple(
+        int(np.clip(int(start + (end - start) * value), 0, 255))
         for start, end in zip(color_start_rgb, color_end_rgb)
-    ]
-    # Убедимся, что значения в диапазоне 0-255
-    interpolated_rgb = [np.clip(c, 0, 255) for c in interpolated_rgb]
+    )
     return _rgb_to_hex(interpolated_rgb)
 
 def _normalize_value(value, min_val, max_val):
@@ -32,6 +41,57 @@ def _normalize_value(value, min_val, max_val):
     else:
         return (value - min_val) / (max_val - min_val)
 
+def _to_json(obj) -> str:
+    """Сериализует данные для JS: orjson (с поддержкой numpy-скаляров), если установлен, иначе json."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(obj)
+
+def _nan_range(values):
+    """(min, max) массива без учета NaN; (0, 1), если значений нет. Возвращает float для JSON."""
+    if np.isnan(values).all():
+        return 0, 1
+    return float(np.nanmin(values)), float(np.nanmax(values))
+
+def _interpolate_colors_vectorized(values, min_val, max_val, color_start_hex, color_end_hex):
+    """
+    Векторный аналог _normalize_value + _interpolate_color для целой колонки.
+    Повторяет семантику JS-версии: NaN -> 0, нулевой диапазон -> 1, округление как Math.round.
+    Возвращает список HEX-цветов (#RRGGBB) в порядке значений.
+    """
+    values = np.asarray(values, dtype=float)
+    if max_val == min_val:
+        normalized = np.ones_like(values)
+    else:
+        normalized = (values - min_val) / (max_val - min_val)
+    normalized = np.clip(normalized, 0, 1)
+    normalized[np.isnan(values)] = 0 # NaN нормализуется в 0 (и при нулевом диапазоне тоже)
+
+    start = np.array(_hex_to_rgb(color_start_hex), dtype=float)
+    end = np.array(_hex_to_rgb(color_end_hex), dtype=float)
+    rgb = np.clip(np.floor(start + (end - start) * normalized[:, None] + 0.5), 0, 255).astype(np.uint8)
+    return [f"#{r:02X}{g:02X}{b:02X}" for r, g, b in rgb.tolist()]
+
+_TABLE_HEAD_HTML = """
+            <table>
+                <thead><tr><th>Семантика</th><th>Текст</th></tr></thead>
+                <tbody>
+"""
+_TABLE_TAIL_HTML = """                </tbody>
+            </table>
+"""
+
+def _write_table_rows(f, semantic_values, text_values, bg_colors, fg_colors):
+    """
+    Пишет строки таблицы отчета в файл генератором, без Styler.
+    Цвета строки передаются CSS-переменными --sig/--cx на <tr>, ячейки наследуют их.
+    """
+    f.writelines(
+        f'<tr style="--sig: {bg}; --cx: {fg};"><td>{escape(str(semantic), quote=False)}</td>'
+        f'<td>{escape(str(text), quote=False)}</td></tr>\n'
+        for semantic, text, bg, fg in zip(semantic_values, text_values, bg_colors, fg_colors)
+    )
+
 def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
     """
     Создает ИНТЕРАКТИВНЫЙ HTML-отчет с таблицей (Semantic, Text), где фон текста
@@ -58,10 +118,11 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
 
     try:
         # 1. Находим диапазоны для нормализации
-        signal_values = df['signal_strength'].dropna()
-        complexity_values = df['complexity'].dropna()
-        min_signal, max_signal = (0, 1) if signal_values.empty else (signal_values.min(), signal_values.max())
-        min_complexity, max_complexity = (0, 1) if complexity_values.empty else (complexity_values.min(), complexity_values.max())
+        # Один перевод колонок в float64 и редукции NumPy вместо dropna + min/max pandas
+        signal_array = df['signal_strength'].to_numpy(dtype=np.float64, na_value=np.nan)
+        complexity_array = df['complexity'].to_numpy(dtype=np.float64, na_value=np.nan)
+        min_signal, max_signal = _nan_range(signal_array)
+        min_complexity, max_complexity = _nan_range(complexity_array)
 
         # 2. Задаем дефолтные/начальные цвета и размер шрифта
         default_font_size = 16
@@ -72,37 +133,42 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
             "complexity_max": "#FF0000"
         }
 
-        # 3. Готовим DataFrame для отображения
-        df_display = df[['semantic_function', 'text']].copy()
-        df_display.columns = ['Семантика', 'Текст']
+        # Цвета для дефолтной палитры считаем здесь одним векторным проходом,
+        # JS пересчитывает их только после изменения цвета пользователем
+        precomputed_bg = _interpolate_colors_vectorized(
+            signal_array, min_signal, max_signal,
+            default_colors['signal_min'], default_colors['signal_max']
+        )
+        precomputed_fg = _interpolate_colors_vectorized(
+            complexity_array, min_complexity, max_complexity,
+            default_colors['complexity_min'], default_colors['complexity_max']
+        )
 
-        # 4. Генерируем базовый HTML таблицы
-        styler = df_display.style
-        styler.hide(axis="index")
-        styler.set_properties(subset=['Текст'], **{'text-align': 'left'})
-        styler.set_properties(subset=['Семантика'], **{'text-align': 'left', 'vertical-align': 'top'})
-        styler.set_td_classes(pd.DataFrame([['semantic-cell', 'text-cell']]*len(df_display), index=df_display.index, columns=['Семантика', 'Текст']))
-        html_table_content = styler.to_html(escape=False)
+        # 3-4. Колонки таблицы: строки HTML пишутся напрямую при сохранении (см. _write_table_rows),
+        # без Styler и промежуточного DataFrame для отображения
+        semantic_values = df['semantic_function'].astype(object).where(df['semantic_function'].notna(), '').tolist()
+        text_values = df['text'].astype(object).where(df['text'].notna(), '').tolist()
 
         # 5. Подготовка данных для передачи в JavaScript
-        js_data = []
-        for index, row in df.iterrows():
-            js_data.append({
-                'semantic': row['semantic_function'],
-                'signal': row['signal_strength'] if not pd.isna(row['signal_strength']) else None,
-                'complexity': row['complexity'] if not pd.isna(row['complexity']) else None
-            })
-        js_data_json = json.dumps(js_data)
-        js_ranges_json = json.dumps({
+        # Векторно: переименовываем колонки, NaN -> None одной операцией и выгружаем записи
+        js_df = df[['semantic_function', 'signal_strength', 'complexity']].rename(
+            columns={'semantic_function': 'semantic', 'signal_strength': 'signal'}
+        ).astype(object)
+        js_data = js_df.where(js_df.notna(), None).to_dict(orient='records')
+        for record, bg, fg in zip(js_data, precomputed_bg, precomputed_fg):
+            record['bg'] = bg
+            record['fg'] = fg
+        js_ranges_json = _to_json({
             'min_signal': min_signal,
             'max_signal': max_signal,
             'min_complexity': min_complexity,
             'max_complexity': max_complexity
         })
-        js_default_colors_json = json.dumps(default_colors)
+        js_default_colors_json = _to_json(default_colors)
 
-        # 6. Собираем полный HTML
-        html_full = f"""
+        # 6. Пишем HTML в файл по частям: таблица и данные для JS сериализуются прямо в файл,
+        # без промежуточных строк размером с весь отчет
+        html_head = f"""
         <!DOCTYPE html>
         <html>
         <head>
@@ -113,11 +179,14 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
                 h1 {{ margin-bottom: 25px; font-size: 14.4pt; color: #333; }}
                 table {{ border-collapse: collapse; width: 100%; margin-top: 20px; table-layout: fixed; }}
                 th, td {{ border: 1px solid #ddd; padding: 8px; vertical-align: top; word-wrap: break-word; }}
+                td {{ text-align: left; }}
                 th {{ background-color: #f2f2f2; text-align: center; }}
                 th:nth-child(1) {{ width: 15%; }}
                 th:nth-child(2) {{ width: 85%; }}
-                .text-cell {{ white-space: pre-wrap; }}
-                .semantic-cell {{ /* Стили для ячеек semantic */ }}
+                :root {{ --fs: {default_font_size}pt; --fs-semantic: {round(default_font_size * 0.87)}pt; }}
+                /* Колонки таблицы: 1 - семантика, 2 - текст */
+                tbody td:nth-child(1) {{ font-size: var(--fs-semantic); }}
+                tbody td:nth-child(2) {{ white-space: pre-wrap; background-color: var(--sig); color: var(--cx); font-size: var(--fs); }}
                 .controls {{ 
                     display: flex;
                     flex-direction: column;
@@ -158,9 +227,11 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
                 button:hover {{ background-color: #3d5a9e; }}
                 .heatmap-bar-container {{ margin-bottom: 20px; margin-top: 5px; }}
                 #signalHeatmapBar {{
+                    display: block;
                     height: 25px;
                     width: 100%;
                     border: 1px solid #ccc;
+                    box-sizing: border-box;
                     background: linear-gradient(to right, {default_colors['signal_min']}, {default_colors['signal_max']});
                 }}
             </style>
@@ -203,14 +274,15 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
             
             <div class="heatmap-bar-container">
                 <label for="signalHeatmapBar" style="font-size: 9pt; color: #555; display: block; margin-bottom: 5px;">Карта распределения соотношения Сигнал/Шум в документе:</label>
-                <div id="signalHeatmapBar"></div>
+                <canvas id="signalHeatmapBar" width="1000" height="25"></canvas>
             </div>
 
-            {html_table_content}
-
+        """
+        html_script_head = """
             <script>
                 // --- Данные из Python ---
-                const paragraphData = {js_data_json};
+                const paragraphData = """
+        html_tail = f""";
                 const ranges = {js_ranges_json};
                 let currentColors = {js_default_colors_json};
                 let currentFontSize = {default_font_size};
@@ -228,8 +300,9 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
                 const complexityMinColorInput = document.getElementById('complexityMinColor');
                 const complexityMaxColorInput = document.getElementById('complexityMaxColor');
                 const signalHeatmapBar = document.getElementById('signalHeatmapBar');
-                const textCells = document.querySelectorAll('td.text-cell');
-                const semanticCells = document.querySelectorAll('td.semantic-cell');
+                const heatmapCtx = signalHeatmapBar ? signalHeatmapBar.getContext('2d') : null;
+                const textCells = document.querySelectorAll('tbody td:nth-child(2)');
+                const rootStyle = document.documentElement.style;
                 
                 // --- Вспомогательные функции JS ---
                 const hexRegex = /^#?([a-f\d]{{2}})([a-f\d]{{2}})([a-f\d]{{2}})$/i;
@@ -263,55 +336,88 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
                     return (value - minVal) / (maxVal - minVal);
                 }}
                 
+                // --- Пересчет цветов строк (только после изменения палитры) ---
+                function recomputeSignalColors() {{
+                    paragraphData.forEach((data) => {{
+                        const normalizedSignal = normalizeValue(data.signal, currentRanges.min_signal, currentRanges.max_signal);
+                        data.bg = interpolateColor(normalizedSignal, currentColors.signal_min, currentColors.signal_max);
+                    }});
+                }}
+
+                function recomputeComplexityColors() {{
+                    paragraphData.forEach((data) => {{
+                        const normalizedComplexity = normalizeValue(data.complexity, currentRanges.min_complexity, currentRanges.max_complexity);
+                        data.fg = interpolateColor(normalizedComplexity, currentColors.complexity_min, currentColors.complexity_max);
+                    }});
+                }}
+
+                // Нормализованный сигнал не зависит от палитры, считаем его один раз
+                const normalizedSignals = paragraphData.map((data) => Math.max(0, Math.min(1,
+                    normalizeValue(data.signal, currentRanges.min_signal, currentRanges.max_signal))));
+
                 // --- Функция обновления полосы heatmap ---
+                // Рисуем растр в ImageData: O(ширина) вне зависимости от числа параграфов
                 function updateHeatmapBar() {{
-                     if (!signalHeatmapBar || paragraphData.length === 0) {{ return; }}
-                     
-                     let gradientStops = [];
-                     const numParagraphs = paragraphData.length;
-
-                     if (numParagraphs === 1) {{
-                        const normalizedSignal = normalizeValue(paragraphData[0].signal, currentRanges.min_signal, currentRanges.max_signal);
-                        const color = interpolateColor(normalizedSignal, currentColors.signal_min, currentColors.signal_max);
-                        gradientStops.push(`${{color}} 0%`);
-                        gradientStops.push(`${{color}} 100%`);
-                     }} else {{
-                         paragraphData.forEach((data, index) => {{
-                            const normalizedSignal = normalizeValue(data.signal, currentRanges.min_signal, currentRanges.max_signal);
-                            const color = interpolateColor(normalizedSignal, currentColors.signal_min, currentColors.signal_max);
-                            const startPercent = (index / numParagraphs) * 100;
-                            const endPercent = ((index + 1) / numParagraphs) * 100;
-                            
-                            gradientStops.push(`${{color}} ${{startPercent}}%`);
-                            gradientStops.push(`${{color}} ${{endPercent}}%`);
-                        }});
-                     }}
-                    
-                    let gradient = `linear-gradient(to right, ${{gradientStops.join(', ')}})`;
-                    
-                    signalHeatmapBar.style.background = gradient;
+                    if (!heatmapCtx || paragraphData.length === 0) {{ return; }}
+
+                    const startRgb = hexToRgb(currentColors.signal_min) || [255, 255, 255];
+                    const endRgb = hexToRgb(currentColors.signal_max) || [255, 255, 255];
+                    const width = signalHeatmapBar.width;
+                    const height = signalHeatmapBar.height;
+                    const numParagraphs = paragraphData.length;
+                    const imageData = heatmapCtx.createImageData(width, height);
+                    const data = imageData.data;
+
+                    // Первая строка пикселей, остальные строки копируются из нее
+                    for (let x = 0; x < width; x++) {{
+                        const value = normalizedSignals[Math.floor(x / width * numParagraphs)];
+                        const p = x * 4;
+                        data[p] = Math.round(startRgb[0] + (endRgb[0] - startRgb[0]) * value);
+                        data[p + 1] = Math.round(startRgb[1] + (endRgb[1] - startRgb[1]) * value);
+                        data[p + 2] = Math.round(startRgb[2] + (endRgb[2] - startRgb[2]) * value);
+                        data[p + 3] = 255;
+                    }}
+                    const rowBytes = width * 4;
+                    for (let y = 1; y < height; y++) {{
+                        data.copyWithin(y * rowBytes, 0, rowBytes);
+                    }}
+
+                    heatmapCtx.putImageData(imageData, 0, 0);
                 }}
 
-                // --- Основная функция обновления стилей --- 
+                // --- Основная функция обновления стилей ---
+                // Размер шрифта - одна CSS-переменная на :root, цвета - переменные строк.
+                // Все записи в DOM собираются в один кадр requestAnimationFrame.
+                let pendingUpdate = false;
+                let signalColorsDirty = false;
+                let complexityColorsDirty = false;
+
                 function updateTableStyles() {{
+                    pendingUpdate = false;
+                    rootStyle.setProperty('--fs', currentFontSize + 'pt');
+                    rootStyle.setProperty('--fs-semantic', Math.round(currentFontSize * 0.87) + 'pt');
+
+                    if (!signalColorsDirty && !complexityColorsDirty) {{ return; }}
+                    if (signalColorsDirty) {{ recomputeSignalColors(); }}
+                    if (complexityColorsDirty) {{ recomputeComplexityColors(); }}
+
                     textCells.forEach((cell, index) => {{
                         if (index < paragraphData.length) {{
                             const data = paragraphData[index];
-                            const normalizedSignal = normalizeValue(data.signal, currentRanges.min_signal, currentRanges.max_signal);
-                            cell.style.backgroundColor = interpolateColor(normalizedSignal, currentColors.signal_min, currentColors.signal_max);
-                            const normalizedComplexity = normalizeValue(data.complexity, currentRanges.min_complexity, currentRanges.max_complexity);
-                            cell.style.color = interpolateColor(normalizedComplexity, currentColors.complexity_min, currentColors.complexity_max);
-                            cell.style.fontSize = currentFontSize + 'pt';
+                            if (signalColorsDirty) {{ cell.style.setProperty('--sig', data.bg); }}
+                            if (complexityColorsDirty) {{ cell.style.setProperty('--cx', data.fg); }}
                         }}
                     }});
-                    
-                    semanticCells.forEach((cell, index) => {{
-                         if (index < paragraphData.length) {{
-                             cell.style.fontSize = Math.round(currentFontSize * 0.87) + 'pt';
-                         }}
-                    }});
-                    
-                    updateHeatmapBar();
+
+                    if (signalColorsDirty) {{ updateHeatmapBar(); }}
+                    signalColorsDirty = false;
+                    complexityColorsDirty = false;
+                }}
+
+                function scheduleUpdate() {{
+                    if (pendingUpdate) {{ return; }}
+                    pendingUpdate = true;
+                    requestAnimationFrame(updateTableStyles);
                 }}
 
                 // --- Обработчики событий ---
@@ -319,29 +425,34 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
                     const newSize = parseInt(event.target.value, 10);
                     if (!isNaN(newSize) && newSize >= 8 && newSize <= 30) {{
                          currentFontSize = newSize;
-                         updateTableStyles();
+                         scheduleUpdate();
                     }}
                 }});
 
                 signalMinColorInput.addEventListener('input', (event) => {{
                     currentColors.signal_min = event.target.value;
-                    updateTableStyles();
+                    signalColorsDirty = true;
+                    scheduleUpdate();
                 }});
                 signalMaxColorInput.addEventListener('input', (event) => {{
                     currentColors.signal_max = event.target.value;
-                    updateTableStyles();
+                    signalColorsDirty = true;
+                    scheduleUpdate();
                 }});
                 complexityMinColorInput.addEventListener('input', (event) => {{
                     currentColors.complexity_min = event.target.value;
-                    updateTableStyles();
+                    complexityColorsDirty = true;
+                    scheduleUpdate();
                 }});
                 complexityMaxColorInput.addEventListener('input', (event) => {{
                     currentColors.complexity_max = event.target.value;
-                    updateTableStyles();
+                    complexityColorsDirty = true;
+                    scheduleUpdate();
                 }});
 
-                // --- Инициализация стилей при загрузке страницы ---
-                document.addEventListener('DOMContentLoaded', updateTableStyles);
+                // --- Инициализация при загрузке страницы ---
+                // Цвета строк уже заданы в HTML, рисуем только полосу heatmap
+                document.addEventListener('DOMContentLoaded', updateHeatmapBar);
 
             </script>
         </body>
@@ -349,7 +460,16 @@ def create_styled_report(df: pd.DataFrame, output_html_path: str, topic: str):
         """
 
         with open(output_html_path, 'w', encoding='utf-8') as f:
-            f.write(html_full)
+            f.write(html_head)
+            f.write(_TABLE_HEAD_HTML)
+            _write_table_rows(f, semantic_values, text_values, precomputed_bg, precomputed_fg)
+            f.write(_TABLE_TAIL_HTML)
+            f.write(html_script_head)
+            if orjson is not None:
+                f.write(_to_json(js_data))
+            else:
+                json.dump(js_data, f)
+            f.write(html_tail)
 
         logging.info(f"Интерактивный HTML-отчет успешно сохранен: {output_html_path}")
 
@@ -1,4 +1,5 @@
 import os
+import re
 import logging
 from dotenv import load_dotenv
 
@@ -14,6 +15,9 @@ except ImportError:
     openai = None
     exit() # Выходим, если библиотека не найдена
 
+# Семейства моделей, которые выводим в списке
+WANTED_MODELS_RE = re.compile(r'gpt|embedding|whisper|tts|dall-e')
+
 def list_openai_models():
     """Подключается к OpenAI API и выводит список доступных моделей."""
     load_dotenv()
@@ -35,18 +39,12 @@ def list_openai_models():
         models_response = client.models.list()
 
         logging.info("----- Доступные модели OpenAI API -----")
-        count = 0
-        model_ids = []
-        for model in models_response.data:
-            model_ids.append(model.id)
-        
-        # Сортируем и фильтруем
-        for model_id in sorted(model_ids):
-             if 'gpt' in model_id or 'embedding' in model_id or 'whisper' in model_id or 'tts' in model_id or 'dall-e' in model_id:
-                 print(f"- {model_id}")
-                 count += 1
+        # Фильтруем и сортируем за один проход
+        filtered_ids = sorted(model.id for model in models_response.data if WANTED_MODELS_RE.search(model.id))
+        for model_id in filtered_ids:
+            print(f"- {model_id}")
         
-        logging.info(f"----- Найдено {count} моделей (отфильтровано) -----")
+        logging.info(f"----- Найдено {len(filtered_ids)} моделей (отфильтровано) -----")
         
     except openai.AuthenticationError:
         logging.error("Ошибка аутентификации. Проверьте правильность вашего OpenAI API ключа.")
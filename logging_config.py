@@ -1,21 +1,75 @@
+import atexit
 import logging
+import os
+import queue
 import sys
 from pathlib import Path
 import time
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # Импортируем settings из config.py
 from config import settings 
 
+# Дата в имени файла основных логов вычисляется один раз при импорте: файл ротируется
+# только по размеру, а не по времени, поэтому несколько воркеров не удаляют бэкапы друг друга
+APP_LOG_DATE = time.strftime('%Y-%m-%d')
+
+# Фоновые слушатели очередей логов: запись в файлы и консоль идет в отдельных потоках,
+# а вызывающий код только кладет запись в очередь. Пары (QueueHandler, QueueListener)
+_queue_listeners: list[tuple[QueueHandler, QueueListener]] = []
+
+def _stop_queue_listeners() -> None:
+    """Дописывает накопленные в очередях записи и останавливает потоки слушателей."""
+    while _queue_listeners:
+        _, listener = _queue_listeners.pop()
+        listener.stop()
+
+atexit.register(_stop_queue_listeners)
+
+def _restart_queue_listeners_in_child() -> None:
+    """
+    Потоки не переживают fork: при gunicorn --preload setup_logging выполняется в мастере,
+    и без перезапуска слушателей записи воркеров копились бы в очередях, которые никто не читает.
+    Каждой паре выдается новая очередь (записи, поставленные до fork, допишет мастер)
+    и новый поток слушателя.
+    """
+    for queue_handler, listener in _queue_listeners:
+        log_queue = queue.SimpleQueue()
+        queue_handler.queue = log_queue
+        listener.queue = log_queue
+        listener._thread = None # Поток родителя в дочернем процессе не существует
+        listener.start()
+
+if hasattr(os, "register_at_fork"): # Нет на Windows
+    os.register_at_fork(after_in_child=_restart_queue_listeners_in_child)
+
+def _attach_via_queue(logger: logging.Logger, *handlers: logging.Handler) -> None:
+    """Подключает обработчики к логгеру через QueueHandler и фоновый QueueListener."""
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _queue_listeners.append((queue_handler, listener))
+
 def setup_logging(log_level_str: str = "INFO"):
     """Настраивает систему логирования приложения."""
     
     # Преобразуем строковый уровень лога в числовой
     log_level = getattr(logging, log_level_str.upper(), logging.INFO)
 
+    # Не собираем в каждой записи ненужные атрибуты (имя процесса, потока, multiprocessing)
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
     log_formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
+    # Время в UTC: gmtime дешевле localtime (без учета часового пояса), суффикс Z явно помечает UTC
+    log_formatter.converter = time.gmtime
+    log_formatter.default_time_format = "%Y-%m-%dT%H:%M:%S"
+    log_formatter.default_msec_format = "%s.%03dZ"
     
     # Создаем директорию для логов, если не существует
     # Используем LOG_DIR из settings
@@ -25,6 +79,7 @@ def setup_logging(log_level_str: str = "INFO"):
     # Настройка корневого логгера
     root_logger = logging.getLogger() # Получаем корневой логгер
     # Очищаем существующие обработчики, если они есть, чтобы избежать дублирования
+    _stop_queue_listeners()
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
         
@@ -33,11 +88,10 @@ def setup_logging(log_level_str: str = "INFO"):
     # Консольный обработчик
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(log_formatter)
-    root_logger.addHandler(console_handler)
     
     # Файловый обработчик с ротацией по размеру для основных логов приложения
-    # Имя файла теперь включает дату
-    app_log_filename = log_dir_path / f"app_{time.strftime('%Y-%m-%d')}.log"
+    # Имя файла включает дату запуска
+    app_log_filename = log_dir_path / f"app_{APP_LOG_DATE}.log"
     app_file_handler = RotatingFileHandler(
         filename=app_log_filename,
         maxBytes=10_485_760,  # 10 MB
@@ -45,7 +99,7 @@ def setup_logging(log_level_str: str = "INFO"):
         encoding="utf-8"
     )
     app_file_handler.setFormatter(log_formatter)
-    root_logger.addHandler(app_file_handler)
+    _attach_via_queue(root_logger, console_handler, app_file_handler)
     
     # Отдельный логгер для метрик производительности
     perf_logger = logging.getLogger("performance")
@@ -61,7 +115,7 @@ def setup_logging(log_level_str: str = "INFO"):
         encoding="utf-8"
     )
     perf_file_handler.setFormatter(log_formatter)
-    perf_logger.addHandler(perf_file_handler)
+    _attach_via_queue(perf_logger, perf_file_handler)
     perf_logger.propagate = False  # Не дублируем записи в корневой логгер
     
     # Логирование для API запросов
@@ -77,7 +131,7 @@ def setup_logging(log_level_str: str = "INFO"):
         encoding="utf-8"
     )
     api_file_handler.setFormatter(log_formatter)
-    api_logger.addHandler(api_file_handler)
+    _attach_via_queue(api_logger, api_file_handler)
     api_logger.propagate = False
     
     logging.info(f"Система логирования инициализирована. Уровень: {log_level_str.upper()}. Директория логов: {log_dir_path.resolve()})")
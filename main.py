@@ -1,23 +1,40 @@
+from __future__ import annotations
+
+import asyncio
 import logging
+import operator
 import os
-from pathlib import Path # Убедимся, что Path импортирован здесь
+import signal
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson # type: ignore # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    DefaultJSONResponse = JSONResponse # Fallback на стандартный json
 
 from config import settings
 from logging_config import setup_logging
 
 # --- Импорт сервисов и роутера --- 
 from api.routes import router as api_router
-from api.routes_hybrid import router as hybrid_router  # Новый гибридный роутер
-from api.routes_optimized import router as optimized_router  # Оптимизированный роутер
-from services.session_store import SessionStore
-from services.embedding_service import EmbeddingService, get_embedding_service
-from services.openai_service import OpenAIService, get_openai_service
-from api.orchestrator import AnalysisOrchestrator
-# ExportService не используется напрямую в main, но его DI может быть здесь для инициализации
-from services.export_service import ExportService 
+from api.routes_hybrid import router as hybrid_router, startup_hybrid_routes, shutdown_hybrid_routes  # Новый гибридный роутер
+from api.routes_optimized import router as optimized_router, startup_optimized_routes, shutdown_optimized_routes  # Оптимизированный роутер
+# Фабрики синглтонов нужны на уровне модуля как ключи dependency_overrides;
+# классы сервисов импортируются внутри lifespan (и в TYPE_CHECKING для аннотаций)
+from services.embedding_service import get_embedding_service, is_embedding_service_loaded
+from services.openai_service import get_openai_service
+from utils.rate_limiter import concurrency_controller
+
+if TYPE_CHECKING:
+    from services.embedding_service import EmbeddingService
 
 # --- Настройка логирования --- 
 log_level_from_settings = "DEBUG" if settings.DEBUG else "INFO"
@@ -26,12 +43,227 @@ setup_logging(log_level_str=log_level_from_settings)
 # Получаем логгер для текущего модуля (main)
 logger = logging.getLogger(__name__) 
 
+# --- Инициализация и управление состоянием (сервисами) --- 
+# Храним экземпляры сервисов в app.state для обеспечения синглтонов в рамках приложения.
+# Те же экземпляры один раз связываются в _services: переопределения зависимостей
+# читают один атрибут модуля на запрос вместо обращений к app.state.
+_services = SimpleNamespace(
+    session_store=None,
+    embedding_service=None,
+    openai_service=None,
+    export_service=None,
+    orchestrator=None
+)
+
+# Длительности фаз старта, мс (session_store, openai, export, embedding, orchestrator, total)
+_startup_timings: dict[str, float] = {}
+
+def _record_phase(phase: str, t0: float) -> None:
+    dt_ms = (time.perf_counter() - t0) * 1000
+    _startup_timings[phase] = round(dt_ms, 1)
+    logger.debug("phase=%s_init dt_ms=%.1f", phase, dt_ms)
+
+def _timed_phase(phase: str, func, *args, **kwargs):
+    """Выполняет func и записывает длительность фазы старта в _startup_timings (в лог - на DEBUG)."""
+    t0 = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _record_phase(phase, t0)
+
+async def _timed_phase_async(phase: str, awaitable):
+    """Асинхронный вариант _timed_phase для корутин инициализации."""
+    t0 = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        _record_phase(phase, t0)
+
+def _warmup_schemas(app: FastAPI) -> None:
+    """
+    Строит схему OpenAPI заранее. JSON-схемы моделей FastAPI строит лениво в app.openapi()
+    при первом обращении к документации; результат кэшируется в app.openapi_schema.
+    """
+    app.openapi()
+
+# Потоков torch на процесс (задается в _configure_torch_threads)
+_torch_threads: int | None = None
+
+def _configure_torch_threads() -> None:
+    """
+    Делит ядра между воркерами: по умолчанию torch в каждом процессе берет все ядра,
+    и несколько воркеров uvicorn/gunicorn конкурируют за них. Вызывается до загрузки модели;
+    переменные окружения действуют, только если torch еще не импортирован (он импортируется лениво).
+    """
+    global _torch_threads
+    threads = max(1, (os.cpu_count() or 1) // max(1, settings.WORKERS))
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    import torch # type: ignore
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass # Уже задано в этом процессе (например, в мастере gunicorn до fork)
+    _torch_threads = threads
+
+def _load_embedding_service() -> EmbeddingService:
+    """Настраивает потоки torch и загружает синглтон EmbeddingService."""
+    _configure_torch_threads()
+    return get_embedding_service()
+
+# PID процесса, импортировавшего main: при gunicorn --preload это мастер, а воркеры - его форки
+_IMPORT_PID = os.getpid()
+
+# gunicorn -k uvicorn.workers.UvicornWorker --preload с RUN_MAIN_LOAD_IN_MASTER=1: модель грузится
+# один раз в мастере до fork, воркеры наследуют веса через copy-on-write вместо своей копии.
+# Только для CPU: инициализированная в мастере CUDA в форках не работает.
+def _preload_embedding_in_master() -> None:
+    """Загрузка модели в мастере до fork; на хосте с GPU пропускается, чтобы не инициализировать CUDA до fork."""
+    # Проверка доступности через NVML не вызывает cuInit, и воркеры после fork смогут работать с CUDA
+    os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+    import torch # type: ignore
+    if torch.cuda.is_available():
+        logger.warning(
+            "RUN_MAIN_LOAD_IN_MASTER=1 игнорируется: доступна CUDA, а инициализированная в мастере CUDA "
+            "не работает в форках. Модель загрузится в каждом воркере отдельно."
+        )
+        return
+    _timed_phase("embedding_preload", _load_embedding_service)
+
+if os.environ.get("RUN_MAIN_LOAD_IN_MASTER") == "1":
+    _preload_embedding_in_master()
+
+async def _deferred_init(app: FastAPI, embedding_loading: "asyncio.Task[EmbeddingService]", started_at: float) -> None:
+    """Дожидается фоновой загрузки модели эмбеддингов и создает оркестратор, которому она нужна."""
+    from api.orchestrator import AnalysisOrchestrator
+    try:
+        app.state.embedding_service = await embedding_loading
+    except Exception as e:
+        # Исключение при загрузке (например, ImportError torch) - тот же отказ, что и неготовая модель
+        logger.error("Загрузка EmbeddingService завершилась исключением: %s", e, exc_info=True)
+        app.state.embedding_service = None
+    if app.state.embedding_service is None or not app.state.embedding_service.is_ready():
+        # Ошибка загрузки модели постоянна: не повторяем ее обнаружение в каждом запросе
+        app.state.embedding_failed = True
+        if settings.EMBEDDING_REQUIRED:
+            logger.critical("КРИТИЧЕСКАЯ ОШИБКА: EmbeddingService не смог инициализировать модель! Останавливаем процесс (EMBEDDING_REQUIRED=True).")
+            # Штатная остановка uvicorn: оркестратор контейнеров перезапустит процесс
+            signal.raise_signal(signal.SIGTERM)
+        else:
+            logger.error("КРИТИЧЕСКАЯ ОШИБКА: EmbeddingService не смог инициализировать модель! Зависящие от нее эндпоинты отвечают 503.")
+        return
+    _services.embedding_service = app.state.embedding_service
+
+    # Оркестратор (требует другие сервисы)
+    app.state.orchestrator = _services.orchestrator = _timed_phase(
+        "orchestrator",
+        AnalysisOrchestrator,
+        session_store=app.state.session_store,
+        embedding_service=app.state.embedding_service,
+        openai_service=app.state.openai_service
+    )
+    # Итог старта: фазы SessionStore/OpenAI и загрузка модели шли параллельно,
+    # поэтому total близок к самой долгой из них, а не к сумме
+    _startup_timings["total"] = round((time.perf_counter() - started_at) * 1000, 1)
+    logger.info(
+        "Модель эмбеддингов и AnalysisOrchestrator готовы (потоков torch: %s). Длительности старта, мс: %s",
+        _torch_threads, _startup_timings
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from services.session_store import SessionStore
+    from services.export_service import ExportService
+    logger.info("Запуск FastAPI приложения '%s' v%s...", settings.APP_NAME, app.version)
+    started_at = time.perf_counter()
+
+    # Модель эмбеддингов (фабрика синглтона EmbeddingService) грузится в фоне: порт открывается сразу,
+    # /health/live отвечает без ожидания, а /health/ready и зависящие от модели эндпоинты ждут _emb_ready.
+    app.state.embedding_failed = False # Сброс при повторном запуске lifespan (например, в тестах)
+    if os.getpid() != _IMPORT_PID and not is_embedding_service_loaded():
+        logger.warning(
+            "Модель эмбеддингов загружается после fork отдельно в каждом воркере. "
+            "Для одной общей копии запускайте gunicorn с --preload и RUN_MAIN_LOAD_IN_MASTER=1."
+        )
+    embedding_loading = asyncio.create_task(asyncio.to_thread(_timed_phase, "embedding", _load_embedding_service))
+
+    # Подключение SessionStore к Redis (асинхронное) и OpenAIService независимы: выполняем их параллельно.
+    # OpenAIService создается фабрикой синглтона в потоке.
+    session_store = SessionStore(
+        redis_url=settings.REDIS_URL,
+        ttl_seconds=settings.SESSION_TTL,
+        max_connections=settings.REDIS_POOL_SIZE
+    )
+    _, openai_service = await asyncio.gather(
+        _timed_phase_async("session_store", session_store.connect()),
+        asyncio.to_thread(_timed_phase, "openai", get_openai_service)
+    )
+    app.state.session_store = _services.session_store = session_store
+
+    app.state.openai_service = _services.openai_service = openai_service
+    if settings.ENABLE_SEMANTIC_ANALYSIS and not app.state.openai_service.is_available:
+        logger.warning("OpenAIService: OpenAI API НЕДОСТУПЕН. Семантический анализ будет ограничен.")
+
+    app.state._emb_ready = asyncio.create_task(_deferred_init(app, embedding_loading, started_at))
+    
+    # ExportService (требует session_store)
+    app.state.export_service = _services.export_service = _timed_phase(
+        "export",
+        ExportService,
+        session_store=app.state.session_store, 
+        export_dir=settings.EXPORT_DIR, 
+        ttl_seconds=settings.SESSION_TTL 
+    )
+
+    # Прогрев общих анализаторов гибридного и оптимизированного роутеров
+    await startup_hybrid_routes()
+    await startup_optimized_routes()
+
+    if settings.WARMUP_SCHEMAS and app.openapi_url:
+        # Только когда документация включена (в продакшене openapi_url=None и строить нечего). В потоке, параллельно с загрузкой модели: первый запрос к /docs не ждет построения схемы
+        app.state._schema_warmup = asyncio.create_task(asyncio.to_thread(_timed_phase, "schemas", _warmup_schemas, app))
+    
+    # Одна итоговая строка вместо сообщения на каждый сервис; модель эмбеддингов
+    # отчитается отдельно из _deferred_init, когда загрузится
+    logger.info(
+        "Приложение '%s' запущено (debug=%s, семантический анализ: %s, документация: %s). Длительности фаз, мс: %s",
+        settings.APP_NAME,
+        settings.DEBUG,
+        "отключен" if not settings.ENABLE_SEMANTIC_ANALYSIS else ("доступен" if app.state.openai_service.is_available else "недоступен"),
+        f"http://{settings.HOST}:{settings.PORT}{app.docs_url}" if app.docs_url else "отключена",
+        _startup_timings
+    )
+
+    yield
+
+    logger.info("Остановка FastAPI приложения '%s'...", settings.APP_NAME)
+    app.state._emb_ready.cancel() # Если модель еще грузится, перестаем ждать ее
+    await shutdown_hybrid_routes()
+    await shutdown_optimized_routes()
+    # Последний подобранный лимит параллельности OpenAI - стартовая точка следующего запуска
+    concurrency_controller.save_state()
+    if app.state.session_store is not None and app.state.session_store.redis_client:
+        try:
+            await app.state.session_store.close()
+        except Exception as e:
+            logger.error("Ошибка при закрытии соединения с Redis: %s", e)
+    logger.info("Приложение остановлено.")
+
 # --- Инициализация FastAPI приложения --- 
 app = FastAPI(
     title=settings.APP_NAME,
     version="1.0.1", # Небольшое обновление версии для новой архитектуры
     description="API для анализа текста по показателям читаемости, сигнальности и семантической функции. Новая архитектура.",
     debug=settings.DEBUG,
+    lifespan=lifespan,
+    default_response_class=DefaultJSONResponse,
+    # Схема OpenAPI и Swagger/ReDoc нужны только при разработке: без них не строится
+    # схема всех моделей маршрутов
+    docs_url="/docs" if settings.DEBUG else None,
+    redoc_url="/redoc" if settings.DEBUG else None,
+    openapi_url="/openapi.json" if settings.DEBUG else None,
     # Можно добавить openapi_tags из docs/Strategy of Transit.md, если нужно
     openapi_tags=[
         {
@@ -45,124 +277,71 @@ app = FastAPI(
     ]
 )
 
+# Значения app.state по умолчанию: обработчики читают атрибуты напрямую, без hasattr/getattr
+# (до завершения lifespan или при ошибке старта атрибуты просто None)
+app.state.session_store = None
+app.state.embedding_service = None
+app.state.openai_service = None
+app.state.export_service = None
+app.state.orchestrator = None
+app.state.embedding_failed = False
+app.state._last_ping = None
+
 # --- Настройка CORS --- 
 if settings.CORS_ORIGINS:
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.CORS_ORIGINS,
         allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
+        # Явные списки вместо "*": API использует только эти методы, а фронтенд - эти заголовки
+        allow_methods=("GET", "POST", "DELETE", "OPTIONS"),
+        allow_headers=("content-type", "accept", "authorization"),
     )
 else:
-    logging.warning("CORS_ORIGINS не определены. CORS middleware не будет добавлен.")
-
-# --- Инициализация и управление состоянием (сервисами) --- 
-# Храним экземпляры сервисов в app.state для обеспечения синглтонов в рамках приложения.
-
-@app.on_event("startup")
-async def startup_event():
-    logging.info(f"Запуск FastAPI приложения '{settings.APP_NAME}' v{app.version}...")
-    
-    # Создание директории для экспорта, если ее нет
-    export_dir_path = Path(settings.EXPORT_DIR)
-    try:
-        export_dir_path.mkdir(parents=True, exist_ok=True)
-        logging.info(f"Директория для экспорта '{export_dir_path.resolve()}' готова.")
-    except Exception as e:
-        logging.error(f"Не удалось создать директорию для экспорта '{export_dir_path.resolve()}': {e}")
-
-    logging.info("Инициализация сервисов...")
-    # SessionStore
-    app.state.session_store = SessionStore(redis_url=settings.REDIS_URL, ttl_seconds=settings.SESSION_TTL)
-    logger.info("SessionStore инициализирован.")
-
-    # EmbeddingService (используем фабрику, которая создает синглтон)
-    app.state.embedding_service = get_embedding_service() 
-    if not app.state.embedding_service.is_ready():
-        logger.error("КРИТИЧЕСКАЯ ОШИБКА: EmbeddingService не смог инициализировать модель!")
-    else:
-        logger.info("EmbeddingService инициализирован и готов.")
-
-    # OpenAIService (используем фабрику, которая создает синглтон)
-    app.state.openai_service = get_openai_service() 
-    if settings.ENABLE_SEMANTIC_ANALYSIS:
-        if app.state.openai_service.is_available:
-            logger.info("OpenAIService инициализирован. Семантический анализ через OpenAI API доступен.")
-        else:
-            logger.warning("OpenAIService: OpenAI API НЕДОСТУПЕН. Семантический анализ будет ограничен.")
-    else:
-        logger.info("OpenAIService: Семантический анализ отключен в настройках (ENABLE_SEMANTIC_ANALYSIS=False).")
-    
-    # ExportService (требует session_store)
-    app.state.export_service = ExportService(
-        session_store=app.state.session_store, 
-        export_dir=settings.EXPORT_DIR, 
-        ttl_seconds=settings.SESSION_TTL 
-    )
-    logger.info("ExportService инициализирован.")
-
-    # Оркестратор (требует другие сервисы)
-    app.state.orchestrator = AnalysisOrchestrator(
-        session_store=app.state.session_store,
-        embedding_service=app.state.embedding_service,
-        openai_service=app.state.openai_service
-    )
-    logger.info("AnalysisOrchestrator инициализирован.")
-    
-    logging.info(f"Приложение '{settings.APP_NAME}' успешно запущено. Debug mode: {settings.DEBUG}")
-    logging.info(f"Доступно по адресу: http://{settings.HOST}:{settings.PORT}{app.docs_url}")
-    logging.info(f"Документация ReDoc: http://{settings.HOST}:{settings.PORT}{app.redoc_url}")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logging.info(f"Остановка FastAPI приложения '{settings.APP_NAME}'...")
-    if hasattr(app.state, 'session_store') and app.state.session_store.redis_client:
-        try:
-            app.state.session_store.redis_client.close()
-            logger.info("Соединение с Redis закрыто.")
-        except Exception as e:
-            logger.error(f"Ошибка при закрытии соединения с Redis: {e}")
-    logging.info("Приложение остановлено.")
+    logger.warning("CORS_ORIGINS не определены. CORS middleware не будет добавлен.")
 
 # --- Переопределение зависимостей для использования экземпляров из app.state --- 
 
-def get_session_store_override() -> SessionStore:
-    return app.state.session_store
-
-def get_embedding_service_override() -> EmbeddingService:
-    return app.state.embedding_service
+async def _wait_embedding_ready() -> None:
+    # shield: отмена одного запроса не должна отменять общую загрузку модели
+    await asyncio.shield(app.state._emb_ready)
+    if app.state.embedding_failed:
+        raise HTTPException(status_code=503, detail="Модель эмбеддингов не загружена, анализ недоступен.")
 
-def get_openai_service_override() -> OpenAIService:
-    return app.state.openai_service
+def _service_getter(name: str, needs_embedding: bool = False):
+    """
+    Создает переопределение зависимости, возвращающее экземпляр сервиса из _services.
+    Переопределения асинхронные: синхронные зависимости FastAPI выполняет в threadpool,
+    что на каждый запрос дороже самого чтения атрибута. Сервисы, связываемые после
+    загрузки модели эмбеддингов, до этого ждут ее готовности.
+    """
+    get = operator.attrgetter(name)
+    if not needs_embedding:
+        async def _dependency():
+            return get(_services)
+        return _dependency
 
-def get_export_service_override() -> ExportService:
-    return app.state.export_service
+    async def _dependency():
+        service = get(_services)
+        if service is None:
+            await _wait_embedding_ready()
+            service = get(_services)
+        return service
+    return _dependency
 
-def get_orchestrator_override() -> AnalysisOrchestrator:
-    return app.state.orchestrator
+# Применяем переопределения к зависимостям в роутере: placeholder DI-функции из api.routes
+# и фабрики синглтонов get_embedding_service/get_openai_service, чтобы все эндпоинты
+# получали экземпляры, созданные в lifespan
+from api.routes import get_session_store_di, get_orchestrator_di, get_export_service_di
 
-# Применяем переопределения к зависимостям в роутере
-# Импортируем новые DI-функции из api.routes
-from api.routes import (
-    get_session_store_di, 
-    get_orchestrator_di, 
-    get_export_service_di,
-    # get_embedding_service и get_openai_service используются напрямую в get_orchestrator_di,
-    # и они уже являются фабриками синглтонов, которые мы переопределяем ниже, если нужно.
-    # Однако, лучше переопределять именно те placeholder DI функции, которые мы создали в routes.py
-)
-
-app.dependency_overrides[get_session_store_di] = get_session_store_override
-app.dependency_overrides[get_export_service_di] = get_export_service_override
-app.dependency_overrides[get_orchestrator_di] = get_orchestrator_override
-
-# Для get_embedding_service и get_openai_service, которые являются фабриками в своих модулях
-# и используются напрямую в get_orchestrator_di, мы также можем их переопределить,
-# чтобы они возвращали экземпляры из app.state, обеспечивая строгий контроль над синглтонами из main.
-# Это делает логику DI более централизованной.
-app.dependency_overrides[get_embedding_service] = get_embedding_service_override
-app.dependency_overrides[get_openai_service] = get_openai_service_override
+for dependency, service_name, needs_embedding in (
+    (get_session_store_di, "session_store", False),
+    (get_export_service_di, "export_service", False),
+    (get_orchestrator_di, "orchestrator", True),
+    (get_embedding_service, "embedding_service", True),
+    (get_openai_service, "openai_service", False),
+):
+    app.dependency_overrides[dependency] = _service_getter(service_name, needs_embedding)
 
 
 # --- Подключение роутеров API --- 
@@ -171,33 +350,77 @@ app.include_router(hybrid_router)  # Гибридный роутер с Realtime
 app.include_router(optimized_router)  # Оптимизированный роутер
 
 # --- Эндпоинт для проверки здоровья --- 
+HEALTH_PING_TTL = 2.0 # Секунд, на которые кэшируется результат ping Redis для /health
+# Неизменные части ответов health-эндпоинтов собираются один раз
+_HEALTH_STATIC = {"app_name": settings.APP_NAME, "version": app.version}
+_HEALTH_LIVE_BODY = b'{"status":"alive"}'
+
+async def _redis_ping_cached() -> bool:
+    """
+    Ping Redis не чаще раза в HEALTH_PING_TTL секунд, чтобы под нагрузкой
+    health-запросы не добавляли по round-trip к Redis каждый.
+    """
+    now = time.monotonic()
+    last_ping = app.state._last_ping
+    if last_ping is not None and now - last_ping[0] < HEALTH_PING_TTL:
+        return last_ping[1]
+    session_store = _services.session_store
+    ok = False
+    if session_store is not None:
+        try:
+            ok = await session_store.ping()
+        except Exception as e:
+            logger.warning("Health check: Redis не отвечает на ping: %s", e)
+    app.state._last_ping = (now, ok)
+    return ok
+
 @app.get("/health", tags=["System"])
 async def health_check():
     """Проверяет работоспособность сервиса и доступность основных компонентов."""
-    # Проверка доступности ключевых сервисов
+    # Проверка доступности ключевых сервисов по ссылкам из _services
+    # (embedding_service связывается там только после успешной загрузки модели)
+    embedding_service = _services.embedding_service
+    openai_service = _services.openai_service
     services_status = {
-        "session_store_redis_connected": app.state.session_store.redis_client is not None and app.state.session_store.redis_client.ping() if hasattr(app.state, 'session_store') and hasattr(app.state.session_store, 'redis_client') else False,
-        "embedding_service_ready": app.state.embedding_service.is_ready() if hasattr(app.state, 'embedding_service') else False,
-        "openai_service_available": app.state.openai_service.is_available if hasattr(app.state, 'openai_service') else False
+        "session_store_redis_connected": await _redis_ping_cached(),
+        "embedding_service_ready": embedding_service is not None and embedding_service.is_ready(),
+        "openai_service_available": openai_service is not None and openai_service.is_available
     }
     overall_status = "ok" if all(services_status.values()) else "degraded"
     if not services_status["embedding_service_ready"]:
         overall_status = "error_embedding_model_not_loaded"
 
-    return {
-        "status": overall_status,
-        "app_name": settings.APP_NAME,
-        "version": app.version,
-        "services": services_status
-    }
+    return DefaultJSONResponse({**_HEALTH_STATIC, "status": overall_status, "services": services_status})
+
+@app.get("/health/live", tags=["System"])
+async def health_live():
+    """Liveness: процесс запущен и обслуживает запросы (не ждет загрузки модели)."""
+    return Response(content=_HEALTH_LIVE_BODY, media_type="application/json")
+
+@app.get("/health/ready", tags=["System"])
+async def health_ready():
+    """Readiness: 503, пока модель эмбеддингов загружается в фоне или не смогла загрузиться."""
+    embedding_service = _services.embedding_service
+    if embedding_service is None or not embedding_service.is_ready():
+        status = "failed" if app.state.embedding_failed else "loading"
+        return DefaultJSONResponse(status_code=503, content={"status": status})
+    return {"status": "ready"}
+
+if settings.DEBUG:
+    # Повторное подключение роутера удвоило бы маршруты (и построение их pydantic-схем)
+    _route_keys = [(route.path, tuple(sorted(getattr(route, "methods", None) or ()))) for route in app.routes]
+    assert len(set(_route_keys)) == len(_route_keys), "Маршруты зарегистрированы повторно"
 
 # --- Запуск Uvicorn сервера --- 
 if __name__ == "__main__":
     import uvicorn
+    # loop/http по умолчанию ("auto") сами выбирают uvloop и httptools, если установлен uvicorn[standard]
     uvicorn.run(
         "main:app", 
         host=settings.HOST, 
         port=settings.PORT, 
         reload=settings.DEBUG, 
+        # reload работает только с одним процессом
+        workers=None if settings.DEBUG else settings.WORKERS,
         log_level=log_level_from_settings.lower()
     )
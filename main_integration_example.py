@@ -1,15 +1,18 @@
 """
 Пример интеграции гибридного семантического анализа в FastAPI приложение.
 Показывает, как добавить новые эндпоинты к существующему приложению.
+
+Файл - только документация: весь код закомментирован или в строках, поэтому его
+импорт ничего не регистрирует. В main.py гибридный роутер уже подключен.
 """
 
 # В вашем main_new.py добавьте эти строки:
 
 # 1. Импорт нового роутера (в начале файла с другими импортами)
-from api.routes_hybrid import router as hybrid_router
+# from api.routes_hybrid import router as hybrid_router
 
 # 2. Подключение роутера к приложению (после других app.include_router)
-app.include_router(hybrid_router)
+# app.include_router(hybrid_router)
 
 # Готово! Теперь доступны новые эндпоинты:
 # - POST /api/v1/hybrid/chunk/metrics/semantic
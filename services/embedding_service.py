@@ -1,27 +1,92 @@
+import functools
 import logging
+import os
 import time
 import asyncio
-from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional, Dict, Union, Any
+from typing import List, Optional, Dict, Union, Any, TYPE_CHECKING
 
-import hashlib
 import numpy as np # type: ignore
 import pandas as pd # type: ignore
-import torch # type: ignore
-from sentence_transformers import SentenceTransformer, util # type: ignore
+
+from utils.text_processing import cache_key
+
+# torch и sentence_transformers импортируются лениво внутри методов: их загрузка занимает
+# секунды и не должна происходить при `import main` до открытия порта
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer # type: ignore
 
 # Получаем логгер для этого модуля
 logger = logging.getLogger(__name__)
 
+def inference_mode(func):
+    """
+    Выполняет метод под torch.inference_mode(): без записи autograd-графа и счетчиков версий
+    тензоров для encode и cos_sim. torch импортируется при вызове, а не при импорте модуля.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        import torch # type: ignore
+        with torch.inference_mode():
+            return func(*args, **kwargs)
+    return wrapper
+
 # Глобальный экземпляр для синглтона (используется get_embedding_service)
 _embedding_service_instance: Optional["EmbeddingService"] = None
 
+class LRUCache:
+    """
+    Двухпоколенный LRU (hashlru): свежие ключи копятся в new, при заполнении new
+    становится old, а прежний old отбрасывается целиком. Попадание - обычный lookup
+    в dict без move_to_end; в памяти не больше capacity записей, вытесняются
+    давно не использованные.
+    """
+    def __init__(self, capacity: int):
+        self.new: Dict[str, Any] = {}
+        self.old: Dict[str, Any] = {}
+        self.capacity: int = capacity
+        self.size: int = max(1, capacity // 2) # Емкость одного поколения
+
+    def _promote(self, key: str, value: Any) -> None:
+        self.new[key] = value
+        if len(self.new) >= self.size:
+            self.old, self.new = self.new, {}
+
+    def get(self, key: str) -> Optional[Any]:
+        if key in self.new:
+            return self.new[key]
+        if key in self.old:
+            value = self.old[key]
+            self._promote(key, value) # Переносим в новое поколение как недавно использованный
+            return value
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        self._promote(key, value)
+
+    def pop(self, key: str) -> Optional[Any]:
+        old_value = self.old.pop(key, None)
+        new_value = self.new.pop(key, None)
+        return new_value if new_value is not None else old_value
+
+    def clear(self) -> None:
+        self.new.clear()
+        self.old.clear()
+
+    def __len__(self) -> int:
+        return len(self.new) + len(self.old) # Оценка сверху: ключ может быть в обоих поколениях
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.new or key in self.old
+
 class EmbeddingService:
     """
     Сервис для управления эмбеддингами текста с поддержкой кэширования.
     Инкапсулирует модель и кэш, предоставляя методы для анализа текста.
     """
+
+    # Ключ кэшей эмбеддингов: функция хеширования меняется в одном месте (utils.text_processing)
+    _key = staticmethod(cache_key)
     
     def __init__(self, model_name: str = 'intfloat/multilingual-e5-large', 
                  cache_size: int = 1000, 
@@ -34,9 +99,10 @@ class EmbeddingService:
             cache_size: Максимальный размер LRU-кэша для эмбеддингов абзацев.
             device_str: Устройство для вычислений ('cuda', 'cpu' или None для автоопределения).
         """
+        import torch # type: ignore
         self.model_name: str = model_name
         self.cache_size: int = cache_size
-        self.model: Optional[SentenceTransformer] = None
+        self.model: Optional["SentenceTransformer"] = None
         
         # Определяем устройство
         self.device: str = device_str or ('cuda' if torch.cuda.is_available() else 'cpu')
@@ -46,7 +112,7 @@ class EmbeddingService:
         # Кэш для эмбеддингов тем (простой словарь, т.к. тем обычно немного)
         self.topic_cache: Dict[str, Any] = {}
         # LRU-кэш для эмбеддингов абзацев
-        self.paragraph_cache = self._create_lru_cache(cache_size)
+        self.paragraph_cache = LRUCache(cache_size)
         
         # Загружаем модель при инициализации сервиса
         # Если модель не загрузится, сервис будет неработоспособен
@@ -59,49 +125,39 @@ class EmbeddingService:
     def is_ready(self) -> bool:
         """Проверяет, готова ли модель к работе."""
         return self.model is not None
-
-    def _create_lru_cache(self, capacity: int) -> "LRUCache": # Используем кавычки для LRUCache, т.к. он определен ниже
-        """Создает LRU-кэш с заданной емкостью."""
-        class LRUCache:
-            def __init__(self, capacity: int):
-                self.cache: OrderedDict[str, Any] = OrderedDict()
-                self.capacity: int = capacity
-                
-            def get(self, key: str) -> Optional[Any]:
-                if key not in self.cache:
-                    return None
-                self.cache.move_to_end(key) # Перемещаем элемент в конец как недавно использованный
-                return self.cache[key]
-                
-            def put(self, key: str, value: Any) -> None:
-                if key in self.cache:
-                    self.cache.move_to_end(key)
-                self.cache[key] = value
-                if len(self.cache) > self.capacity:
-                    self.cache.popitem(last=False) # Удаляем самый давно не использованный элемент
-                    
-            def clear(self) -> None:
-                self.cache.clear()
-                
-            def __len__(self) -> int:
-                return len(self.cache)
-                
-            def __contains__(self, key: str) -> bool:
-                return key in self.cache
-                
-        return LRUCache(capacity)
         
     def _initialize_model(self) -> None:
         """Инициализирует модель SentenceTransformer."""
+        from sentence_transformers import SentenceTransformer # type: ignore
         logger.info(f"EmbeddingService: Загрузка модели '{self.model_name}' на устройство '{self.device}'...")
         if self.device == 'cuda':
             self._optimize_cuda_settings()
             
         self.model = SentenceTransformer(self.model_name, device=self.device)
+        if self.device == 'cuda':
+            self._to_half_precision()
         logger.info(f"EmbeddingService: Модель '{self.model_name}' успешно загружена на '{self.device}'.")
             
+    def _to_half_precision(self) -> None:
+        """
+        Переводит веса модели в BF16 (или FP16 без поддержки BF16) для инференса на GPU:
+        вдвое меньше байт на веса, активации и эмбеддинги в кэше абзацев.
+        Косинусное сходство при этом считается в float32 (см. analyze_signal_strength_*).
+        """
+        import torch # type: ignore
+        if torch.cuda.is_bf16_supported():
+            self.model = self.model.to(torch.bfloat16) # type: ignore
+        else:
+            self.model = self.model.half() # type: ignore
+        logger.info("EmbeddingService: Модель переведена в %s.", next(self.model.parameters()).dtype) # type: ignore
+
     def _optimize_cuda_settings(self) -> None:
         """Оптимизирует настройки CUDA для лучшей производительности."""
+        # Настройка аллокатора читается при первом обращении к CUDA, поэтому задается до get_device_name
+        # и загрузки модели: expandable_segments снижает фрагментацию от множества мелких тензоров
+        # encode и эмбеддингов в кэше абзацев. Явно заданное в окружении значение не перетирается.
+        os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:128")
+        import torch # type: ignore
         if torch.cuda.is_available(): # Дополнительная проверка на всякий случай
             logger.info("EmbeddingService: Оптимизация настроек CUDA...")
             torch.backends.cudnn.benchmark = True # type: ignore
@@ -111,6 +167,11 @@ class EmbeddingService:
                 torch.backends.cudnn.allow_tf32 = True # type: ignore
             if hasattr(torch.backends, 'cuda') and hasattr(torch.backends.cuda, 'matmul'): # type: ignore
                 torch.backends.cuda.matmul.allow_tf32 = True # type: ignore
+            # Современный переключатель для torch.matmul / nn.Linear: GEMM энкодера идут на тензорные ядра TF32 (Ampere+)
+            try:
+                torch.set_float32_matmul_precision('high')
+            except AttributeError: # torch < 1.12
+                pass
             try:
                 device_name = torch.cuda.get_device_name(0)
                 # memory_allocated = torch.cuda.memory_allocated(0) / (1024 ** 2)  # MB
@@ -120,6 +181,7 @@ class EmbeddingService:
             except Exception as e:
                 logger.warning(f"EmbeddingService: Не удалось получить информацию о GPU для CUDA: {e}")
                     
+    @inference_mode
     def get_topic_embedding(self, topic_text: str) -> Any: # Возвращаемый тип torch.Tensor, но Any для простоты с учетом Optional model
         """
         Возвращает эмбеддинг для заданной темы, используя кэширование.
@@ -128,12 +190,12 @@ class EmbeddingService:
              logger.error("EmbeddingService: Модель не загружена. Расчет эмбеддинга темы невозможен.")
              raise RuntimeError("EmbeddingService: Модель не инициализирована или не готова.")
              
-        topic_hash = hashlib.md5(topic_text.encode()).hexdigest()
+        topic_hash = self._key(topic_text)
         if topic_hash in self.topic_cache:
-            logger.debug(f"EmbeddingService: Эмбеддинг темы '{topic_text[:50]}...' найден в кэше тем.")
+            logger.debug("EmbeddingService: Эмбеддинг темы '%s...' найден в кэше тем.", topic_text[:50])
             return self.topic_cache[topic_hash]
             
-        logger.debug(f"EmbeddingService: Вычисление эмбеддинга для темы: '{topic_text[:50]}...' (будет кэширован). Имя модели: {self.model_name}")
+        logger.debug("EmbeddingService: Вычисление эмбеддинга для темы: '%s...' (будет кэширован). Имя модели: %s", topic_text[:50], self.model_name)
         topic_input = [topic_text]  # Убрали префикс query: для русской модели
         embedding = self.model.encode(topic_input, convert_to_tensor=True)
         self.topic_cache[topic_hash] = embedding
@@ -147,6 +209,7 @@ class EmbeddingService:
                  pass 
         return embedding
         
+    @inference_mode
     def get_paragraph_embedding(self, text: str) -> Any:
         """
         Возвращает эмбеддинг абзаца, используя LRU-кэширование.
@@ -155,17 +218,17 @@ class EmbeddingService:
              logger.error("EmbeddingService: Модель не загружена. Расчет эмбеддинга абзаца невозможен.")
              raise RuntimeError("EmbeddingService: Модель не инициализирована или не готова.")
              
-        text_hash = hashlib.md5(text.encode()).hexdigest()
+        text_hash = self._key(text)
         cached_embedding = self.paragraph_cache.get(text_hash)
         if cached_embedding is not None:
-            logger.debug(f"EmbeddingService: Эмбеддинг для абзаца (hash: {text_hash}) найден в кэше абзацев.")
+            logger.debug("EmbeddingService: Эмбеддинг для абзаца (hash: %s) найден в кэше абзацев.", text_hash)
             return cached_embedding
             
-        logger.debug(f"EmbeddingService: Вычисление эмбеддинга для абзаца (hash: {text_hash}, text: '{text[:50]}...'). Имя модели: {self.model_name}")
+        logger.debug("EmbeddingService: Вычисление эмбеддинга для абзаца (hash: %s, text: '%s...'). Имя модели: %s", text_hash, text[:50], self.model_name)
         passage_input = [text]  # Убрали префикс passage: для русской модели
         embedding = self.model.encode(passage_input, convert_to_tensor=True)
         self.paragraph_cache.put(text_hash, embedding)
-        logger.debug(f"EmbeddingService: Эмбеддинг для абзаца (hash: {text_hash}) сохранен в кэш (размер кэша: {len(self.paragraph_cache)}/{self.cache_size}).")
+        logger.debug("EmbeddingService: Эмбеддинг для абзаца (hash: %s) сохранен в кэш (размер кэша: %s/%s).", text_hash, len(self.paragraph_cache), self.cache_size)
         return embedding
         
     def clear_cache(self, clear_topics: bool = True, clear_paragraphs: bool = True) -> None:
@@ -186,21 +249,23 @@ class EmbeddingService:
         """
         invalidated_count = 0
         for text in texts:
-            text_hash = hashlib.md5(text.encode()).hexdigest()
+            text_hash = self._key(text)
             if text_hash in self.paragraph_cache:
                 # Удаляем из кэша
-                self.paragraph_cache.cache.pop(text_hash, None)
+                self.paragraph_cache.pop(text_hash)
                 invalidated_count += 1
-                logger.debug(f"EmbeddingService: Кэш для текста (hash: {text_hash}) инвалидирован.")
+                logger.debug("EmbeddingService: Кэш для текста (hash: %s) инвалидирован.", text_hash)
         
         if invalidated_count > 0:
             logger.info(f"EmbeddingService: Инвалидировано {invalidated_count} записей кэша абзацев.")
         
+    @inference_mode
     def analyze_signal_strength_batch(self, df: pd.DataFrame, topic_prompt: str, 
                                     batch_size: Optional[int] = None) -> pd.DataFrame:
         """
         Рассчитывает значения signal_strength для всех абзацев в DataFrame.
         """
+        from sentence_transformers import util # type: ignore
         if not self.is_ready():
              logger.error("EmbeddingService: Модель не готова. Расчет сигнальности (batch) невозможен.")
              df['signal_strength'] = pd.NA
@@ -225,7 +290,7 @@ class EmbeddingService:
         
         results_signal = [np.nan] * num_paragraphs
         try:
-            topic_embedding = self.get_topic_embedding(topic_prompt)
+            topic_embedding = self.get_topic_embedding(topic_prompt).float() # Сходство в float32 даже для half-модели
             
             # Установка размера батча по умолчанию, если не задан
             if batch_size is None:
@@ -236,107 +301,49 @@ class EmbeddingService:
             start_time_total = time.time()
             logger.info(f"EmbeddingService: Расчет сигнальности для {num_paragraphs} абзацев (батч: {actual_batch_size}, кэш абзацев: {len(self.paragraph_cache)}/{self.cache_size})...")
             
+            # Хеш каждого абзаца считается один раз: он нужен и для поиска в кэше, и для записи в него
+            text_hashes = [self._key(text) for text in paragraph_texts]
             cache_hits = 0
             calculated_count = 0
 
             for i in range(0, num_paragraphs, actual_batch_size):
                 batch_texts = paragraph_texts[i:i+actual_batch_size]
-                batch_indices_in_df = list(range(i, min(i + actual_batch_size, num_paragraphs)))
-                
-                embeddings_to_process = []
-                original_indices_for_model = [] # Индексы в batch_texts для тех, что идут в модель
-                final_embeddings_for_batch = [None] * len(batch_texts) # Собираем эмбеддинги для текущего батча
-
-                for j, text in enumerate(batch_texts):
-                    text_hash = hashlib.md5(text.encode()).hexdigest()
-                    cached_embedding = self.paragraph_cache.get(text_hash)
-                    if cached_embedding is not None:
-                        final_embeddings_for_batch[j] = cached_embedding
-                        cache_hits += 1
-                    else:
-                        embeddings_to_process.append(text)
-                        original_indices_for_model.append(j)
-                
-                if embeddings_to_process:
-                    calculated_count += len(embeddings_to_process)
-                    logger.debug(f"EmbeddingService: Батч {i//actual_batch_size + 1}, вычисление {len(embeddings_to_process)} эмбеддингов...")
-                    passage_embeddings_calculated = self.model.encode(embeddings_to_process, convert_to_tensor=True, show_progress_bar=False) # type: ignore
-                    
-                    for k, original_idx in enumerate(original_indices_for_model):
-                        text_to_cache = batch_texts[original_idx]
-                        text_hash_to_cache = hashlib.md5(text_to_cache.encode()).hexdigest()
-                        current_embedding = passage_embeddings_calculated[k].unsqueeze(0) if passage_embeddings_calculated[k].ndim == 1 else passage_embeddings_calculated[k]
-                        self.paragraph_cache.put(text_hash_to_cache, current_embedding)
-                        final_embeddings_for_batch[original_idx] = current_embedding
-                        logger.debug(f"EmbeddingService: Эмбеддинг для абзаца (hash: {text_hash_to_cache}) сохранен в кэш.")
-                
-                # Убедимся, что все эмбеддинги для батча собраны
-                # (должны быть, если нет ошибок, иначе будет None и util.cos_sim упадет)
-                # Собираем тензор из списка эмбеддингов
-                # Пропускаем None значения, если вдруг такое произошло (хотя не должно)
-                valid_embeddings_for_batch = [emb for emb in final_embeddings_for_batch if emb is not None]
-                if not valid_embeddings_for_batch:
-                    logger.warning(f"EmbeddingService: Для батча {i//actual_batch_size + 1} не найдено валидных эмбеддингов.")
-                    continue
-                
-                # Объединяем эмбеддинги в один тензор
-                # Все эмбеддинги должны быть (1, dim), после encode они (N, dim), при извлечении из кэша (1,dim)
-                # поэтому .cat требует, чтобы они были совместимы.
-                # Если encode вернул (N,dim), а из кэша (1,dim), надо привести к (N,dim) или обрабатывать по одному.
-                # Проще всего, если get_paragraph_embedding и encode возвращают (1, dim) или (dim), а потом stack.
-                # Сейчас get_paragraph_embedding возвращает (1,dim), encode(passage_input) тоже (1,dim)
-                # encode(embeddings_to_process) возвращает (M, dim) где M <= N (батч)
-                # Этот код был упрощен в signal_strength.py, здесь он сложнее из-за смешивания кэша и новых
-                # Давайте упростим: если что-то из кэша, считаем отдельно, если новое - батчем.
-                
-                # Переделанная логика для батча:
-                current_batch_scores = [np.nan] * len(batch_texts)
                 texts_for_new_embeddings_in_batch = []
-                indices_for_new_embeddings_in_batch_original = [] # Индексы относительно batch_texts
+                indices_for_new_embeddings = [] # Индексы относительно paragraph_texts
 
                 for j, text in enumerate(batch_texts):
-                    text_hash = hashlib.md5(text.encode()).hexdigest()
-                    cached_embedding = self.paragraph_cache.get(text_hash)
+                    cached_embedding = self.paragraph_cache.get(text_hashes[i + j])
                     if cached_embedding is not None:
-                        score = util.cos_sim(topic_embedding, cached_embedding)[0][0].item()
-                        current_batch_scores[j] = round(score, 3)
-                        cache_hits +=1 # Считаем тут, т.к. выше был другой счетчик
+                        score = util.cos_sim(topic_embedding, cached_embedding.float())[0][0].item()
+                        results_signal[i + j] = round(score, 3)
+                        cache_hits += 1
                     else:
                         texts_for_new_embeddings_in_batch.append(text)
-                        indices_for_new_embeddings_in_batch_original.append(j)
+                        indices_for_new_embeddings.append(i + j)
                 
                 if texts_for_new_embeddings_in_batch:
-                    calculated_count += len(texts_for_new_embeddings_in_batch) # Считаем тут
+                    calculated_count += len(texts_for_new_embeddings_in_batch)
+                    logger.debug("EmbeddingService: Батч %s, вычисление %s эмбеддингов...", i//actual_batch_size + 1, len(texts_for_new_embeddings_in_batch))
                     passage_inputs = texts_for_new_embeddings_in_batch  # Убрали префикс passage:
                     new_passage_embeddings = self.model.encode(passage_inputs, convert_to_tensor=True, show_progress_bar=False) # type: ignore
                     
                     if new_passage_embeddings.ndim == 1: # Если всего один новый текст
                         new_passage_embeddings = new_passage_embeddings.unsqueeze(0)
 
-                    new_scores = util.cos_sim(topic_embedding, new_passage_embeddings)[0].cpu().tolist()
+                    new_scores = util.cos_sim(topic_embedding, new_passage_embeddings.float())[0].cpu().tolist()
 
-                    for k, original_idx in enumerate(indices_for_new_embeddings_in_batch_original):
-                        current_batch_scores[original_idx] = round(new_scores[k], 3)
-                        # Кэшируем только что вычисленный эмбеддинг
-                        text_to_cache = texts_for_new_embeddings_in_batch[k]
-                        text_hash_to_cache = hashlib.md5(text_to_cache.encode()).hexdigest()
-                        embedding_to_cache = new_passage_embeddings[k].unsqueeze(0)
-                        self.paragraph_cache.put(text_hash_to_cache, embedding_to_cache)
-                        logger.debug(f"EmbeddingService: Эмбеддинг для абзаца (hash: {text_hash_to_cache}) сохранен в кэш.")
-                
-                # Записываем результаты батча в основной список
-                for j, score_val in enumerate(current_batch_scores):
-                    results_signal[batch_indices_in_df[j]] = score_val
+                    for k, paragraph_idx in enumerate(indices_for_new_embeddings):
+                        results_signal[paragraph_idx] = round(new_scores[k], 3)
+                        # Кэшируем только что вычисленный эмбеддинг под уже посчитанным хешем
+                        self.paragraph_cache.put(text_hashes[paragraph_idx], new_passage_embeddings[k].unsqueeze(0))
+                        logger.debug("EmbeddingService: Эмбеддинг для абзаца (hash: %s) сохранен в кэш.", text_hashes[paragraph_idx])
 
             df['signal_strength'] = results_signal
             elapsed_time_total = time.time() - start_time_total
-            # Пересчитываем cache_hits и calculated_count, т.к. логика изменилась
-            final_cache_hits = sum(1 for x in results_signal if not np.isnan(x) and df['text'][results_signal.index(x)] in [key_text for key_text_hash in self.paragraph_cache.cache.keys() for key_text in df['text'] if hashlib.md5(key_text.encode()).hexdigest() == key_text_hash] ) # Примерная оценка, неточная
-            # Точнее: final_cache_hits = num_paragraphs - calculated_count (если все успешно)
-            # Но calculated_count считается только для новых.
-            # Правильный cache_hits уже посчитан в цикле.
-            
-            logger.info(f"EmbeddingService: Расчет сигнальности (batch) завершен за {elapsed_time_total:.2f} сек. (Кэш-хиты абзацев: {cache_hits - len(batch_texts) + sum(1 for score in current_batch_scores if not np.isnan(score)) if i == (num_paragraphs // actual_batch_size)*actual_batch_size else cache_hits }/{num_paragraphs}, Вычислено новых: {calculated_count})") # Логика cache_hits тут сложная
+            logger.info(
+                "EmbeddingService: Расчет сигнальности (batch) завершен за %.2f сек. (Кэш-хиты абзацев: %s/%s, Вычислено новых: %s)",
+                elapsed_time_total, cache_hits, num_paragraphs, calculated_count
+            )
             return df
             
         except Exception as e:
@@ -344,11 +351,13 @@ class EmbeddingService:
             df['signal_strength'] = pd.NA # Заполняем всю колонку NA
             return df
             
+    @inference_mode
     def analyze_signal_strength_incremental(self, df: pd.DataFrame, topic_prompt: str, 
                                           changed_indices: List[int]) -> pd.DataFrame:
         """
         Инкрементальный расчет signal_strength только для измененных абзацев.
         """
+        from sentence_transformers import util # type: ignore
         if not self.is_ready():
              logger.error("EmbeddingService: Модель не готова. Инкрементальный расчет невозможен.")
              return df 
@@ -369,7 +378,7 @@ class EmbeddingService:
             df['signal_strength'] = pd.NA
             
         try:
-            topic_embedding = self.get_topic_embedding(topic_prompt)
+            topic_embedding = self.get_topic_embedding(topic_prompt).float() # Сходство в float32 даже для half-модели
             start_time = time.time()
             updated_count = 0
             
@@ -379,7 +388,7 @@ class EmbeddingService:
                     continue
                 text = df.loc[idx, 'text']
                 passage_embedding = self.get_paragraph_embedding(text) 
-                score = util.cos_sim(topic_embedding, passage_embedding)[0][0].item()
+                score = util.cos_sim(topic_embedding, passage_embedding.float())[0][0].item()
                 df.loc[idx, 'signal_strength'] = round(score, 3)
                 updated_count += 1
             
@@ -434,4 +443,8 @@ def get_embedding_service() -> EmbeddingService:
             cache_size=settings.EMBEDDING_CACHE_SIZE
             # device_str будет определен автоматически в конструкторе EmbeddingService
         )
-    return _embedding_service_instance 
\ No newline at end of file
+    return _embedding_service_instance
+
+def is_embedding_service_loaded() -> bool:
+    """Загружен ли синглтон EmbeddingService в этом процессе (например, в мастере gunicorn до fork)."""
+    return _embedding_service_instance is not None and _embedding_service_instance.is_ready()
@@ -15,11 +15,19 @@ if TYPE_CHECKING:
 # Получаем логгер для этого модуля
 logger = logging.getLogger(__name__)
 
+
+class ConfigurationError(RuntimeError):
+    """Окружение не позволяет запустить сервис (например, нет прав на директорию экспорта)."""
+
+
 class ExportService:
     """
     Сервис для экспорта результатов анализа в различные форматы.
     Включает автоматическую очистку старых файлов экспорта.
     """
+
+    # Директории экспорта, уже созданные в этом процессе: повторные экземпляры не трогают ФС
+    _ensured_dirs: set[str] = set()
     
     def __init__(self, session_store: "SessionStore", export_dir: str = "exports", ttl_seconds: int = 3600):
         """
@@ -34,13 +42,18 @@ class ExportService:
         self.export_dir: str = export_dir
         self.ttl_seconds: int = ttl_seconds
         
-        # Создаем директорию для экспорта, если она не существует
-        try:
-            os.makedirs(self.export_dir, exist_ok=True)
-            logger.info(f"ExportService: Директория для экспорта '{os.path.abspath(self.export_dir)}' готова.")
-        except Exception as e:
-            logger.error(f"ExportService: Не удалось создать директорию для экспорта '{os.path.abspath(self.export_dir)}': {e}")
-            # Можно пробросить исключение или работать без экспорта, если директория критична
+        # Создаем директорию для экспорта, если она не существует (один раз на процесс)
+        if self.export_dir not in ExportService._ensured_dirs:
+            export_dir_abs = os.path.abspath(self.export_dir)
+            try:
+                os.makedirs(self.export_dir, exist_ok=True)
+                ExportService._ensured_dirs.add(self.export_dir)
+                logger.info("ExportService: Директория для экспорта '%s' готова.", export_dir_abs)
+            except PermissionError as e:
+                # Без прав на запись экспорт не заработает: падаем при старте, а не на первом запросе
+                raise ConfigurationError(f"Нет прав на создание директории для экспорта '{export_dir_abs}': {e}") from e
+            except Exception as e:
+                logger.error("ExportService: Не удалось создать директорию для экспорта '%s': %s", export_dir_abs, e)
 
         # Запускаем фоновую задачу очистки старых файлов, если это основной поток и есть event loop
         # Это более безопасно делать при старте FastAPI приложения.
@@ -72,7 +85,7 @@ class ExportService:
             Абсолютный путь к созданному файлу экспорта или None, если сессия не найдена или произошла ошибка.
         """
         logger.debug(f"ExportService: Запрос на экспорт для сессии {session_id} в формат {file_format}.")
-        analysis_data = self.session_store.get_analysis(session_id)
+        analysis_data = await self.session_store.get_analysis(session_id)
         
         if not analysis_data:
             logger.warning(f"ExportService: Анализ для сессии {session_id} не найден. Экспорт невозможен.")
@@ -105,21 +118,25 @@ class ExportService:
                     "paragraph_count": len(df)
                 }
                 # Преобразуем DataFrame в список словарей, как в API Orchestrator
+                # itertuples отдает обычные кортежи без построения Series на каждую строку
+                columns = df.columns.tolist()
+                metric_columns = [(position, col) for position, col in enumerate(columns) if col not in ('paragraph_id', 'text')]
+                id_position = columns.index('paragraph_id') if 'paragraph_id' in columns else None
+                text_position = columns.index('text') if 'text' in columns else None
                 paragraphs_list = []
-                for _, row in df.iterrows():
+                for row in df.itertuples(index=False, name=None):
                     metrics_dict = {}
-                    for col in row.index:
-                        if col not in ['paragraph_id', 'text']:
-                            value = row[col]
-                            if pd.isna(value):
-                                metrics_dict[col] = None
-                            elif hasattr(value, 'item'): # numpy bool_, int_, float_ etc.
-                                metrics_dict[col] = value.item()
-                            else:
-                                metrics_dict[col] = value
+                    for position, col in metric_columns:
+                        value = row[position]
+                        if pd.isna(value):
+                            metrics_dict[col] = None
+                        elif hasattr(value, 'item'): # numpy bool_, int_, float_ etc.
+                            metrics_dict[col] = value.item()
+                        else:
+                            metrics_dict[col] = value
                     paragraphs_list.append({
-                        'id': row.get('paragraph_id'),
-                        'text': row.get('text'),
+                        'id': row[id_position] if id_position is not None else None,
+                        'text': row[text_position] if text_position is not None else None,
                         'metrics': metrics_dict
                     })
                 
@@ -1,4 +1,5 @@
 import redis # type: ignore
+import redis.asyncio as aioredis # type: ignore
 import json
 import pandas as pd # type: ignore
 import datetime
@@ -8,47 +9,89 @@ import logging
 # Получаем логгер для этого модуля
 logger = logging.getLogger(__name__)
 
+# Параметры пула соединений Redis
+REDIS_SOCKET_TIMEOUT = 2 # Секунд на операцию с сокетом
+REDIS_HEALTH_CHECK_INTERVAL = 30 # Секунд простоя, после которых соединение проверяется перед использованием
+
 class SessionStore:
     """
     Сервис для хранения состояния анализа между запросами.
     Использует Redis для распределенного кэширования или локальный словарь в качестве fallback.
+    Клиент Redis асинхронный (redis.asyncio), поэтому обращения к хранилищу не блокируют event loop;
+    подключение проверяется в connect(), который вызывается при старте приложения.
     """
     
-    def __init__(self, redis_url: str, ttl_seconds: int = 3600):
+    def __init__(self, redis_url: str, ttl_seconds: int = 3600, max_connections: int = 10):
         """
         Инициализирует хранилище сессий.
         
         Args:
             redis_url: URL для подключения к Redis (например, redis://localhost:6379/0)
             ttl_seconds: Время жизни сессии в Redis в секундах (по умолчанию 1 час)
+            max_connections: Размер пула соединений Redis на процесс
+                (max_connections × число воркеров не должно превышать maxclients Redis)
         """
         self.ttl_seconds = ttl_seconds
-        self.redis_client: Optional[redis.Redis] = None
+        self.redis_url = redis_url
+        self.max_connections = max_connections
+        self.redis_client: Optional[aioredis.Redis] = None
         self.local_sessions: Dict[str, Dict[str, Any]] = {} # Для локального fallback
 
+    async def connect(self) -> None:
+        """Создает асинхронный клиент Redis и проверяет подключение; при ошибке остается локальное хранилище."""
+        redis_url = self.redis_url
         if redis_url:
             try:
-                self.redis_client = redis.from_url(redis_url)
+                # Ограниченный пул с keepalive: соединения переиспользуются между запросами,
+                # а число клиентов Redis от процесса не превышает max_connections
+                pool = aioredis.ConnectionPool.from_url(
+                    redis_url,
+                    max_connections=self.max_connections,
+                    socket_keepalive=True,
+                    socket_timeout=REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
+                )
+                self.redis_client = aioredis.Redis.from_pool(pool) # Клиент владеет пулом и закрывает его в aclose()
                 # Проверка подключения
-                self.redis_client.ping()
+                await self.redis_client.ping()
                 logger.info(f"Подключение к Redis ({redis_url}) успешно установлено.")
             except redis.exceptions.ConnectionError as e:
                 logger.error(f"Ошибка подключения к Redis ({redis_url}): {e}. ")
                 logger.warning("SessionStore переключается на локальное хранилище в памяти (НЕ для продакшена).")
-                self.redis_client = None # Убедимся, что клиент None
-            except Exception as e: # Ловим другие возможные ошибки от redis.from_url или ping
+                await self._drop_client()
+            except Exception as e: # Ловим другие возможные ошибки от from_url или ping
                 logger.error(f"Непредвиденная ошибка при инициализации Redis ({redis_url}): {e}. ")
                 logger.warning("SessionStore переключается на локальное хранилище в памяти (НЕ для продакшена).")
-                self.redis_client = None
+                await self._drop_client()
         else:
             logger.warning("URL для Redis не предоставлен. SessionStore будет использовать локальное хранилище в памяти (НЕ для продакшена).")
             self.redis_client = None
 
+    async def _drop_client(self) -> None:
+        """Закрывает пул несостоявшегося подключения и переключает хранилище на локальный fallback."""
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.aclose()
+            except Exception:
+                pass
+        self.redis_client = None # Убедимся, что клиент None
+
+    async def close(self) -> None:
+        """Закрывает пул соединений Redis."""
+        if self.redis_client is not None:
+            await self.redis_client.aclose()
+
+    async def ping(self) -> bool:
+        """Проверяет доступность Redis (False при локальном хранилище)."""
+        if self.redis_client is None:
+            return False
+        return bool(await self.redis_client.ping())
+
     def _generate_key(self, session_id: str) -> str:
         """Генерирует ключ для Redis."""
         return f"analysis_session:{session_id}"
 
-    def save_analysis(self, session_id: str, df: pd.DataFrame, topic: str) -> None:
+    async def save_analysis(self, session_id: str, df: pd.DataFrame, topic: str) -> None:
         """
         Сохраняет результаты анализа (DataFrame и тему).
         
@@ -68,8 +111,8 @@ class SessionStore:
         if self.redis_client:
             try:
                 key = self._generate_key(session_id)
-                self.redis_client.set(key, serialized_data, ex=self.ttl_seconds)
-                logger.debug(f"Сессия {session_id} сохранена в Redis (ключ: {key}).")
+                await self.redis_client.set(key, serialized_data, ex=self.ttl_seconds)
+                logger.debug("Сессия %s сохранена в Redis (ключ: %s).", session_id, key)
             except redis.exceptions.RedisError as e:
                 logger.error(f"Ошибка сохранения сессии {session_id} в Redis: {e}. Попытка сохранения в локальный кэш.")
                 # Fallback на локальное сохранение при ошибке Redis
@@ -83,11 +126,11 @@ class SessionStore:
     def _save_local(self, session_id: str, session_data: Dict[str, Any]) -> None:
         """Внутренний метод для сохранения в локальный кэш."""
         self.local_sessions[session_id] = session_data
-        logger.debug(f"Сессия {session_id} сохранена в локальном хранилище.")
+        logger.debug("Сессия %s сохранена в локальном хранилище.", session_id)
         # Периодическая очистка не нужна здесь, т.к. это просто словарь в памяти
         # Если нужна очистка локального кэша, ее нужно вызывать извне или по таймеру в основном приложении
 
-    def get_analysis(self, session_id: str) -> Optional[Dict[str, Any]]:
+    async def get_analysis(self, session_id: str) -> Optional[Dict[str, Any]]:
         """
         Получает сохраненные результаты анализа.
         
@@ -101,12 +144,12 @@ class SessionStore:
         if self.redis_client:
             try:
                 key = self._generate_key(session_id)
-                serialized_data = self.redis_client.get(key)
+                serialized_data = await self.redis_client.get(key)
                 source = "Redis"
                 if serialized_data:
-                    logger.debug(f"Сессия {session_id} получена из Redis (ключ: {key}).")
+                    logger.debug("Сессия %s получена из Redis (ключ: %s).", session_id, key)
                 else:
-                    logger.debug(f"Сессия {session_id} не найдена в Redis (ключ: {key}).")
+                    logger.debug("Сессия %s не найдена в Redis (ключ: %s).", session_id, key)
                     return None # Сессия не найдена
             except redis.exceptions.RedisError as e:
                 logger.error(f"Ошибка получения сессии {session_id} из Redis: {e}. Попытка получения из локального кэша.")
@@ -115,18 +158,18 @@ class SessionStore:
                  logger.error(f"Непредвиденная ошибка при получении сессии {session_id} из Redis: {e}. Попытка получения из локального кэша.")
                  serialized_data = None
         
-        if not serialized_data and not (self.redis_client and self.redis_client.exists(self._generate_key(session_id))):
+        if not serialized_data and not (self.redis_client and await self.redis_client.exists(self._generate_key(session_id))):
              # Если Redis не использовался или там точно нет ключа, обращаемся к локальному хранилищу
             if session_id in self.local_sessions:
                 session_data_dict = self.local_sessions[session_id]
                 source = "local_sessions"
-                logger.debug(f"Сессия {session_id} получена из локального хранилища.")
+                logger.debug("Сессия %s получена из локального хранилища.", session_id)
             else:
-                logger.debug(f"Сессия {session_id} не найдена ни в Redis, ни в локальном хранилище.")
+                logger.debug("Сессия %s не найдена ни в Redis, ни в локальном хранилище.", session_id)
                 return None
         elif not serialized_data:
             # Этот случай маловероятен, если Redis был доступен, но вернул None
-            logger.debug(f"Сессия {session_id} не найдена (serialized_data is None после попытки Redis)." )
+            logger.debug("Сессия %s не найдена (serialized_data is None после попытки Redis).", session_id)
             return None
         else:
              # Десериализуем данные из Redis, если они были получены
@@ -150,7 +193,7 @@ class SessionStore:
             logger.error(f"Ошибка при восстановлении DataFrame из сессии {session_id} ({source}): {e}")
             return None
 
-    def delete_analysis(self, session_id: str) -> bool:
+    async def delete_analysis(self, session_id: str) -> bool:
         """
         Удаляет сохраненные результаты анализа.
         Returns: True, если удаление было произведено (даже если ключ не существовал в Redis, del вернет 0, но это успех)
@@ -160,9 +203,9 @@ class SessionStore:
             try:
                 key = self._generate_key(session_id)
                 # .delete() возвращает количество удаленных ключей (0 или 1)
-                self.redis_client.delete(key)
+                await self.redis_client.delete(key)
                 deleted_from_redis = True # Считаем успешным, если команда выполнена
-                logger.debug(f"Попытка удаления сессии {session_id} из Redis (ключ: {key}).")
+                logger.debug("Попытка удаления сессии %s из Redis (ключ: %s).", session_id, key)
             except redis.exceptions.RedisError as e:
                 logger.error(f"Ошибка удаления сессии {session_id} из Redis: {e}. Попытка удаления из локального кэша.")
             except Exception as e:
@@ -172,7 +215,7 @@ class SessionStore:
         if session_id in self.local_sessions:
             del self.local_sessions[session_id]
             deleted_from_local = True
-            logger.debug(f"Сессия {session_id} удалена из локального хранилища.")
+            logger.debug("Сессия %s удалена из локального хранилища.", session_id)
         
         # Возвращаем True, если удалено хотя бы из одного места или не было ошибок Redis
         return deleted_from_redis or deleted_from_local
@@ -48,8 +48,8 @@ async def test_single_chunk_with_fallback():
         
         # Имитируем несколько ошибок для активации fallback
         print("\n🔄 Имитация ошибок Realtime API...")
-        for i in range(3):
-            analyzer.failure_tracker.record_failure()
+        for i in range(analyzer.circuit_breaker.failure_threshold):
+            analyzer.circuit_breaker.record_failure()
         
         # Второй запрос - должен использовать REST API (fallback)
         start = time.time()
@@ -94,7 +94,7 @@ def main():
     print("\nРекомендации:")
     print("- Для документов >10 чанков автоматически включаются паузы")
     print("- Для документов >50 чанков рекомендуется отключать real-time анализ")
-    print("- При частых ошибках 429 увеличьте задержки в config/rate_limit_config.py")
+    print("- При частых ошибках 429 уменьшите OPENAI_RPM / OPENAI_TPM в config.py (или в .env) до лимитов аккаунта")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BoundedLRUCache(Generic[K, V]):
+    """
+    Ограниченный по числу записей LRU-кэш в памяти процесса со счетчиками попаданий и промахов.
+    Используется из одного event loop (или под GIL без await между get и put), поэтому без блокировок.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: K) -> Optional[V]:
+        """Возвращает значение и помечает запись как недавно использованную; при промахе - None."""
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        """Сохраняет значение; сверх maxsize вытесняется самая давно использованная запись."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Размер и счетчики для диагностических эндпоинтов."""
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
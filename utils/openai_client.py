@@ -4,9 +4,46 @@ from dotenv import load_dotenv
 
 try:
     import openai
+    import httpx # Зависимость openai: настраиваем пул соединений явно
 except ImportError:
     logging.error("Библиотека openai не установлена. Пожалуйста, установите ее: pip install openai")
     openai = None
+    httpx = None
+
+try:
+    import h2 # type: ignore # noqa: F401
+    HTTP2_AVAILABLE = True # Мультиплексирование запросов в одном соединении (httpx[http2])
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Пул соединений общий для всех запросов одного клиента: keep-alive вместо TCP+TLS на каждый вызов
+HTTP_TIMEOUT = 60.0
+HTTP_MAX_CONNECTIONS = 200
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 100
+
+def _http_client_kwargs() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        "http2": HTTP2_AVAILABLE,
+        "timeout": HTTP_TIMEOUT,
+    }
+
+def create_async_client(api_key: str | None = None, base_url=None):
+    """
+    Создает AsyncOpenAI с тем же пулом соединений, что и синхронный клиент.
+    Асинхронный клиент привязан к event loop, поэтому создается на время жизни цикла,
+    а все параллельные запросы внутри него делят одно (при HTTP/2 - мультиплексированное) соединение.
+    """
+    if openai is None:
+        return None
+    return openai.AsyncOpenAI(
+        api_key=api_key or API_KEY,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(**_http_client_kwargs())
+    )
 
 # --- Загрузка OpenAI API Key и инициализация клиента ---
 load_dotenv()
@@ -15,7 +52,7 @@ client: openai.OpenAI | None = None # Явно типизируем
 
 if API_KEY and openai:
     try:
-        client = openai.OpenAI(api_key=API_KEY)
+        client = openai.OpenAI(api_key=API_KEY, http_client=httpx.Client(**_http_client_kwargs()))
         logging.info("OpenAI клиент успешно инициализирован.")
     except Exception as e:
         logging.error(f"Ошибка инициализации OpenAI клиента: {e}")
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Union
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTokenBucket:
+    """
+    Асинхронный token bucket для проактивного ограничения запросов к OpenAI API.
+    Емкость capacity кредитов пополняется равномерно за period секунд,
+    поэтому вместо фиксированных пауз запросы идут с максимально допустимой скоростью.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period # Кредитов в секунду
+        self._level = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Ждет, пока в корзине накопится amount кредитов, и списывает их."""
+        # Запрос больше емкости иначе ждал бы вечно
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                await asyncio.sleep((amount - self._level) / self.rate)
+
+    def force_add_usage(self, amount: float) -> None:
+        """
+        Корректирует уровень на разницу между фактическим и списанным расходом.
+        Положительное значение уводит корзину в долг (следующие acquire подождут),
+        отрицательное возвращает переплату.
+        """
+        self._refill()
+        self._level = min(self.capacity, self._level - amount)
+
+    def penalize(self) -> None:
+        """
+        Реакция на 429: уводит корзину в долг минимум на секунду пополнения,
+        так как сервер видит меньше свободного лимита, чем локальная оценка.
+        """
+        self._refill()
+        self._level = min(-1.0, self._level - self.rate)
+
+    async def __aenter__(self) -> "AsyncTokenBucket":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+class ProportionalTokenThrottle:
+    """
+    Пропорциональный троттлинг по остатку квоты токенов в скользящем окне.
+    Пока в окне израсходовано не больше threshold квоты, запросы проходят без пауз.
+    Выше порога перед запросом на amount токенов выдерживается пауза
+    amount / (limit - used) * window: она плавно растет по мере расхода квоты,
+    не упираясь в обрыв на 100%. Если квоты не хватает совсем, запрос ждет,
+    пока старейшие записи выйдут из окна.
+    Интерфейс совместим с AsyncTokenBucket (acquire, force_add_usage, penalize).
+    """
+
+    def __init__(self, limit: float, window: float = 60.0, threshold: float = 0.5):
+        self.limit = float(limit)
+        self.window = window
+        self.threshold = threshold # Доля квоты в окне, до которой троттлинг не включается
+        self._entries: deque[tuple[float, float]] = deque() # (время, токены)
+        self._used = 0.0
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._entries and now - self._entries[0][0] >= self.window:
+            self._used -= self._entries.popleft()[1]
+
+    def _record(self, amount: float) -> None:
+        now = time.monotonic()
+        self._prune(now)
+        self._entries.append((now, amount))
+        self._used += amount
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Выше порога загрузки выдерживает паузу, пропорциональную доле оставшейся квоты, и учитывает amount в окне."""
+        # Запрос больше лимита иначе ждал бы вечно
+        amount = min(float(amount), self.limit)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                remaining = self.limit - self._used
+                if remaining > amount or not self._entries:
+                    if self._used <= self.threshold * self.limit:
+                        delay = 0.0 # Окно загружено слабо: пауза только добавила бы задержку
+                    else:
+                        delay = amount / max(remaining, amount) * self.window
+                    break
+                await asyncio.sleep(self._entries[0][0] + self.window - now)
+            self._record(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def force_add_usage(self, amount: float) -> None:
+        """Корректирует учтенный расход на разницу между фактом и оценкой (может быть отрицательной)."""
+        self._record(amount)
+
+    def penalize(self) -> None:
+        """Реакция на 429: учитывает в окне дополнительную секунду квоты, замедляя следующие запросы."""
+        self._record(self.limit / self.window)
+
+    async def __aenter__(self) -> "ProportionalTokenThrottle":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+# Лимитер токенов: корзина с пополнением или пропорциональный троттлинг по окну
+TokenLimiter = Union[AsyncTokenBucket, ProportionalTokenThrottle]
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD-регулятор числа одновременных запросов к OpenAI.
+    После каждого окна из success_window успешных ответов лимит растет в increase раз,
+    на каждый 429 - падает вдвое. Так параллельность сходится к реально доступной
+    для аккаунта скорости без ручной настройки под тир.
+    Используется как асинхронный контекстный менеджер вокруг вызова API.
+    """
+
+    def __init__(
+        self,
+        initial: float = 3.0,
+        minimum: float = 1.0,
+        maximum: float = 20.0,
+        increase: float = 1.125,
+        success_window: int = 5,
+        state_path: str | None = None
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.success_window = success_window
+        self.state_path = Path(state_path) if state_path else None
+        self.current = min(maximum, max(minimum, self._load_state(initial)))
+        self._successes = 0
+        self._inflight = 0
+        self._last_decrease = float("-inf") # time.monotonic() последнего снижения лимита
+        self._condition: asyncio.Condition | None = None # Создается лениво внутри event loop
+
+    @property
+    def limit(self) -> int:
+        """Текущий целочисленный лимит одновременных запросов."""
+        return max(1, int(self.current))
+
+    def on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.success_window:
+            self._successes = 0
+            self.current = min(self.maximum, self.current * self.increase)
+
+    def on_rate_limited(self, started_at: float) -> None:
+        """
+        Реакция на 429 для запроса, отправленного в момент started_at (time.monotonic()).
+        Запросы, ушедшие до последнего снижения, отправлялись при старом лимите и уже учтены им:
+        их 429 игнорируются, поэтому всплеск одновременных 429 снижает лимит один раз, а не до минимума.
+        """
+        if started_at < self._last_decrease:
+            return
+        self._successes = 0
+        self.current = max(self.minimum, self.current / 2)
+        self._last_decrease = time.monotonic()
+
+    async def __aenter__(self) -> "AdaptiveConcurrencyController":
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._inflight < self.limit)
+            self._inflight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        # Слот освобождается до первого await: отмена при ожидании блокировки не должна его потерять
+        self._inflight -= 1
+        async with self._condition:
+            self._condition.notify_all() # Лимит мог вырасти: будим всех ожидающих
+        return False
+
+    def _load_state(self, default: float) -> float:
+        """Последний известный лимит с прошлого запуска, чтобы не разгоняться с нуля."""
+        if self.state_path is None or not self.state_path.exists():
+            return default
+        try:
+            return float(json.loads(self.state_path.read_text(encoding="utf-8"))["current"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Не удалось прочитать состояние лимита параллельности %s: %s", self.state_path, e)
+            return default
+
+    def save_state(self) -> None:
+        """
+        Сохраняет текущий лимит для следующего запуска. Запись атомарная (временный файл
+        и os.replace), чтобы параллельные воркеры не оставили друг другу обрезанный JSON.
+        """
+        if self.state_path is None:
+            return
+        tmp_path = self.state_path.with_name(f"{self.state_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps({"current": self.current}), encoding="utf-8")
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить состояние лимита параллельности %s: %s", self.state_path, e)
+
+
+# Общие на процесс лимитеры OpenAI по лимитам аккаунта: запросы в минуту - корзина с пополнением,
+# токены - пропорционально остатку минутной квоты. Квота одна на ключ, поэтому гибридные
+# эндпоинты и оркестратор списывают из одних и тех же лимитеров
+openai_rpm_limiter = AsyncTokenBucket(settings.OPENAI_RPM, 60)
+openai_tpm_limiter = ProportionalTokenThrottle(settings.OPENAI_TPM, 60)
+
+# Файл состояния регулятора рядом с конфигурацией проекта, независимо от рабочего каталога
+RATE_STATE_PATH = Path(__file__).resolve().parent.parent / "config" / "last_rate_state.json"
+
+# Общий на процесс регулятор параллельности вызовов OpenAI REST
+concurrency_controller = AdaptiveConcurrencyController(state_path=str(RATE_STATE_PATH))
@@ -1,4 +1,15 @@
 import re
+import hashlib
+
+try:
+    import blake3 # type: ignore
+except ImportError:
+    blake3 = None # Fallback на hashlib.blake2b из стандартной библиотеки
+
+try:
+    import xxhash # type: ignore
+except ImportError:
+    xxhash = None # Fallback на hashlib.blake2b из стандартной библиотеки
 
 def split_into_paragraphs(text: str) -> list[str]:
     """Разбивает текст на параграфы по двойному переносу строки."""
@@ -8,4 +19,36 @@ def split_into_paragraphs(text: str) -> list[str]:
     paragraphs = text.replace('\r\n', '\n').split('\n\n')
     # Удаляем пустые строки, которые могли образоваться
     paragraphs = [p.strip() for p in paragraphs if p.strip()]
-    return paragraphs 
\ No newline at end of file
+    return paragraphs
+
+# Последний захешированный текст и его отпечаток.
+# Эндпоинты чанков получают один и тот же объект full_text для всех чанков пакета,
+# поэтому проверка по идентичности объекта позволяет хешировать документ один раз на запрос.
+_last_fingerprint: tuple[str, str] | None = None
+
+def text_fingerprint(text: str) -> str:
+    """
+    Возвращает hex-отпечаток текста для ключей кэша.
+    Использует blake3 (SIMD), если установлен, иначе hashlib.blake2b.
+    """
+    global _last_fingerprint
+    cached = _last_fingerprint
+    if cached is not None and cached[0] is text:
+        return cached[1]
+    data = text.encode('utf-8')
+    if blake3 is not None:
+        digest = blake3.blake3(data).hexdigest(length=16)
+    else:
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    _last_fingerprint = (text, digest)
+    return digest
+
+def cache_key(text: str) -> str:
+    """
+    Быстрый некриптографический hex-ключ короткого текста для in-memory кэшей (эмбеддинги абзацев и тем).
+    Использует xxh3-128 (SIMD, принимает str без промежуточных bytes), если установлен xxhash,
+    иначе hashlib.blake2b.
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(text)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
@@ -0,0 +1,76 @@
+import math
+from typing import Dict, Optional
+
+# Таблицы удаления символов для str.translate: число символов письменности считается
+# как разница длин до и после translate - сканирование идет в C, без цикла по символам
+_CYRILLIC_DELETE = dict.fromkeys(range(0x0400, 0x0500))
+_CJK_DELETE = dict.fromkeys(range(0x4E00, 0xA000))
+CJK_SHARE_THRESHOLD = 0.3
+CYRILLIC_SHARE_THRESHOLD = 0.5
+
+
+def categorize_text(text: str) -> str:
+    """Определяет категорию текста по письменности: 'cjk', 'ru_prose' (кириллица) или 'prose'."""
+    if not text or text.isascii():
+        return "prose"
+    length = len(text)
+    if length - len(text.translate(_CJK_DELETE)) > CJK_SHARE_THRESHOLD * length:
+        return "cjk"
+    if length - len(text.translate(_CYRILLIC_DELETE)) > CYRILLIC_SHARE_THRESHOLD * length:
+        return "ru_prose"
+    return "prose"
+
+
+class TokenEstimator:
+    """
+    Оценка числа токенов запроса без токенизатора: байты UTF-8 делятся на среднее
+    число байт на токен для категории текста. Среднее (и его разброс) калибруется
+    экспоненциальным сглаживанием по фактическому usage.prompt_tokens из ответов OpenAI
+    отдельно для каждой категории (см. categorize_text).
+    """
+
+    # Начальные значения байт на токен по категориям текста
+    INITIAL_BYTES_PER_TOKEN = {
+        "ru_prose": 4.0,
+        "prose": 4.0,
+        "cjk": 2.0,
+    }
+    DEFAULT_CATEGORY = "ru_prose"
+    MIN_BYTES_PER_TOKEN = 1.0 # Нижняя граница делителя, чтобы запас по разбросу не обнулил его
+
+    def __init__(self, beta: float = 0.95, gamma: float = 1.0):
+        self.beta = beta # Вес истории в EMA
+        self.gamma = gamma # Запас в единицах разброса: оценка смещена в сторону завышения
+        self.bytes_per_token: Dict[str, float] = dict(self.INITIAL_BYTES_PER_TOKEN)
+        self.deviation: Dict[str, float] = {category: 0.0 for category in self.bytes_per_token}
+
+    def estimate(
+        self,
+        text: str,
+        category: Optional[str] = None,
+        overhead_tokens: int = 0,
+        max_output_tokens: int = 0
+    ) -> int:
+        """
+        Оценивает токены запроса для текста: входные токены плюс накладные и ответ.
+        Без явной категории она определяется по письменности текста.
+        """
+        if category is None:
+            category = categorize_text(text)
+        mean = self.bytes_per_token.get(category, self.bytes_per_token[self.DEFAULT_CATEGORY])
+        spread = self.deviation.get(category, 0.0)
+        divisor = max(self.MIN_BYTES_PER_TOKEN, mean - self.gamma * spread)
+        return math.ceil(len(text.encode("utf-8")) / divisor) + overhead_tokens + max_output_tokens
+
+    def update(self, category: str, text_len_bytes: int, prompt_tokens: int) -> None:
+        """Калибрует байты на токен по фактическому расходу токенов запроса."""
+        if text_len_bytes <= 0 or prompt_tokens <= 0:
+            return
+        sample = text_len_bytes / prompt_tokens
+        mean = self.bytes_per_token.get(category, self.bytes_per_token[self.DEFAULT_CATEGORY])
+        self.deviation[category] = self.beta * self.deviation.get(category, 0.0) + (1 - self.beta) * abs(sample - mean)
+        self.bytes_per_token[category] = self.beta * mean + (1 - self.beta) * sample
+
+
+# Общий на процесс оценщик: калибровка накапливается между запросами
+token_estimator = TokenEstimator()